@@ -0,0 +1,4 @@
+from oohoom.app import create_app
+from oohoom.local_config import IS_DEBUGGING
+
+app = create_app(is_testing=IS_DEBUGGING, asgi=True)
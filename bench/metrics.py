@@ -0,0 +1,44 @@
+"""
+    overhead of the metrics middleware on a trivial route.
+
+    python -m bench.metrics
+"""
+import timeit
+
+import falcon
+from falcon import testing
+
+from oohoom import metrics
+
+
+class OkResource(object):
+    def on_get(self, req, resp, name):
+        resp.media = {"ok": True}
+
+
+def client(*middleware):
+    app = falcon.App(middleware=list(middleware))
+    app.add_route("/v1/users/{name}", OkResource())
+    return testing.TestClient(app)
+
+
+def main(number=5000):
+    plain = client()
+    measured = client(metrics.measure(metrics.Registry(), slow=None))
+    timings = {}
+    for name, oohoom in (("plain", plain), ("measured", measured)):
+        timings[name] = (
+            min(
+                timeit.repeat(
+                    lambda: oohoom.simulate_get("/v1/users/a_name"), number=number
+                )
+            )
+            / number
+        )
+        print("{:10} {:8.1f} us".format(name, timings[name] * 1e6))
+    overhead = timings["measured"] - timings["plain"]
+    print("overhead   {:8.1f} us".format(overhead * 1e6))
+
+
+if __name__ == "__main__":
+    main()
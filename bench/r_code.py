@@ -0,0 +1,60 @@
+"""
+    verification codes: store + is_valid latency, and concurrent logins
+    racing for one code (exactly one may pass).
+
+    python -m bench.r_code [--redis]
+    without --redis the in-process stand-in backend is measured.
+"""
+import argparse
+import threading
+import time
+
+import redis
+
+from oohoom import r_code
+from oohoom.config import R_CODE_REDIS_DB, REDIS_HOST, REDIS_PORT
+
+
+def latency(codes, number):
+    start = time.perf_counter()
+    for i in range(number):
+        mobile = "0098900000{:04d}".format(i)
+        codes.store(mobile, "12345")
+        assert codes.take(mobile, "12345")
+    return (time.perf_counter() - start) / number
+
+
+def race(codes, threads):
+    codes.store("00989000000000", "54321")
+    barrier = threading.Barrier(threads)
+    passed = []
+
+    def login():
+        barrier.wait()
+        if codes.take("00989000000000", "54321"):
+            passed.append(1)
+
+    workers = [threading.Thread(target=login) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(passed)
+
+
+def main(number=2000, threads=16):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis", action="store_true", help="use the redis server")
+    args = parser.parse_args()
+    if args.redis:
+        codes = r_code.RedisCodes(
+            redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=R_CODE_REDIS_DB)
+        )
+    else:
+        codes = r_code.LocalCodes()
+    print("store + is_valid {:8.1f} us".format(latency(codes, number) * 1e6))
+    print("{} concurrent logins, {} passed".format(threads, race(codes, threads)))
+
+
+if __name__ == "__main__":
+    main()
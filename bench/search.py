@@ -0,0 +1,87 @@
+"""
+    project search latency over a large collection: p50 / p99 / max of
+    GET /v1/projects?q= queries, from a common word to a rare one.
+
+    python -m bench.search [--count 1000000]
+    seeds bench_oohoom once (it is kept for the next run), needs mongodb.
+"""
+import argparse
+import random
+import time
+
+from pymongo import MongoClient
+
+from oohoom import search
+from oohoom.init.migrations import migrate
+
+# zipf-ish vocabulary: word i appears about 1/(i+1) as often as word 0
+WORDS = ["word{}".format(i) for i in range(5000)]
+WEIGHTS = [1 / (i + 1) for i in range(len(WORDS))]
+SKILLS = ["skill{}".format(i) for i in range(300)]
+STATES = ["new", "assigned", "done", "closed"]
+
+
+def seed(db, count, batch=10000):
+    have = db.projects.estimated_document_count()
+    rnd = random.Random(have)
+    for start in range(have, count, batch):
+        db.projects.insert_many(
+            {
+                "title": "project {} {}".format(
+                    i, " ".join(rnd.choices(WORDS, WEIGHTS, k=4))
+                ),
+                "description": " ".join(rnd.choices(WORDS, WEIGHTS, k=40)),
+                "skills": rnd.sample(SKILLS, 3),
+                "state": rnd.choice(STATES),
+                "employer": {"_id": None, "name": "an_employer"},
+                "employee": None,
+            }
+            for i in range(start, min(start + batch, count))
+        )
+    return db.projects.estimated_document_count()
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return (
+        timings[len(timings) // 2],
+        timings[len(timings) * 99 // 100],
+        timings[-1],
+    )
+
+
+def run(db, q, filter_, number):
+    timings = []
+    for i in range(number):
+        start = time.perf_counter()
+        list(search.find(db.projects, q, filter_, 0, 10))
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings)
+
+
+def main(number=50):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1000000)
+    args = parser.parse_args()
+    db = MongoClient().bench_oohoom
+    migrate(db)
+    print("{} projects".format(seed(db, args.count)))
+    for q, filter_ in [
+        ("word4999", {}),
+        ("word100", {}),
+        ("word100", {"state": "new"}),
+        ("skill7", {}),
+        ("word3 word200", {}),
+        ("word0", {}),
+        ("word0", {"state": "new"}),
+    ]:
+        p50, p99, worst = run(db, q, filter_, number)
+        print(
+            "{:16} {:16} p50 {:7.1f} ms  p99 {:7.1f} ms  max {:7.1f} ms".format(
+                q, str(filter_), p50 * 1e3, p99 * 1e3, worst * 1e3
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
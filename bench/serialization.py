@@ -0,0 +1,64 @@
+"""
+    serialization of realistic project and message pages:
+    bson.json_util.dumps against media.dumps.
+
+    python -m bench.serialization
+"""
+import timeit
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from bson.json_util import dumps as json_util_dumps
+
+from oohoom.constants import LIMIT
+from oohoom.media import dumps
+
+
+def project(i):
+    return {
+        "_id": ObjectId(),
+        "title": "project number {}".format(i),
+        "description": "a description of the deliverables. " * 14,
+        "employer": {"_id": ObjectId(), "name": "employer_{}".format(i)},
+        "employee": {"_id": ObjectId(), "name": "employee_{}".format(i)}
+        if i % 2
+        else None,
+        "state": "assigned" if i % 2 else "new",
+        "skills": ["python", "mongodb", "falcon", "redis"],
+        "creation_datetime": datetime(2020, 7, 1) + timedelta(minutes=i),
+    }
+
+
+def message(i, project_id):
+    return {
+        "_id": ObjectId(),
+        "project_id": project_id,
+        "body": "message body {} ".format(i) * 8,
+        "creation_datetime": datetime(2020, 7, 1, 12, 0, 0, 123000)
+        + timedelta(seconds=i),
+        "sender": {"_id": ObjectId(), "name": "sender_{}".format(i % 2)},
+        "seen": bool(i % 3),
+    }
+
+
+def main(number=500):
+    project_id = ObjectId()
+    pages = {
+        "projects x{}".format(LIMIT): [project(i) for i in range(LIMIT)],
+        "projects x100": [project(i) for i in range(100)],
+        "messages x{}".format(LIMIT): [message(i, project_id) for i in range(LIMIT)],
+        "messages x100": [message(i, project_id) for i in range(100)],
+    }
+    for name, page in pages.items():
+        assert dumps(page) == json_util_dumps(page)
+        old = min(timeit.repeat(lambda: json_util_dumps(page), number=number)) / number
+        new = min(timeit.repeat(lambda: dumps(page), number=number)) / number
+        print(
+            "{:14} json_util {:8.1f} us  media {:8.1f} us  {:4.1f}x".format(
+                name, old * 1e6, new * 1e6, old / new
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
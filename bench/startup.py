@@ -0,0 +1,62 @@
+"""
+    worker startup: import of oohoom.app, create_app and the first request,
+    each in a fresh interpreter, and the clients made by the import.
+    a preloaded master must not make a mongodb client; the workers it forks
+    would inherit it.
+
+    python -m bench.startup [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, threading, time
+start = time.perf_counter()
+import oohoom.app
+imported = time.perf_counter()
+from oohoom import connections
+clients = connections.mongo.created
+threads = threading.active_count()
+app = oohoom.app.create_app(is_testing=True)
+created = time.perf_counter()
+from falcon import testing
+testing.TestClient(app).simulate_get("/v1/test")
+served = time.perf_counter()
+print(json.dumps({
+    "import": imported - start,
+    "create_app": created - imported,
+    "first request": served - created,
+    "mongo client after import": clients,
+    "threads after import": threads,
+}))
+"""
+
+
+def probe() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    results = [probe() for i in range(args.runs)]
+    for key in ("import", "create_app", "first request"):
+        timings = [result[key] for result in results]
+        print(
+            "{:14} median {:7.1f} ms  min {:7.1f} ms".format(
+                key, statistics.median(timings) * 1e3, min(timings) * 1e3
+            )
+        )
+    for key in ("mongo client after import", "threads after import"):
+        print("{}: {}".format(key, results[-1][key]))
+
+
+if __name__ == "__main__":
+    main()
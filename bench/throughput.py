@@ -0,0 +1,82 @@
+"""
+    requests per second and latency of running servers, at a fixed concurrency.
+    run the wsgi and the asgi build side by side, e.g.
+
+    gunicorn -w 4 -b 127.0.0.1:8000 app:app
+    uvicorn --workers 4 --port 8001 asgi:app
+    python -m bench.throughput -c 64 -n 5000 \\
+        http://127.0.0.1:8000/v1/projects http://127.0.0.1:8001/v1/projects
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def worker(url, count, latencies, errors, headers):
+    parts = urlsplit(url)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    for _ in range(count):
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status >= 400:
+                errors.append(resp.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(e)
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def run(url, concurrency, number, headers):
+    latencies, errors = [], []
+    per_worker = number // concurrency
+    threads = [
+        threading.Thread(
+            target=worker, args=(url, per_worker, latencies, errors, headers)
+        )
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("-c", "--concurrency", type=int, default=64)
+    parser.add_argument("-n", "--number", type=int, default=5000)
+    parser.add_argument("-H", "--authorization", default=None)
+    args = parser.parse_args()
+    headers = {"Authorization": args.authorization} if args.authorization else {}
+
+    print("concurrency: {}".format(args.concurrency))
+    print(
+        "{:>10} {:>10} {:>10} {:>8}  url".format("req/s", "p50 ms", "p99 ms", "errors")
+    )
+    for url in args.urls:
+        result = run(url, args.concurrency, args.number, headers)
+        print(
+            "{rps:10.1f} {p50:10.2f} {p99:10.2f} {errors:8d}  ".format(**result) + url
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+    concurrent large uploads to POST /v1/files of a running server.
+    the body is generated as it is sent, and sending stops as soon as the
+    server answers, so an upload rejected early shows as few bytes sent.
+
+    python -m bench.uploads -c 16 -n 64 -s 20 -H <employer token> \\
+        --project-id <_id> http://127.0.0.1:8000/v1/files
+    # rejected: the employer may not upload output files
+    python -m bench.uploads -c 16 -n 64 -s 20 -H <employer token> \\
+        --project-id <_id> --kind output http://127.0.0.1:8000/v1/files
+"""
+import argparse
+import http.client
+import os
+import select
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlsplit
+
+CHUNK_SIZE = 64 * 1024
+
+
+def upload(url, project_id, kind, size, headers):
+    """
+        returns (status, bytes of the body sent).
+    """
+    parts = urlsplit(url)
+    boundary = uuid.uuid4().hex
+    head = (
+        "--{b}\r\nContent-Disposition: form-data; name=\"project_id\"\r\n\r\n{p}\r\n"
+        "--{b}\r\nContent-Disposition: form-data; name=\"kind\"\r\n\r\n{k}\r\n"
+        "--{b}\r\nContent-Disposition: form-data; name=\"file\"; "
+        "filename=\"bench.bin\"\r\nContent-Type: application/octet-stream\r\n\r\n"
+    ).format(b=boundary, p=project_id, k=kind).encode()
+    tail = "\r\n--{}--\r\n".format(boundary).encode()
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    conn.putrequest("POST", parts.path)
+    conn.putheader("Content-Type", "multipart/form-data; boundary=" + boundary)
+    conn.putheader("Content-Length", str(len(head) + size + len(tail)))
+    for name, value in headers.items():
+        conn.putheader(name, value)
+    conn.endheaders()
+    sent = 0
+    try:
+        conn.send(head)
+        # random, so no two uploads share a blob
+        chunk = os.urandom(CHUNK_SIZE)
+        while sent < size:
+            if select.select([conn.sock], [], [], 0)[0]:
+                # answered before the whole body
+                break
+            data = chunk[: size - sent]
+            conn.send(data)
+            sent += len(data)
+        else:
+            conn.send(tail)
+    except OSError:
+        # the server closed the connection after answering
+        pass
+    try:
+        resp = conn.getresponse()
+        resp.read()
+        status = resp.status
+    except (OSError, http.client.HTTPException) as e:
+        status = type(e).__name__
+    conn.close()
+    return status, sent
+
+
+def worker(args, count, latencies, statuses, sent, headers):
+    for _ in range(count):
+        start = time.perf_counter()
+        status, sent_ = upload(
+            args.url, args.project_id, args.kind, args.size * 1024 * 1024, headers
+        )
+        latencies.append(time.perf_counter() - start)
+        statuses[status] += 1
+        sent.append(sent_)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("url")
+    parser.add_argument("--project-id", required=True)
+    parser.add_argument("--kind", default="input")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-n", "--number", type=int, default=64)
+    parser.add_argument("-s", "--size", type=int, default=20, help="MiB per file")
+    parser.add_argument("-H", "--authorization", required=True)
+    args = parser.parse_args()
+    headers = {"Authorization": args.authorization}
+
+    latencies, sent, statuses = [], [], Counter()
+    threads = [
+        threading.Thread(
+            target=worker,
+            args=(
+                args,
+                args.number // args.concurrency,
+                latencies,
+                statuses,
+                sent,
+                headers,
+            ),
+        )
+        for _ in range(args.concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    print("concurrency: {}, {} MiB per file".format(args.concurrency, args.size))
+    print("uploads: {}  statuses: {}".format(len(latencies), dict(statuses)))
+    print("sent: {:.1f} MiB/s".format(sum(sent) / elapsed / 1024 / 1024))
+    print(
+        "p50: {:.1f} ms  p99: {:.1f} ms  max: {:.1f} ms".format(
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+            latencies[-1] * 1000,
+        )
+    )
+    print(
+        "body sent per upload: {:.1f}%".format(
+            100 * sum(sent) / (len(sent) * args.size * 1024 * 1024)
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+    compares the per-request validator construction validate_req used to do
+    with the precompiled, per-route RouteSchema.
+
+    python -m bench.validate_req
+"""
+import timeit
+
+import falcon
+from bson.objectid import ObjectId
+from cerberus import TypeDefinition, Validator
+from falcon import testing
+
+from oohoom.hooks import validate_req
+from oohoom.schemas import PROJECTS_GET
+
+SCHEMA = PROJECTS_GET
+
+
+def legacy_validate_req(
+    req,
+    resp,
+    resource,
+    params,
+    schema: dict,
+    require_all=True,
+    purge_unknown=True,
+    produce_filter=False,
+):
+    d = req.params
+    objectid_type = TypeDefinition("objectid", (ObjectId,), ())
+    Validator.types_mapping["objectid"] = objectid_type
+    V = Validator(schema, require_all=require_all, purge_unknown=purge_unknown)
+
+    d = V.normalized(d)
+    req.context.params = d
+    if not V.validate(d):
+        raise falcon.errors.HTTPBadRequest(description=V.errors)
+    if produce_filter:
+        keys = d.keys()
+        filter_keys = []
+        for key in keys:
+            if d[key] != "all" and key not in ["skip", "limit"]:
+                filter_keys.append(key)
+        filter_ = {}
+        for filter_key in filter_keys:
+            filter_[filter_key] = d[filter_key]
+        req.context.filter = filter_
+
+
+def run(hook, number):
+    req = testing.create_req(query_string="state=new&skip=20&limit=10")
+
+    def once():
+        hook(req, None, None, {}, SCHEMA, require_all=False, produce_filter=True)
+
+    once()
+    assert req.context.filter == {"state": "new"}
+    return min(timeit.repeat(once, number=number, repeat=5)) / number
+
+
+def main(number=2000):
+    legacy = run(legacy_validate_req, number)
+    compiled = run(validate_req, number)
+    print("per-request Validator: {:8.1f} us/req".format(legacy * 1e6))
+    print("precompiled RouteSchema: {:6.1f} us/req".format(compiled * 1e6))
+    print("speedup: {:.1f}x".format(legacy / compiled))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,468 +1,429 @@
-import string
-import os
-import io
-from mimetypes import guess_type
-from random import SystemRandom
-from datetime import datetime
-from random import SystemRandom
-
 import falcon
 from falcon.request import Request
 from falcon.response import Response 
-from bson.json_util import dumps, loads
+from bson.json_util import loads
 from bson import ObjectId
-from kavenegar import KavenegarAPI
-from pymongo import MongoClient, ASCENDING, DESCENDING
 
-from . import r_code
-from .constants import LIMIT
+from . import (
+    connections,
+    deadlines,
+    cursors,
+    fields,
+    media,
+    membership,
+    metrics,
+    middlewares,
+    queries,
+    r_code,
+    ranking,
+    realtime,
+    response_cache,
+    schemas,
+    sms,
+    storage,
+    unread,
+    uploads,
+)
+from .config import LIST_READ_PREFERENCE
 from .converters import UserNameConverter, ObjectIdConverter
-from .hooks import auth, validate_req
+from .hooks import auth, claimed_user, validate_req
 from .jwt_user_id import user_to_token
-from .local_config import KAVENEGAR_APIKEY, IS_DEBUGGING
-from .utils import normalized_mobile
-from .middlewares import cors
+from .local_config import IS_DEBUGGING
 
-client = MongoClient()
-db = client.test_oohoom
+# set by create_app. the client behind them is made on the first query of
+# each process, see connections.py
+db = connections.database("test_oohoom")
+# the list GETs, from a secondary when LIST_READ_PREFERENCE says so
+list_db = connections.database("test_oohoom", LIST_READ_PREFERENCE)
 
 is_debugging = IS_DEBUGGING  # manually enable testing situation (db,...)
 global_is_testing = is_debugging
 
 
+def find_user(req, role=None):
+    """
+        {_id, name} of the authenticated user, None if it hasn't the role.
+        the token claims are enough, unless it was issued without them.
+    """
+    user = claimed_user(req, role)
+    if user is None:
+        user = db.users.find_one(*queries.user(req.context.user_id, role))
+    return user or None
+
+
 class UserResource(object):
     @falcon.before(
-        validate_req,
-        {
-            "role": {
-                "type": "string",
-                "regex": "^(employer|employee|all)$",
-                "default": "all",
-            },
-            "state": {
-                "type": "string",
-                "regex": "^(idle|busy|all)$",
-                "default": "all",
-            },
-            "skip": {"type": "integer", "coerce": int, "min": 0, "default": 0},
-            "limit": {"type": "integer", "coerce": int, "min": 1, "default": LIMIT},
-        },
-        require_all=False,
-        produce_filter=True,
+        validate_req, schemas.USERS_GET, require_all=False, produce_filter=True
     )
     def on_get(self, req, resp):
-        users = list(
-            db.users.find(
-                req.context.filter,
-                skip=req.context.params.get("skip"),
-                limit=req.context.params.get("limit"),
-                projection={"_id": 1, "name": 1, "role": 1, "state": 1, "skills": 1},
+        filter_ = queries.users_page(req.context.params, req.context.filter)
+        skip = req.context.params.get("skip")
+        limit = req.context.params.get("limit")
+        # a cursor param (blank on the first page) asks for X-Next-Cursor
+        if "cursor" in req.context.params:
+            last = cursors.boundary(
+                list_db.users, filter_, ranking.SORT, skip + limit - 1
             )
+            cursors.set_next(resp, last, "rank", "_id")
+        users = list_db.users.find(
+            filter_,
+            skip=skip,
+            limit=limit,
+            projection=queries.USER_LISTED,
+            sort=ranking.SORT,
         )
-        # TODO: sort employees by rank
-        resp.media = users
+        media.stream_array(resp, users)
 
+    @response_cache.cached("user:{name}")
     def on_get_name(self, req, resp, name):
-        user = db.users.find_one(
-            {"name": name},
-            projection={"_id": 1, "name": 1, "role": 1, "state": 1, "skills": 1},
-        )
-        if user is None:
-            raise falcon.errors.HTTPNotFound(description="user not found")
+        user = db.users.find_one({"name": name}, projection=queries.USER_PUBLIC)
+        queries.check_found(user, description="user not found")
         resp.media = user
 
     @falcon.before(auth)
     def on_get_me(self, req, resp):
         user = db.users.find_one({"_id": req.context.user_id})
         # a rare case
-        if user is None:
-            raise falcon.errors.HTTPNotFound(description="user not found")
+        queries.check_found(user, description="user not found")
         resp.media = user
 
     # registration
-    @falcon.before(
-        validate_req,
-        {
-            "code": {"type": "string"},
-            "mobile": {"type": "string", "minlength": 5, "maxlength": 30},
-            "name": {
-                "type": "string",
-                "maxlength": 36,
-                "minlength": 1,
-                "regex": "^(?!(me)$)[a-z0-9_]+$",
-            },
-            "role": {"type": "string", "allowed": ["employer", "employee"]},
-            "skills": {
-                "type": "list",
-                "schema": {"type": "string", "minlength": 1, "maxlength": 36},
-                "maxlength": 30,
-            },
-        },
-    )
+    @falcon.before(validate_req, schemas.USERS_POST)
     def on_post(self, req, resp):
-        req.media["mobile"] = normalized_mobile(req.media.get("mobile"))
-        if not r_code.is_valid(req.media.get("mobile"), req.media.get("code")):
-            raise falcon.errors.HTTPBadRequest(description={"code": "code is invalid"})
-        if (
-            db.users.find_one(
-                {"mobile": req.media.get("mobile")}, projection={"mobile": 1}
-            )
-            is not None
-        ):
-            raise falcon.errors.HTTPConflict(
-                title="mobile",
-                description={"mobile": "A user with this mobile number already exists"},
-            )
-        if (
-            db.users.find_one({"name": req.media.get("name")}, projection={"name": 1})
-            is not None
-        ):
-            raise falcon.errors.HTTPConflict(
-                title="name",
-                description={"name": "A user with this name already exists"},
-            )
-        result = db.users.insert_one(
-            {
-                "mobile": req.media.get("mobile"),
-                "name": req.media.get("name"),
-                "role": req.media.get("role"),
-                "state": "idle",
-                "skills": req.media.get("skills"),
-            }
+        media_ = queries.normalized(req.media)
+        queries.check_code(r_code.is_valid(media_["mobile"], media_.get("code")))
+        queries.check_unique(
+            "mobile", db.users.find_one(*queries.taken("mobile", media_["mobile"]))
+        )
+        queries.check_unique(
+            "name", db.users.find_one(*queries.taken("name", media_.get("name")))
+        )
+        result = db.users.insert_one(queries.new_user(media_))
+        response_cache.cache.invalidate("user:{}".format(media_.get("name")))
+        token = user_to_token(
+            str(result.inserted_id), media_.get("name"), media_.get("role")
         )
-        token = user_to_token(str(result.inserted_id))
         resp.media = {"token": token}
         resp.status = falcon.HTTP_CREATED
 
 
 class CodeResource(object):
     # send verification sms
-    @falcon.before(
-        validate_req, {"mobile": {"type": "string", "minlength": 5, "maxlength": 30}}
-    )
+    @falcon.before(validate_req, schemas.CODE_POST)
     def on_post(self, req, resp):
-        req.media["mobile"] = normalized_mobile(req.media.get("mobile"))
-        is_user_exists = False
-        if (
-            db.users.find_one(
-                {"mobile": req.media.get("mobile")}, projection={"mobile": 1}
-            )
-            is not None
-        ):
-            is_user_exists = True
-        code = "".join(SystemRandom().choice(string.digits) for digit in range(5))
-        try:
-            api = KavenegarAPI(KAVENEGAR_APIKEY)
-            params = {
-                "receptor": req.media.get("mobile"),
-                "token": code,
-                "template": "code"
-            }
-            if not global_is_testing:
-                response = api.verify_lookup(params)
-                print(response)
-        except Exception as e:
-            print("Error [kavenegar]: ", e)
-            raise falcon.HTTPInternalServerError()
-        else:
-            r_code.store(req.media.get("mobile"), code)
-            resp.media = {"is_user_exists": is_user_exists}
-            resp.status = falcon.HTTP_CREATED
+        mobile = queries.normalized(req.media)["mobile"]
+        is_user_exists = (
+            db.users.find_one(*queries.taken("mobile", mobile)) is not None
+        )
+        code = queries.new_code()
+        r_code.store(mobile, code)
+        # sent by the sms worker, see sms.py
+        if not global_is_testing:
+            sms.enqueue(mobile, code)
+        resp.media = {"is_user_exists": is_user_exists}
+        resp.status = falcon.HTTP_CREATED
 
 
 class TokenResource(object):
     # login
-    @falcon.before(
-        validate_req,
-        {
-            "mobile": {"type": "string", "minlength": 5, "maxlength": 30},
-            "code": {"type": "string"},
-        },
-    )
+    @falcon.before(validate_req, schemas.TOKEN_POST)
     def on_post(self, req, resp):
-        req.media["mobile"] = normalized_mobile(req.media.get("mobile"))
-        if not r_code.is_valid(req.media.get("mobile"), req.media.get("code")):
-            raise falcon.errors.HTTPBadRequest(description={"code": "code is invalid"})
-        user = db.users.find_one({"mobile": req.media.get("mobile")})
-        if user is None:
-            raise falcon.errors.HTTPBadRequest(description={"code": "code is invalid"})
-        token = user_to_token(str(user["_id"]))
+        media_ = queries.normalized(req.media)
+        queries.check_code(r_code.is_valid(media_["mobile"], media_.get("code")))
+        user = db.users.find_one({"mobile": media_["mobile"]})
+        queries.check_code(user is not None)
+        token = user_to_token(str(user["_id"]), user["name"], user["role"])
         resp.media = {"token": token}
 
 
 class ProjectResource(object):
     @falcon.before(auth)
-    @falcon.before(
-        validate_req,
-        {
-            "title": {"type": "string", "minlength": 1, "maxlength": 88},
-            "description": {"type": "string", "minlength": 0, "maxlength": 500},
-            "skills": {
-                "type": "list",
-                "schema": {"type": "string", "minlength": 1, "maxlength": 36},
-                "maxlength": 30,
-            },
-        },
-    )
+    @falcon.before(validate_req, schemas.PROJECTS_POST)
     def on_post(self, req, resp):
-        employer = db.users.find_one(
-            {"_id": req.context.user_id, "role": "employer"},
-            projection={"_id": 1, "name": 1},
+        employer = find_user(req, "employer")
+        queries.check_role(employer, "employer", "post a project")
+        title = req.media.get("title")
+        queries.check_unique(
+            "title", db.projects.find_one(*queries.taken("title", title))
         )
-        if employer is None:
-            raise falcon.errors.HTTPForbidden(
-                description="You must be an employer to post a project."
-            )
-        project = db.projects.find_one({"title": req.media.get("title")})
-        if project is not None:
-            raise falcon.errors.HTTPConflict(
-                description={"title": "This title already exists."}
-            )
         result = db.projects.insert_one(
-            {
-                "title": req.media.get("title"),
-                "description": req.media.get("description"),
-                "employer": {"_id": req.context.user_id, "name": employer.get("name")},
-                "employee": None,
-                "state": "new",
-                "skills": req.media.get("skills"),
-                "creation_datetime": datetime.utcnow(),
-            }
+            queries.new_project(req.media, employer, req.context.user_id)
         )
+        response_cache.cache.invalidate("projects")
         resp.media = {"_id": result.inserted_id}
 
     @falcon.before(
-        validate_req,
-        {
-            "state": {
-                "type": "string",
-                "regex": "^(new|assigned|done|closed|all)$",
-                "default": "all",
-            },
-            "skip": {"type": "integer", "coerce": int, "min": 0, "default": 0},
-            "limit": {"type": "integer", "coerce": int, "min": 1, "default": LIMIT},
-        },
-        require_all=False,
-        produce_filter=True,
+        validate_req, schemas.PROJECTS_GET, require_all=False, produce_filter=True
     )
+    @response_cache.cached("projects")
     def on_get(self, req, resp):
-        projects = list(
-            db.projects.find(
-                req.context.filter,
-                skip=req.context.params.get("skip"),
-                limit=req.context.params.get("limit"),
-            ).sort("_id", DESCENDING)
+        if req.context.params.get("q") is not None:
+            with queries.searching():
+                resp.media = list(
+                    queries.search_projects(
+                        list_db.projects, req.context.params, req.context.filter
+                    )
+                )
+            return
+        filter_ = queries.projects_page(req.context.params, req.context.filter)
+        skip = req.context.params.get("skip")
+        limit = req.context.params.get("limit")
+        # a cursor param (blank on the first page) asks for X-Next-Cursor
+        if "cursor" in req.context.params:
+            last = cursors.boundary(
+                list_db.projects, filter_, queries.PROJECTS_SORT, skip + limit - 1
+            )
+            cursors.set_next(resp, last, "_id")
+        projects = list_db.projects.find(
+            filter_,
+            skip=skip,
+            limit=limit,
+            sort=queries.PROJECTS_SORT,
+            projection=fields.projection(req.context.params["fields"]),
         )
-        # TODO: sort projects according to skills
-        resp.media = projects
+        # ranked by the employee's skills: on_get_feed
+        media.stream_array(resp, projects)
 
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.PROJECTS_FEED_GET, require_all=False)
+    def on_get_feed(self, req, resp):
+        queries.check_role(
+            claimed_user(req, "employee") is not False, "employee", "have a feed"
+        )
+        employee = db.users.find_one(
+            {"_id": req.context.user_id, "role": "employee"},
+            projection={"skills": 1},
+        )
+        queries.check_role(employee, "employee", "have a feed")
+        projects = list_db.projects.aggregate(
+            queries.feed_pipeline(employee, req.context.params)
+        )
+        media.stream_array(resp, projects)
+
+    @response_cache.cached("project:{_id}")
     def on_get__id(self, req: Request, resp: Response, _id: ObjectId):
         project = db.projects.find_one({"_id": _id})
-        if project is None:
-            raise falcon.errors.HTTPNotFound(description="project not found")
+        queries.check_found(project, description="project not found")
         resp.media = project
 
-    @falcon.before(
-        validate_req,
-        {
-            "action": {
-                "type": "string",
-                "regex": "^(assign|update)$",
-                "required": True,
-            },
-            "_id": {"type": "objectid", "required": True},
-            "update": {
-                "type": "dict",
-                "schema": {
-                    "description": {"type": "string", "minlength": 0, "maxlength": 500},
-                    "skills": {
-                        "type": "list",
-                        "schema": {"type": "string", "minlength": 1, "maxlength": 36},
-                        "maxlength": 30,
-                    },
-                },
-                "dependencies": {"action": "update"},
-            },
-        },
-        require_all=False,
-    )
+    @falcon.before(validate_req, schemas.PROJECTS_PATCH, require_all=False)
     @falcon.before(auth)
     def on_patch(self, req, resp):
+        project_id = req.context.params.get("_id")
         # employee performs this action
         if req.context.params.get("action") == "assign":
-            employee = db.users.find_one(
-                {"_id": req.context.user_id, "role": "employee"},
-                projection={"_id": 1, "name": 1},
+            employee = find_user(req, "employee")
+            queries.check_role(
+                employee, "employee", "accept project", falcon.errors.HTTPUnauthorized
             )
-            if employee is None:
-                raise falcon.errors.HTTPUnauthorized(
-                    description="You must be an employee to accept project."
-                )
-            result = db.projects.update_one(
-                {
-                    "_id": req.context.params.get("_id"),
-                    "employee": None,
-                    "state": "new",
-                },
-                {"$set": {"employee": employee, "state": "assigned"}},
+            result = queries.assign(db, project_id, employee)
+            queries.check_found(
+                result.matched_count, description="no new project found"
             )
-            if result.matched_count == 1:
-                resp.media = result.raw_result
-            else:
-                raise falcon.errors.HTTPNotFound(description="no new project found")
+            # the employee is a member now
+            membership.cache.invalidate(project_id)
+            ranking.assigned(db, employee["_id"])
+            response_cache.cache.invalidate(*queries.project_tags(project_id))
+            resp.media = result.raw_result
         # employer performs this action
         elif (
             req.context.params.get("action") == "update"
             and req.context.params.get("update") is not None
         ):
-            result = db.projects.update_one(
-                {"_id": req.context.params.get("_id")},
-                {"$set": req.context.params.get("update")},
+            result = queries.update(db, project_id, req.context.params["update"])
+            queries.check_found(result.matched_count, description="project not found")
+            response_cache.cache.invalidate(*queries.project_tags(project_id))
+            resp.media = result.raw_result
+        # employer performs this action
+        elif req.context.params.get("action") == "done":
+            project = queries.done(db, project_id, req.context.user_id)
+            queries.check_found(
+                project, description="no assigned project found for you"
             )
-            if result.matched_count == 1:
-                resp.media = result.raw_result
-            else:
-                raise falcon.errors.HTTPNotFound(description="project not found")
+            ranking.done(db, project["employee"]["_id"])
+            response_cache.cache.invalidate(*queries.project_tags(project["_id"]))
+            resp.media = {"_id": project["_id"], "state": "done"}
 
 
 class FileResource(object):
     @falcon.before(auth)
     def on_post(self, req: Request, resp: Response):
-        if req.content_type.split(';')[0] == 'multipart/form-data':
-            file_ = {'creation_datetime': datetime.utcnow()}
-            for part in req.media:
-                if part.name == 'file':
-                    file_['title'] = part.filename
-                    temp_filename = ''.join(SystemRandom().choice(string.digits+string.ascii_lowercase) for digit in range(32))
-                    with io.open(os.path.join('uploads', 'files', temp_filename), 'wb') as dest:
-                        part.stream.pipe(dest) 
-                elif part.name == 'project_id':
-                    file_['project_id'] = ObjectId(part.text)
-                elif part.name == 'kind':
-                    file_['kind'] = part.text
-                    if file_['kind'] not in ['input', 'output']:
-                        os.remove(os.path.join('uploads', 'files', temp_filename)) 
-                        raise falcon.errors.HTTPBadRequest(title='`kind` should be `input|output`')
-            role = {'input': 'employer._id', 'output': 'employee._id'}
-            project = db.projects.find_one({'_id': file_['project_id'], role[file_['kind']]: req.context.user_id})
-            if project is None:
-                os.remove(os.path.join('uploads', 'files', temp_filename)) 
-                raise falcon.errors.HTTPForbidden(title='no such project found for you')
+        queries.check_multipart(req)
+        uploads.check_length(req)
+        user_id = req.context.user_id
+        file_, pending = uploads.receive(
+            req.media,
+            lambda project_id, kind: uploads.limit(db, project_id, user_id, kind),
+            # the writes wait for the client's upload
+            lambda: deadlines.paused(req),
+        )
+        # the upload took the client's time, not the server's
+        deadlines.restart(req)
+        if not uploads.reserve(db, file_['project_id'], pending.size).matched_count:
+            storage.backend.discard(pending)
+            raise falcon.HTTPPayloadTooLarge(title='the project is out of space')
+        try:
+            file_['digest'] = storage.backend.commit(pending)
+        except BaseException:
+            uploads.refund(db, file_['project_id'], pending.size)
+            raise
+        file_['size'] = pending.size
+        try:
             result = db.files.insert_one(file_)
-            os.rename(os.path.join('uploads', 'files', temp_filename), os.path.join('uploads', 'files', str(result.inserted_id)))
-            resp.status = falcon.HTTP_201
-            resp.media = {'_id': result.inserted_id}
-        else:
-            raise falcon.errors.HTTPUnsupportedMediaType(title='multipart/form-data required')
+        except BaseException:
+            storage.backend.release(file_['digest'])
+            uploads.refund(db, file_['project_id'], pending.size)
+            raise
+        resp.status = falcon.HTTP_201
+        resp.media = {'_id': result.inserted_id}
 
     @falcon.before(auth, optional=True)
     def on_get__id(self, req: Request, resp: Response, _id: ObjectId):
         file_ = db.files.find_one({'_id': _id})
-        if file_ is None:
-            raise falcon.errors.HTTPNotFound(title='no such file found')
-        if file_['kind'] == 'output':
-            if not req.context.authenticated:
-                raise falcon.errors.HTTPUnauthorized()
-            project = db.projects.find_one({'_id': file_['project_id'],
-                '$or':
-                    [
-                        {'employer._id': req.context.user_id},
-                        {'employee._id': req.context.user_id}
-                    ]
-            })
-            if project is None:
-                raise falcon.errors.HTTPForbidden()
-        file_path = os.path.join('uploads', 'files', str(_id))
-        resp.stream = io.open(file_path, 'rb')
-        resp.downloadable_as = file_['title']
-        resp.content_length = os.path.getsize(file_path)
-        resp.content_type = guess_type(file_['title'])[0]
+        queries.check_found(file_, title='no such file found')
+        if queries.members_only(req, file_['kind']):
+            queries.check_member(
+                membership.role(db, file_['project_id'], req.context.user_id)
+            )
+        range_ = queries.send_file(req, resp, file_)
+        if range_ is not None:
+            resp.stream = storage.backend.open(file_['digest'], *range_)
 
     @falcon.before(auth, optional=True)
-    @falcon.before(validate_req, {
-        "project_id": {"type": "string", "required": True},
-        "kind": {"type": "string", "regex": "^(input|output)$", "default": "input"}
-    }, produce_filter=True, require_all=False)
+    @falcon.before(
+        validate_req, schemas.FILES_GET, produce_filter=True, require_all=False
+    )
     def on_get(self, req: Request, resp: Response):
-        try:
-            project_id = ObjectId(req.context.params['project_id'])
-        except:
-            raise falcon.errors.HTTPBadRequest(title='invalid project_id')
-        req.context.filter['project_id'] = project_id
-        if req.context.params['kind'] == 'output':
-            if not req.context.authenticated:
-                raise falcon.errors.HTTPUnauthorized()
-            project = db.projects.find_one({'_id': project_id, 
-                '$or':
-                    [
-                        {'employer._id': req.context.user_id},
-                        {'employee._id': req.context.user_id}
-                    ]
-            })
-            if project is None:
-                raise falcon.errors.HTTPForbidden()
-        files = db.files.find(req.context.filter)
-        resp.media = list(files)
+        filter_ = queries.project_filter(req)
+        if queries.members_only(req, req.context.params['kind']):
+            queries.check_member(
+                membership.role(db, filter_['project_id'], req.context.user_id)
+            )
+        media.stream_array(resp, list_db.files.find(
+            filter_, projection=fields.projection(req.context.params['fields']),
+        ))
 
 
 class MessageResource(object):
     @falcon.before(auth)
-    @falcon.before(validate_req, {
-        "project_id": {"type": "objectid"},
-        "body": {"type": "string", "minlength": 1, "maxlength": 500}
-    })
+    @falcon.before(validate_req, schemas.MESSAGES_POST)
     def on_post(self, req: Request, resp: Response):
-        project = db.projects.find_one({"_id": req.context.params['project_id'], 
-            '$or':
-                [
-                    {'employer._id': req.context.user_id},
-                    {'employee._id': req.context.user_id}
-                ]
-        })
-        if project is None:
-            raise falcon.errors.HTTPForbidden(title='no such project found for you')
-        user = db.users.find_one({"_id": req.context.user_id}, {'_id': 1, 'name': 1})
+        sender_role = membership.role(
+            db, req.context.params['project_id'], req.context.user_id
+        )
+        queries.check_member(sender_role)
+        user = find_user(req)
         if user is None:
             raise falcon.errors.HTTPUnauthorized()
-        message = {
-            "project_id": req.context.params['project_id'],
-            "body": req.context.params['body'],
-            "creation_datetime": datetime.utcnow(),
-            "sender": user,
-            "seen": False,
-        }
+        message = queries.new_message(req.context.params, user)
         result = db.messages.insert_one(message)
+        unread.sent(db, message['project_id'], sender_role)
+        realtime.hub.publish(message['project_id'])
         resp.status = falcon.HTTP_CREATED
         resp.media = {"_id": result.inserted_id, 'project_id': message['project_id']}
 
     @falcon.before(auth)
-    @falcon.before(validate_req, {
-        "project_id": {"type": "string", "required": True},
-        "skip": {"type": "integer", "coerce": int, "min": 0, "default": 0},
-        "limit": {"type": "integer", "coerce": int, "min": 1, "default": LIMIT},
-    }, produce_filter=True)
+    @falcon.before(validate_req, schemas.MESSAGES_PATCH)
+    def on_patch(self, req: Request, resp: Response):
+        """
+            mark the messages of the other member seen, up to until.
+        """
+        project_id = req.context.params['project_id']
+        role = membership.role(db, project_id, req.context.user_id)
+        queries.check_member(role)
+        until = db.messages.find_one(*queries.until(req.context.params))
+        queries.check_found(until, title='no such message found')
+        result = db.messages.update_many(
+            unread.unseen_filter(project_id, req.context.user_id, until),
+            {'$set': {'seen': True}},
+        )
+        if result.modified_count:
+            unread.seen(db, project_id, role, result.modified_count)
+        resp.media = {'seen': result.modified_count}
+
+    @falcon.before(auth)
+    def on_get_unread(self, req: Request, resp: Response):
+        """
+            [{project_id, unread}] of every project of the user.
+        """
+        projects = list(db.projects.find(
+            unread.member_projects_filter(req.context.user_id),
+            projection={'employer._id': 1},
+        ))
+        counters = db.unread.find({'_id': {'$in': [p['_id'] for p in projects]}})
+        resp.media = unread.counts(projects, counters, req.context.user_id)
+
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.MESSAGES_GET, produce_filter=True)
     def on_get(self, req: Request, resp: Response):
-        try:
-            project_id = ObjectId(req.context.params['project_id'])
-        except:
-            raise falcon.errors.HTTPBadRequest(title='invalid project_id')
-        req.context.filter['project_id'] = project_id
-        project = db.projects.find_one({"_id": project_id, 
-            '$or':
-                [
-                    {'employer._id': req.context.user_id},
-                    {'employee._id': req.context.user_id}
-                ]
-        })
-        if project is None:
-            raise falcon.errors.HTTPForbidden(title='no such project found for you')
+        filter_ = queries.project_filter(req)
+        queries.check_member(
+            membership.role(db, filter_['project_id'], req.context.user_id)
+        )
+        filter_ = queries.messages_page(req.context.params, filter_)
+        skip, limit = req.context.params['skip'], req.context.params['limit']
+        oldest = cursors.boundary(
+            db.messages, filter_, queries.MESSAGES_NEWEST_FIRST, skip + limit - 1
+        )
+        if oldest is not None:
+            cursors.set_next(resp, oldest, 'creation_datetime', '_id')
+            filter_ = queries.messages_from(filter_, oldest)
+        elif skip:
+            newest = cursors.boundary(
+                db.messages, filter_, queries.MESSAGES_NEWEST_FIRST, skip
+            )
+            if newest is None:
+                resp.media = []
+                return
+            filter_ = queries.messages_to(filter_, newest)
         messages = db.messages.find(
-            req.context.filter,
-            limit=req.context.params['limit'], skip=req.context.params['skip']
-        ).sort('creation_datetime', DESCENDING)
-        messages = list(messages)
-        messages.reverse()
-        resp.media = messages 
+            filter_, limit=limit, sort=queries.MESSAGES_OLDEST_FIRST,
+            projection=fields.projection(req.context.params['fields']),
+        )
+        media.stream_array(resp, messages)
+
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.MESSAGES_POLL_GET)
+    def on_get_poll(self, req: Request, resp: Response):
+        """
+            long-poll of the messages after since, oldest first.
+        """
+        project_id = queries.project_id(req.context.params)
+        queries.check_member(membership.role(db, project_id, req.context.user_id))
+        since = queries.poll_since(req.context.params)
+        if since is None:
+            # only messages from now on
+            since = queries.newest_keys(cursors.boundary(
+                db.messages, queries.poll_filter(project_id, None),
+                queries.MESSAGES_NEWEST_FIRST, 0
+            ))
+        filter_ = queries.poll_filter(project_id, since)
+        limit = req.context.params['limit']
+        event = realtime.hub.subscribe(project_id)
+        try:
+            messages = list(db.messages.find(
+                filter_, limit=limit, sort=queries.MESSAGES_OLDEST_FIRST
+            ))
+            if not messages:
+                # the wait is not work of the server
+                with metrics.waiting(req):
+                    woke = event.wait(req.context.params['timeout'])
+                if woke:
+                    deadlines.restart(req)
+                    messages = list(db.messages.find(
+                        filter_, limit=limit, sort=queries.MESSAGES_OLDEST_FIRST
+                    ))
+        finally:
+            realtime.hub.unsubscribe(project_id)
+        queries.set_poll_next(resp, messages, since)
+        resp.media = messages
+
+
+class MetricsResource(object):
+    def on_get(self, req, resp):
+        metrics.authorize(req)
+        resp.content_type = "text/plain; version=0.0.4"
+        resp.body = metrics.registry.exposition()
 
 
 class TestResource(object):
@@ -470,53 +431,118 @@ class TestResource(object):
         resp.media = {"ok": True}
 
 
-def create_app(is_testing=False):
-    app = falcon.App(middleware=[cors()])
-    global db, global_is_testing
-    # create_app was called within a test
-    if is_testing:
-        print("test db")
-        client = MongoClient()
-        db = client.test_oohoom
-        # in order to use inside of Resource
-        global_is_testing = True
-    else:
-        print("production db")
-        client = MongoClient()
-        db = client.oohoom
-
+def configure(app, resources: dict):
+    """
+        converters, media handlers and routes.
+        shared by the wsgi app and the asgi app (see asgi.py).
+    """
     app.router_options.converters["user_name"] = UserNameConverter
     app.router_options.converters["ObjectId"] = ObjectIdConverter
 
-    json_handler = falcon.media.JSONHandler(dumps=dumps, loads=loads,)
-    form_handler = falcon.media.MultipartFormHandler()
+    # extended json, see media.py
+    json_handler = falcon.media.JSONHandler(dumps=media.dumps, loads=loads,)
     extra_handlers = {
         "application/json": json_handler,
-        'multipart/formdata': form_handler
+        # streamed by FileResource, see uploads.py
+        "multipart/form-data": uploads.form_handler(),
     }
     app.req_options.media_handlers.update(extra_handlers)
     app.resp_options.media_handlers.update(extra_handlers)
 
-    test = TestResource()
-    user = UserResource()
-    code = CodeResource()
-    token = TokenResource()
-    project = ProjectResource()
-    file_ = FileResource()
-    messages = MessageResource()
-
-    app.add_route("/v1/test", test)
-    app.add_route("/v1/users", user)
-    app.add_route("/v1/users/me", user, suffix="me")
-    app.add_route("/v1/users/{name:user_name}", user, suffix="name")
-    app.add_route("/v1/code", code)
-    app.add_route("/v1/token", token)
-    app.add_route("/v1/projects", project)
-    app.add_route("/v1/projects/{_id:ObjectId}", project, suffix="_id")
-    app.add_route('/v1/files', file_)
-    app.add_route('/v1/files/{_id:ObjectId}', file_, suffix='_id')
-    app.add_route('/v1/messages', messages)
+    # the caches are replaced by create_app, so they are looked up each time
+    metrics.registry.gauge(
+        "oohoom_membership_cache_hits_total",
+        "membership cache hits",
+        lambda: membership.cache.stats()["hits"],
+        "counter",
+    )
+    metrics.registry.gauge(
+        "oohoom_membership_cache_misses_total",
+        "membership cache misses",
+        lambda: membership.cache.stats()["misses"],
+        "counter",
+    )
+    metrics.registry.gauge(
+        "oohoom_response_cache_hits_total",
+        "response cache hits",
+        lambda: response_cache.cache.stats()["hits"],
+        "counter",
+    )
+    metrics.registry.gauge(
+        "oohoom_response_cache_misses_total",
+        "response cache misses",
+        lambda: response_cache.cache.stats()["misses"],
+        "counter",
+    )
+    metrics.registry.gauge(
+        "oohoom_membership_cache_size",
+        "roles in the membership cache of the process",
+        lambda: membership.cache.stats()["size"],
+    )
+
+    app.add_route("/v1/test", resources["test"])
+    app.add_route("/v1/metrics", resources["metrics"])
+    app.add_route("/v1/users", resources["user"])
+    app.add_route("/v1/users/me", resources["user"], suffix="me")
+    app.add_route("/v1/users/{name:user_name}", resources["user"], suffix="name")
+    app.add_route("/v1/code", resources["code"])
+    app.add_route("/v1/token", resources["token"])
+    app.add_route("/v1/projects", resources["project"])
+    app.add_route("/v1/projects/feed", resources["project"], suffix="feed")
+    app.add_route("/v1/projects/{_id:ObjectId}", resources["project"], suffix="_id")
+    app.add_route('/v1/files', resources["file"])
+    app.add_route('/v1/files/{_id:ObjectId}', resources["file"], suffix='_id')
+    app.add_route('/v1/messages', resources["message"])
+    app.add_route('/v1/messages/poll', resources["message"], suffix="poll")
+    app.add_route('/v1/messages/unread', resources["message"], suffix="unread")
     return app
 
 
-app = create_app(is_testing=is_debugging)
+def create_app(is_testing=False, asgi=False):
+    if asgi:
+        # async resources, motor and redis.asyncio
+        from . import asgi as asgi_app
+
+        return asgi_app.create_app(is_testing=is_testing)
+
+    global db, list_db, global_is_testing
+    # create_app was called within a test
+    if is_testing:
+        print("test db")
+        name = "test_oohoom"
+        # in order to use inside of Resource
+        global_is_testing = True
+    else:
+        print("production db")
+        name = "oohoom"
+    db = connections.database(name)
+    list_db = connections.database(name, LIST_READ_PREFERENCE)
+
+    membership.cache = membership.from_config()
+    response_cache.cache = response_cache.from_config()
+    storage.backend = storage.from_config(db)
+
+    app = falcon.App(middleware=middlewares.create(is_testing))
+    app.add_error_handler(deadlines.TIMEOUTS, deadlines.handle_timeout)
+
+    return configure(
+        app,
+        {
+            "test": TestResource(),
+            "metrics": MetricsResource(),
+            "user": UserResource(),
+            "code": CodeResource(),
+            "token": TokenResource(),
+            "project": ProjectResource(),
+            "file": FileResource(),
+            "message": MessageResource(),
+        },
+    )
+
+
+def __getattr__(name):
+    # oohoom.app:app is made on first use, not on import
+    if name == "app":
+        globals()["app"] = create_app(is_testing=is_debugging)
+        return globals()["app"]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
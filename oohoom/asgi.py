@@ -0,0 +1,535 @@
+"""
+    the asgi flavour of app.py.
+    the same routes and behaviour, but resources are coroutines backed by motor
+    and redis.asyncio, so a slow query or sms call doesn't hold a worker.
+    the queries and checks are shared with app.py, see queries.py.
+
+    uvicorn asgi:app
+"""
+import asyncio
+
+import falcon
+import falcon.asgi
+from bson import ObjectId
+from falcon.asgi import Request, Response
+
+from . import (
+    connections,
+    deadlines,
+    cursors,
+    fields,
+    media,
+    membership,
+    metrics,
+    middlewares,
+    queries,
+    r_code,
+    ranking,
+    realtime,
+    response_cache,
+    schemas,
+    sms,
+    storage,
+    unread,
+    uploads,
+)
+from .app import configure
+from .config import LIST_READ_PREFERENCE
+from .hooks import auth_async as auth, claimed_user, validate_req_async as validate_req
+from .jwt_user_id import user_to_token
+from .local_config import IS_DEBUGGING
+
+# set by create_app, see connections.py
+db = None
+list_db = None
+
+global_is_testing = IS_DEBUGGING
+
+FILE_BLOCK_SIZE = 64 * 1024
+form_handler = uploads.form_handler()
+
+
+async def run_sync(func, *args):
+    """
+        run blocking code (e.g. disk) in the default executor.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+async def find_user(req, role=None):
+    """
+        {_id, name} of the authenticated user, None if it hasn't the role.
+        the token claims are enough, unless it was issued without them.
+    """
+    user = claimed_user(req, role)
+    if user is None:
+        user = await db.users.find_one(*queries.user(req.context.user_id, role))
+    return user or None
+
+
+class UserResource(object):
+    @falcon.before(
+        validate_req, schemas.USERS_GET, require_all=False, produce_filter=True
+    )
+    async def on_get(self, req, resp):
+        filter_ = queries.users_page(req.context.params, req.context.filter)
+        skip = req.context.params.get("skip")
+        limit = req.context.params.get("limit")
+        # a cursor param (blank on the first page) asks for X-Next-Cursor
+        if "cursor" in req.context.params:
+            last = await cursors.boundary(
+                list_db.users, filter_, ranking.SORT, skip + limit - 1
+            )
+            cursors.set_next(resp, last, "rank", "_id")
+        users = list_db.users.find(
+            filter_,
+            skip=skip,
+            limit=limit,
+            projection=queries.USER_LISTED,
+            sort=ranking.SORT,
+        )
+        media.stream_array_async(resp, users)
+
+    @response_cache.cached_async("user:{name}")
+    async def on_get_name(self, req, resp, name):
+        user = await db.users.find_one({"name": name}, projection=queries.USER_PUBLIC)
+        queries.check_found(user, description="user not found")
+        resp.media = user
+
+    @falcon.before(auth)
+    async def on_get_me(self, req, resp):
+        user = await db.users.find_one({"_id": req.context.user_id})
+        # a rare case
+        queries.check_found(user, description="user not found")
+        resp.media = user
+
+    # registration
+    @falcon.before(validate_req, schemas.USERS_POST)
+    async def on_post(self, req, resp):
+        media_ = queries.normalized(await req.get_media())
+        queries.check_code(
+            await r_code.is_valid_async(media_["mobile"], media_.get("code"))
+        )
+        queries.check_unique(
+            "mobile",
+            await db.users.find_one(*queries.taken("mobile", media_["mobile"])),
+        )
+        queries.check_unique(
+            "name", await db.users.find_one(*queries.taken("name", media_.get("name")))
+        )
+        result = await db.users.insert_one(queries.new_user(media_))
+        await response_cache.invalidate_async("user:{}".format(media_.get("name")))
+        token = user_to_token(
+            str(result.inserted_id), media_.get("name"), media_.get("role")
+        )
+        resp.media = {"token": token}
+        resp.status = falcon.HTTP_CREATED
+
+
+class CodeResource(object):
+    # send verification sms
+    @falcon.before(validate_req, schemas.CODE_POST)
+    async def on_post(self, req, resp):
+        mobile = queries.normalized(await req.get_media())["mobile"]
+        is_user_exists = (
+            await db.users.find_one(*queries.taken("mobile", mobile)) is not None
+        )
+        code = queries.new_code()
+        await r_code.store_async(mobile, code)
+        # sent by the sms worker, see sms.py
+        if not global_is_testing:
+            await sms.enqueue_async(mobile, code)
+        resp.media = {"is_user_exists": is_user_exists}
+        resp.status = falcon.HTTP_CREATED
+
+
+class TokenResource(object):
+    # login
+    @falcon.before(validate_req, schemas.TOKEN_POST)
+    async def on_post(self, req, resp):
+        media_ = queries.normalized(await req.get_media())
+        queries.check_code(
+            await r_code.is_valid_async(media_["mobile"], media_.get("code"))
+        )
+        user = await db.users.find_one({"mobile": media_["mobile"]})
+        queries.check_code(user is not None)
+        token = user_to_token(str(user["_id"]), user["name"], user["role"])
+        resp.media = {"token": token}
+
+
+class ProjectResource(object):
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.PROJECTS_POST)
+    async def on_post(self, req, resp):
+        media_ = await req.get_media()
+        employer = await find_user(req, "employer")
+        queries.check_role(employer, "employer", "post a project")
+        title = media_.get("title")
+        queries.check_unique(
+            "title", await db.projects.find_one(*queries.taken("title", title))
+        )
+        result = await db.projects.insert_one(
+            queries.new_project(media_, employer, req.context.user_id)
+        )
+        await response_cache.invalidate_async("projects")
+        resp.media = {"_id": result.inserted_id}
+
+    @falcon.before(
+        validate_req, schemas.PROJECTS_GET, require_all=False, produce_filter=True
+    )
+    @response_cache.cached_async("projects")
+    async def on_get(self, req, resp):
+        if req.context.params.get("q") is not None:
+            with queries.searching():
+                resp.media = await queries.search_projects(
+                    list_db.projects, req.context.params, req.context.filter
+                ).to_list(None)
+            return
+        filter_ = queries.projects_page(req.context.params, req.context.filter)
+        skip = req.context.params.get("skip")
+        limit = req.context.params.get("limit")
+        # a cursor param (blank on the first page) asks for X-Next-Cursor
+        if "cursor" in req.context.params:
+            last = await cursors.boundary(
+                list_db.projects, filter_, queries.PROJECTS_SORT, skip + limit - 1
+            )
+            cursors.set_next(resp, last, "_id")
+        projects = list_db.projects.find(
+            filter_,
+            skip=skip,
+            limit=limit,
+            sort=queries.PROJECTS_SORT,
+            projection=fields.projection(req.context.params["fields"]),
+        )
+        media.stream_array_async(resp, projects)
+
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.PROJECTS_FEED_GET, require_all=False)
+    async def on_get_feed(self, req, resp):
+        queries.check_role(
+            claimed_user(req, "employee") is not False, "employee", "have a feed"
+        )
+        employee = await db.users.find_one(
+            {"_id": req.context.user_id, "role": "employee"},
+            projection={"skills": 1},
+        )
+        queries.check_role(employee, "employee", "have a feed")
+        projects = list_db.projects.aggregate(
+            queries.feed_pipeline(employee, req.context.params)
+        )
+        media.stream_array_async(resp, projects)
+
+    @response_cache.cached_async("project:{_id}")
+    async def on_get__id(self, req: Request, resp: Response, _id: ObjectId):
+        project = await db.projects.find_one({"_id": _id})
+        queries.check_found(project, description="project not found")
+        resp.media = project
+
+    @falcon.before(validate_req, schemas.PROJECTS_PATCH, require_all=False)
+    @falcon.before(auth)
+    async def on_patch(self, req, resp):
+        project_id = req.context.params.get("_id")
+        # employee performs this action
+        if req.context.params.get("action") == "assign":
+            employee = await find_user(req, "employee")
+            queries.check_role(
+                employee, "employee", "accept project", falcon.errors.HTTPUnauthorized
+            )
+            result = await queries.assign(db, project_id, employee)
+            queries.check_found(
+                result.matched_count, description="no new project found"
+            )
+            # the employee is a member now
+            await membership.invalidate_async(project_id)
+            await ranking.assigned(db, employee["_id"])
+            await response_cache.invalidate_async(*queries.project_tags(project_id))
+            resp.media = result.raw_result
+        # employer performs this action
+        elif (
+            req.context.params.get("action") == "update"
+            and req.context.params.get("update") is not None
+        ):
+            result = await queries.update(db, project_id, req.context.params["update"])
+            queries.check_found(result.matched_count, description="project not found")
+            await response_cache.invalidate_async(*queries.project_tags(project_id))
+            resp.media = result.raw_result
+        # employer performs this action
+        elif req.context.params.get("action") == "done":
+            project = await queries.done(db, project_id, req.context.user_id)
+            queries.check_found(
+                project, description="no assigned project found for you"
+            )
+            await ranking.done(db, project["employee"]["_id"])
+            await response_cache.invalidate_async(
+                *queries.project_tags(project["_id"])
+            )
+            resp.media = {"_id": project["_id"], "state": "done"}
+
+
+class _BlockingStream(object):
+    """
+        the body of an asgi request as a blocking file, for the multipart
+        parser in a worker thread. every read waits for the loop to receive
+        the data, so the body is read as it is parsed, never spooled.
+    """
+
+    def __init__(self, stream, loop):
+        self._stream = stream
+        self._loop = loop
+
+    def read(self, size=-1) -> bytes:
+        return asyncio.run_coroutine_threadsafe(
+            self._stream.read(size), self._loop
+        ).result()
+
+
+async def _read_blob(digest: str, start: int, length: int):
+    f = await run_sync(storage.backend.open, digest, start, length)
+    try:
+        while True:
+            data = await run_sync(f.read, FILE_BLOCK_SIZE)
+            if not data:
+                break
+            yield data
+    finally:
+        await run_sync(f.close)
+
+
+class FileResource(object):
+    @falcon.before(auth)
+    async def on_post(self, req: Request, resp: Response):
+        queries.check_multipart(req)
+        # falcon has no async multipart parser yet; the sync one is run
+        # in a worker thread on the body, as it arrives.
+        uploads.check_length(req)
+        loop = asyncio.get_running_loop()
+        user_id = req.context.user_id
+
+        def authorize(project_id, kind):
+            # called by uploads.receive in the worker thread
+            return asyncio.run_coroutine_threadsafe(
+                uploads.limit_async(db, project_id, user_id, kind), loop
+            ).result()
+
+        form = form_handler.deserialize(
+            _BlockingStream(req.stream, loop), req.content_type, req.content_length
+        )
+        # run_in_executor does not copy the context, so the writes in the
+        # worker thread are out of the request's budget already
+        file_, pending = await run_sync(uploads.receive, form, authorize)
+        # the upload took the client's time, not the server's
+        deadlines.restart(req)
+        reserved = await uploads.reserve(db, file_['project_id'], pending.size)
+        if not reserved.matched_count:
+            await run_sync(storage.backend.discard, pending)
+            raise falcon.HTTPPayloadTooLarge(title='the project is out of space')
+        try:
+            file_['digest'] = await run_sync(storage.backend.commit, pending)
+        except BaseException:
+            await uploads.refund(db, file_['project_id'], pending.size)
+            raise
+        file_['size'] = pending.size
+        try:
+            result = await db.files.insert_one(file_)
+        except BaseException:
+            await run_sync(storage.backend.release, file_['digest'])
+            await uploads.refund(db, file_['project_id'], pending.size)
+            raise
+        resp.status = falcon.HTTP_201
+        resp.media = {'_id': result.inserted_id}
+
+    @falcon.before(auth, optional=True)
+    async def on_get__id(self, req: Request, resp: Response, _id: ObjectId):
+        file_ = await db.files.find_one({'_id': _id})
+        queries.check_found(file_, title='no such file found')
+        if queries.members_only(req, file_['kind']):
+            queries.check_member(await membership.role_async(
+                db, file_['project_id'], req.context.user_id
+            ))
+        range_ = queries.send_file(req, resp, file_)
+        if range_ is not None:
+            resp.stream = _read_blob(file_['digest'], *range_)
+
+    @falcon.before(auth, optional=True)
+    @falcon.before(
+        validate_req, schemas.FILES_GET, produce_filter=True, require_all=False
+    )
+    async def on_get(self, req: Request, resp: Response):
+        filter_ = queries.project_filter(req)
+        if queries.members_only(req, req.context.params['kind']):
+            queries.check_member(await membership.role_async(
+                db, filter_['project_id'], req.context.user_id
+            ))
+        media.stream_array_async(resp, list_db.files.find(
+            filter_, projection=fields.projection(req.context.params['fields']),
+        ))
+
+
+class MessageResource(object):
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.MESSAGES_POST)
+    async def on_post(self, req: Request, resp: Response):
+        sender_role = await membership.role_async(
+            db, req.context.params['project_id'], req.context.user_id
+        )
+        queries.check_member(sender_role)
+        user = await find_user(req)
+        if user is None:
+            raise falcon.errors.HTTPUnauthorized()
+        message = queries.new_message(req.context.params, user)
+        result = await db.messages.insert_one(message)
+        await unread.sent(db, message['project_id'], sender_role)
+        await realtime.hub_async.publish(message['project_id'])
+        resp.status = falcon.HTTP_CREATED
+        resp.media = {"_id": result.inserted_id, 'project_id': message['project_id']}
+
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.MESSAGES_PATCH)
+    async def on_patch(self, req: Request, resp: Response):
+        """
+            mark the messages of the other member seen, up to until.
+        """
+        project_id = req.context.params['project_id']
+        role = await membership.role_async(db, project_id, req.context.user_id)
+        queries.check_member(role)
+        until = await db.messages.find_one(*queries.until(req.context.params))
+        queries.check_found(until, title='no such message found')
+        result = await db.messages.update_many(
+            unread.unseen_filter(project_id, req.context.user_id, until),
+            {'$set': {'seen': True}},
+        )
+        if result.modified_count:
+            await unread.seen(db, project_id, role, result.modified_count)
+        resp.media = {'seen': result.modified_count}
+
+    @falcon.before(auth)
+    async def on_get_unread(self, req: Request, resp: Response):
+        """
+            [{project_id, unread}] of every project of the user.
+        """
+        projects = await db.projects.find(
+            unread.member_projects_filter(req.context.user_id),
+            projection={'employer._id': 1},
+        ).to_list(None)
+        counters = await db.unread.find(
+            {'_id': {'$in': [p['_id'] for p in projects]}}
+        ).to_list(None)
+        resp.media = unread.counts(projects, counters, req.context.user_id)
+
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.MESSAGES_GET, produce_filter=True)
+    async def on_get(self, req: Request, resp: Response):
+        filter_ = queries.project_filter(req)
+        queries.check_member(await membership.role_async(
+            db, filter_['project_id'], req.context.user_id
+        ))
+        filter_ = queries.messages_page(req.context.params, filter_)
+        skip, limit = req.context.params['skip'], req.context.params['limit']
+        oldest = await cursors.boundary(
+            db.messages, filter_, queries.MESSAGES_NEWEST_FIRST, skip + limit - 1
+        )
+        if oldest is not None:
+            cursors.set_next(resp, oldest, 'creation_datetime', '_id')
+            filter_ = queries.messages_from(filter_, oldest)
+        elif skip:
+            newest = await cursors.boundary(
+                db.messages, filter_, queries.MESSAGES_NEWEST_FIRST, skip
+            )
+            if newest is None:
+                resp.media = []
+                return
+            filter_ = queries.messages_to(filter_, newest)
+        messages = db.messages.find(
+            filter_, limit=limit, sort=queries.MESSAGES_OLDEST_FIRST,
+            projection=fields.projection(req.context.params['fields']),
+        )
+        media.stream_array_async(resp, messages)
+
+    @falcon.before(auth)
+    @falcon.before(validate_req, schemas.MESSAGES_POLL_GET)
+    async def on_get_poll(self, req: Request, resp: Response):
+        """
+            long-poll of the messages after since, oldest first.
+        """
+        project_id = queries.project_id(req.context.params)
+        queries.check_member(
+            await membership.role_async(db, project_id, req.context.user_id)
+        )
+        since = queries.poll_since(req.context.params)
+        if since is None:
+            # only messages from now on
+            since = queries.newest_keys(await cursors.boundary(
+                db.messages, queries.poll_filter(project_id, None),
+                queries.MESSAGES_NEWEST_FIRST, 0
+            ))
+        filter_ = queries.poll_filter(project_id, since)
+        limit = req.context.params['limit']
+        event = realtime.hub_async.subscribe(project_id)
+        try:
+            messages = await db.messages.find(
+                filter_, limit=limit, sort=queries.MESSAGES_OLDEST_FIRST
+            ).to_list(None)
+            if not messages:
+                # the wait is not work of the server
+                with metrics.waiting(req):
+                    woke = await realtime.wait_async(
+                        event, req.context.params['timeout']
+                    )
+                if woke:
+                    deadlines.restart(req)
+                    messages = await db.messages.find(
+                        filter_, limit=limit, sort=queries.MESSAGES_OLDEST_FIRST
+                    ).to_list(None)
+        finally:
+            realtime.hub_async.unsubscribe(project_id)
+        queries.set_poll_next(resp, messages, since)
+        resp.media = messages
+
+
+class MetricsResource(object):
+    async def on_get(self, req, resp):
+        metrics.authorize(req)
+        resp.content_type = "text/plain; version=0.0.4"
+        resp.body = metrics.registry.exposition()
+
+
+class TestResource(object):
+    async def on_get(self, req, resp):
+        resp.media = {"ok": True}
+
+
+def create_app(is_testing=False):
+    global db, list_db, global_is_testing
+    # the motor client is made on the first query, inside the worker's loop
+    if is_testing:
+        print("test db (asgi)")
+        name = "test_oohoom"
+        global_is_testing = True
+    else:
+        print("production db (asgi)")
+        name = "oohoom"
+    db = connections.database_async(name)
+    list_db = connections.database_async(name, LIST_READ_PREFERENCE)
+
+    # the redis tiers of the caches are called with run_in_executor
+    membership.cache = membership.from_config()
+    response_cache.cache = response_cache.from_config()
+    # the backends block; they are called with run_sync
+    storage.backend = storage.from_config(connections.database(name))
+
+    app = falcon.asgi.App(middleware=middlewares.create(is_testing))
+    app.add_error_handler(deadlines.TIMEOUTS, deadlines.handle_timeout_async)
+
+    return configure(
+        app,
+        {
+            "test": TestResource(),
+            "metrics": MetricsResource(),
+            "user": UserResource(),
+            "code": CodeResource(),
+            "token": TokenResource(),
+            "project": ProjectResource(),
+            "file": FileResource(),
+            "message": MessageResource(),
+        },
+    )
@@ -0,0 +1,186 @@
+"""
+    gzip / brotli of responses, negotiated from Accept-Encoding.
+
+    a streamed body is compressed chunk by chunk, so it is never gathered.
+    brotli is offered when the brotli package is installed.
+"""
+import inspect
+import zlib
+
+from .constants import BROTLI_QUALITY, GZIP_LEVEL
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# in order of preference
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# bytes read at a time from a file-like stream
+READ_SIZE = 64 * 1024
+
+
+def compressible(content_type) -> bool:
+    if not content_type:
+        return False
+    content_type = content_type.split(";")[0].strip().lower()
+    return (
+        content_type.startswith("text/")
+        or content_type in COMPRESSIBLE_TYPES
+        or content_type.endswith("+json")
+        or content_type.endswith("+xml")
+    )
+
+
+def skip(resp) -> None:
+    """
+        send resp as it is, e.g. a .gz download.
+    """
+    resp.context.compress = False
+
+
+def skipped(resp) -> bool:
+    return getattr(resp.context, "compress", True) is False
+
+
+def negotiate(accept_encoding: str, encodings=ENCODINGS):
+    """
+        the preferred of encodings that accept_encoding accepts, or None.
+    """
+    qvalues = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qvalues[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for coding in encodings:
+        q = qvalues.get(coding, qvalues.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def _compressor(encoding: str):
+    # (compress, finish)
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits 31: a gzip header and trailer
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    compress_, finish = _compressor(encoding)
+    return compress_(data) + finish()
+
+
+def chunks(stream):
+    """
+        the chunks of a stream, iterable or file-like, closed at the end.
+    """
+    try:
+        if hasattr(stream, "read"):
+            while True:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                yield data
+        else:
+            yield from stream
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+
+
+def head(chunks_, size: int):
+    """
+        the first chunks, up to size bytes or more.
+        (head, complete): complete if chunks_ ended within size.
+    """
+    head_ = []
+    length = 0
+    for chunk in chunks_:
+        head_.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            return head_, False
+    return head_, True
+
+
+def compress_chunks(head_, chunks_, encoding: str):
+    compress_, finish = _compressor(encoding)
+    try:
+        for chunk in head_:
+            data = compress_(chunk)
+            if data:
+                yield data
+        for chunk in chunks_:
+            data = compress_(chunk)
+            if data:
+                yield data
+    finally:
+        chunks_.close()
+    yield finish()
+
+
+async def chunks_async(stream):
+    try:
+        if hasattr(stream, "read"):
+            while True:
+                data = await stream.read(READ_SIZE)
+                if not data:
+                    break
+                yield data
+        else:
+            async for chunk in stream:
+                yield chunk
+    finally:
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+        elif hasattr(stream, "close"):
+            closed = stream.close()
+            if inspect.isawaitable(closed):
+                await closed
+
+
+async def head_async(chunks_, size: int):
+    head_ = []
+    length = 0
+    async for chunk in chunks_:
+        head_.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            return head_, False
+    return head_, True
+
+
+async def compress_chunks_async(head_, chunks_, encoding: str):
+    compress_, finish = _compressor(encoding)
+    try:
+        for chunk in head_:
+            data = compress_(chunk)
+            if data:
+                yield data
+        async for chunk in chunks_:
+            data = compress_(chunk)
+            if data:
+                yield data
+    finally:
+        await chunks_.aclose()
+    yield finish()
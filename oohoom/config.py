@@ -0,0 +1,79 @@
+"""
+    optional settings with their defaults.
+    local_config.py may override any of them.
+"""
+import os
+
+from . import local_config
+
+# mongodb, see connections.py. None leaves the driver default.
+MONGO_URI = getattr(local_config, "MONGO_URI", "mongodb://localhost:27017")
+MONGO_MAX_POOL_SIZE = getattr(local_config, "MONGO_MAX_POOL_SIZE", 100)
+MONGO_MIN_POOL_SIZE = getattr(local_config, "MONGO_MIN_POOL_SIZE", 0)
+MONGO_CONNECT_TIMEOUT_MS = getattr(local_config, "MONGO_CONNECT_TIMEOUT_MS", None)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = getattr(
+    local_config, "MONGO_SERVER_SELECTION_TIMEOUT_MS", None
+)
+MONGO_SOCKET_TIMEOUT_MS = getattr(local_config, "MONGO_SOCKET_TIMEOUT_MS", None)
+# read preference of the list GETs (users, projects, the feed and files),
+# e.g. "secondaryPreferred" to take them off the primary; they may then lag
+# the writes a little. messages and everything else read the primary.
+LIST_READ_PREFERENCE = getattr(local_config, "LIST_READ_PREFERENCE", "primary")
+
+REDIS_HOST = getattr(local_config, "REDIS_HOST", "localhost")
+REDIS_PORT = getattr(local_config, "REDIS_PORT", 6379)
+
+# redis db of the project membership cache shared by workers.
+# None keeps the cache in process memory only.
+MEMBERSHIP_REDIS_DB = getattr(local_config, "MEMBERSHIP_REDIS_DB", None)
+
+# connection pools of the redis clients
+REDIS_MAX_CONNECTIONS = getattr(local_config, "REDIS_MAX_CONNECTIONS", 50)
+REDIS_SOCKET_TIMEOUT = getattr(local_config, "REDIS_SOCKET_TIMEOUT", 5)  # seconds
+
+# verification codes: "redis", or "local" for an in-process stand-in
+# (tests and benchmarks without a redis server; not shared by workers)
+R_CODE_BACKEND = getattr(local_config, "R_CODE_BACKEND", "redis")
+R_CODE_REDIS_DB = getattr(local_config, "R_CODE_REDIS_DB", 2)
+
+# verification sms queue: "redis", or "local" for an in-process stand-in
+# (the worker must then run in the same process, e.g. in tests)
+SMS_QUEUE_BACKEND = getattr(local_config, "SMS_QUEUE_BACKEND", "redis")
+SMS_REDIS_DB = getattr(local_config, "SMS_REDIS_DB", 3)
+
+# rate limits: "redis", or "local" for per process buckets
+RATE_LIMIT_BACKEND = getattr(local_config, "RATE_LIMIT_BACKEND", "redis")
+RATE_LIMIT_REDIS_DB = getattr(local_config, "RATE_LIMIT_REDIS_DB", 4)
+# take the client ip from X-Forwarded-For; only behind proxies that append
+# to it. the number of them in front of the app (True is one).
+TRUST_FORWARDED = getattr(local_config, "TRUST_FORWARDED", False)
+
+# load shedding: requests a worker process handles at once, and the longest
+# wait in the proxy queue (X-Request-Start: t=<epoch seconds>), in seconds.
+# None disables either.
+MAX_IN_FLIGHT = getattr(local_config, "MAX_IN_FLIGHT", None)
+MAX_QUEUE_WAIT = getattr(local_config, "MAX_QUEUE_WAIT", None)
+
+# the budget of a request in seconds; every mongodb and redis call gets what
+# is left of it (see deadlines.py). a client may ask for less with
+# X-Request-Timeout. None disables it.
+REQUEST_DEADLINE = getattr(local_config, "REQUEST_DEADLINE", 10)
+
+# requests slower than this many seconds are logged with their query shapes
+# to the oohoom.slow logger; None disables the log
+SLOW_REQUEST = getattr(local_config, "SLOW_REQUEST", 0.5)
+# /v1/metrics answers "Authorization: Bearer <METRICS_TOKEN>" only; None
+# disables it. it shows the query shapes and the redis commands of the app.
+METRICS_TOKEN = getattr(local_config, "METRICS_TOKEN", None)
+
+# response cache of the public read routes:
+# None turns it off, "local" keeps it in process memory (exact only with a
+# single worker process), "redis" shares it and its invalidations between
+# workers through RESPONSE_CACHE_REDIS_DB
+RESPONSE_CACHE = getattr(local_config, "RESPONSE_CACHE", None)
+RESPONSE_CACHE_REDIS_DB = getattr(local_config, "RESPONSE_CACHE_REDIS_DB", 5)
+
+# uploaded files, see storage.py: "local" keeps them under STORAGE_PATH,
+# "gridfs" in the mongodb database
+STORAGE_BACKEND = getattr(local_config, "STORAGE_BACKEND", "local")
+STORAGE_PATH = getattr(local_config, "STORAGE_PATH", os.path.join("uploads", "files"))
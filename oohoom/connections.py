@@ -0,0 +1,164 @@
+"""
+    the mongodb and redis clients of a process, made on first use.
+
+    a MongoClient starts monitor threads and a pool of sockets, which a
+    forked worker must not inherit (gunicorn --preload imports the app
+    before the fork). the databases here are handles; the client behind
+    them is made on the first command of each process, and made again in
+    a child after fork.
+
+    redis pools open their connections on the first command too, and
+    redis-py drops the ones of the parent after fork.
+"""
+import os
+import threading
+
+import redis
+import redis.asyncio
+from pymongo import MongoClient, ReadPreference
+
+from . import deadlines, metrics
+from .config import (
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_URI,
+    REDIS_HOST,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_PORT,
+    REDIS_SOCKET_TIMEOUT,
+)
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def mongo_options() -> dict:
+    options = dict(
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+    )
+    options = {key: value for key, value in options.items() if value is not None}
+    options["event_listeners"] = [metrics.CommandTimer()]
+    return options
+
+
+class ProcessClient(object):
+    """
+        one client per process, made by factory on first use.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._pid = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    # the client of the parent is left alone; its sockets
+                    # and threads belong to the parent
+                    self._client = self.factory()
+                    self._pid = pid
+        return self._client
+
+    @property
+    def created(self) -> bool:
+        return self._pid == os.getpid()
+
+
+def _motor_client():
+    # imported here, the wsgi app doesn't need motor
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(MONGO_URI, **mongo_options())
+
+
+mongo = ProcessClient(lambda: MongoClient(MONGO_URI, **mongo_options()))
+motor = ProcessClient(_motor_client)
+
+
+class Database(object):
+    """
+        a database of client, resolved on each use: db.users, db["users"]
+        and the other attributes are those of the pymongo (or motor)
+        database of the current process.
+    """
+
+    def __init__(self, client: ProcessClient, name: str, read_preference="primary"):
+        self._client = client
+        self._name = name
+        self._read_preference = READ_PREFERENCES[read_preference]
+        self._pid = None
+        self._db = None
+
+    def get(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            self._db = self._client.get().get_database(
+                self._name, read_preference=self._read_preference
+            )
+            self._pid = pid
+        return self._db
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __getitem__(self, name):
+        return self.get()[name]
+
+
+def database(name: str, read_preference="primary") -> Database:
+    return Database(mongo, name, read_preference)
+
+
+def database_async(name: str, read_preference="primary") -> Database:
+    return Database(motor, name, read_preference)
+
+
+def redis_options(db: int) -> dict:
+    return dict(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=db,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+    )
+
+
+def redis_client(db=0):
+    """
+        bound by the request deadline, see deadlines.py.
+    """
+    return deadlines.bound_redis(
+        metrics.instrument_redis(
+            redis.StrictRedis(connection_pool=redis.ConnectionPool(**redis_options(db)))
+        )
+    )
+
+
+def redis_client_async(db=0):
+    """
+        the connection is made on the first command, inside the running
+        event loop.
+    """
+    return deadlines.bound_redis(
+        metrics.instrument_redis(
+            redis.asyncio.StrictRedis(
+                connection_pool=redis.asyncio.ConnectionPool(**redis_options(db))
+            )
+        )
+    )
@@ -1 +1,59 @@
-LIMIT = 10
\ No newline at end of file
+LIMIT = 10
+
+# project membership cache, see membership.py
+MEMBERSHIP_TTL = 300  # seconds
+MEMBERSHIP_MAXSIZE = 10000
+
+# jwt, see jwt_user_id.py
+TOKEN_TTL = 90 * 24 * 3600  # seconds
+TOKEN_CACHE_TTL = 3600  # seconds, for tokens without exp
+TOKEN_CACHE_MAXSIZE = 10000
+
+# long-poll of new messages, see realtime.py
+POLL_TIMEOUT = 25  # seconds, under the usual 30s proxy timeout
+
+# verification codes, see r_code.py
+CODE_TTL = 3600  # seconds
+CODE_MAX_ATTEMPTS = 5  # wrong codes before the code is dropped
+
+# verification sms queue, see sms.py
+SMS_BATCH = 20  # jobs taken and sent together by the worker
+SMS_MAX_ATTEMPTS = 5
+SMS_BACKOFF = 2  # seconds, doubled on every failed attempt
+SMS_STATUS_TTL = 24 * 3600  # seconds
+
+# rate limits, see ratelimit.py.
+# (method, path) -> [(scope, tokens per second, burst)]; scope is ip, mobile
+# (of the json body) or route
+RATE_LIMITS = {
+    ("POST", "/v1/code"): [
+        ("ip", 1 / 10, 10),
+        ("mobile", 1 / 120, 5),
+        ("route", 20, 100),
+    ],
+    ("POST", "/v1/token"): [
+        ("ip", 1 / 2, 20),
+        ("mobile", 1 / 30, 10),
+        ("route", 50, 200),
+    ],
+    # registration checks a code too
+    ("POST", "/v1/users"): [("ip", 1 / 10, 10), ("mobile", 1 / 30, 10)],
+}
+
+# response cache of the public read routes, see response_cache.py
+RESPONSE_CACHE_TTL = 60  # seconds
+RESPONSE_CACHE_MAXSIZE = 1000
+
+# full text search of projects, see search.py
+SEARCH_MAX_TIME_MS = 2000  # a broader search is refused with a 503
+
+# response compression, see compression.py
+COMPRESS_MIN_SIZE = 1024  # bytes; smaller bodies are sent as they are
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # of 11; the slow ones are for static files
+
+# uploads, see uploads.py
+UPLOAD_MAX_SIZE = 50 * 1024 * 1024  # bytes, of a file
+PROJECT_FILES_MAX_SIZE = 500 * 1024 * 1024  # bytes, of all the files of a project
+UPLOAD_MAX_PARTS = 8  # of a multipart/form-data body
+UPLOAD_MAX_TEXT_SIZE = 1024  # bytes, of project_id, kind and the part headers
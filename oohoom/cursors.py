@@ -0,0 +1,121 @@
+"""
+    opaque keyset cursors for list endpoints.
+    a cursor holds the sort keys of the last document of a page; the next page
+    starts right after it, so deep pages cost the same as the first one.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+import bson
+import falcon
+from bson import ObjectId
+from bson.errors import BSONError
+from pymongo import ASCENDING, DESCENDING
+
+# response header carrying the cursor of the next page
+HEADER = "X-Next-Cursor"
+
+# the sort keys of the cursors, and the types of their values
+KEY_TYPES = {"_id": ObjectId, "rank": int, "creation_datetime": datetime}
+# the keys a document may lack, e.g. rank before migration 4. mongodb sorts
+# a missing key as null, below every value, and a cursor holds it as None
+NULLABLE_KEYS = {"rank"}
+
+
+def encode(*values) -> str:
+    return base64.urlsafe_b64encode(bson.encode({"k": list(values)})).decode("ascii")
+
+
+def _valid(key: str, value) -> bool:
+    if value is None:
+        return key in NULLABLE_KEYS
+    # bool is an int too
+    return isinstance(value, KEY_TYPES[key]) and not isinstance(value, bool)
+
+
+def decode(cursor: str, *keys) -> list:
+    """
+        the values of keys in cursor.
+        they go into filters as they are, so anything but a value of the
+        key's type (e.g. {"$where": ...}) is refused.
+    """
+    try:
+        values = bson.decode(base64.urlsafe_b64decode(cursor.encode("ascii")))["k"]
+    except (BSONError, binascii.Error, KeyError, TypeError, ValueError):
+        raise falcon.errors.HTTPBadRequest(description={"cursor": "invalid cursor"})
+    if (
+        not isinstance(values, list)
+        or len(values) != len(keys)
+        or not all(_valid(key, value) for key, value in zip(keys, values))
+    ):
+        raise falcon.errors.HTTPBadRequest(description={"cursor": "invalid cursor"})
+    return values
+
+
+def _compare(direction, inclusive=False) -> str:
+    return ("$gt" if direction == ASCENDING else "$lt") + ("e" if inclusive else "")
+
+
+def _and(filter_: dict, condition: dict) -> dict:
+    if "$or" in filter_ and "$or" in condition:
+        return {"$and": [filter_, condition]}
+    return dict(filter_, **condition)
+
+
+def after_id(filter_: dict, cursor, direction) -> dict:
+    """
+        filter_ for the page after cursor, sorted by _id.
+    """
+    if not cursor:
+        return filter_
+    (_id,) = decode(cursor, "_id")
+    return dict(filter_, _id={_compare(direction): _id})
+
+
+def key_id_from(filter_: dict, key: str, value, _id, direction, inclusive=False):
+    """
+        filter_ for the documents after (value, _id), sorted by (key, _id).
+        _id breaks ties between documents with the same key.
+    """
+    # {key: None} matches the documents without the key too
+    same = {key: value, "_id": {_compare(direction, inclusive): _id}}
+    if value is None:
+        if direction == DESCENDING:
+            # the nulls come last
+            return _and(filter_, same)
+        return _and(filter_, {"$or": [{key: {"$ne": None}}, same]})
+    after = [{key: {_compare(direction): value}}, same]
+    if direction == DESCENDING and key in NULLABLE_KEYS:
+        # $lt matches no null
+        after.append({key: None})
+    return _and(filter_, {"$or": after})
+
+
+def after_key_id(filter_: dict, cursor, key: str, direction) -> dict:
+    """
+        filter_ for the page after cursor, sorted by (key, _id).
+    """
+    if not cursor:
+        return filter_
+    value, _id = decode(cursor, key, "_id")
+    return key_id_from(filter_, key, value, _id, direction)
+
+
+def boundary(collection, filter_: dict, sort: list, skip: int):
+    """
+        sort keys of the document at skip, or None.
+        only the keys are projected, so an index on them covers the query.
+    """
+    return collection.find_one(
+        filter_, projection={key: 1 for key, _ in sort}, sort=sort, skip=skip
+    )
+
+
+def set_next(resp, last, *keys) -> None:
+    """
+        the cursor of the next page is built from the last document of this one.
+    """
+    if last is not None:
+        values = (last.get(key) if key in NULLABLE_KEYS else last[key] for key in keys)
+        resp.set_header(HEADER, encode(*values))
@@ -0,0 +1,276 @@
+"""
+    request deadlines.
+
+    the deadline middleware gives a request a budget: REQUEST_DEADLINE
+    seconds, or less when the client asks with X-Request-Timeout, counted
+    from when the proxy queued it (X-Request-Start). within it
+    - a mongodb operation gets maxTimeMS and socket timeouts from what is
+      left (pymongo.timeout);
+    - a redis command of connections.redis_client is refused when nothing
+      is left, and an async one is cancelled when the budget runs out;
+      a sync one is bounded by REDIS_SOCKET_TIMEOUT.
+    a request with no budget left is refused with a 503 before it starts;
+    one that runs out while it works gets a 504. a streamed body that runs
+    out is cut short; its status is already sent, unless it is exempt: a
+    file download is paced by the client, not by the server's work.
+"""
+import asyncio
+import contextlib
+import contextvars
+import inspect
+import threading
+import time
+
+import falcon
+import pymongo
+import redis
+from pymongo.errors import ExecutionTimeout, NetworkTimeout, ServerSelectionTimeoutError
+
+HEADER = "X-Request-Timeout"
+
+# time.monotonic() of the current request's deadline
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+        the budget of the request ran out.
+    """
+
+
+# what a request that ran out of budget raises
+TIMEOUTS = (
+    DeadlineExceeded,
+    ExecutionTimeout,
+    NetworkTimeout,
+    ServerSelectionTimeoutError,
+    redis.exceptions.TimeoutError,
+)
+
+
+class Stats(object):
+    def __init__(self):
+        self.refused = 0
+        self.exceeded = 0
+        self._lock = threading.Lock()
+
+    def refuse(self) -> None:
+        with self._lock:
+            self.refused += 1
+
+    def exceed(self) -> None:
+        with self._lock:
+            self.exceeded += 1
+
+
+stats = Stats()
+
+
+def remaining():
+    """
+        seconds left of the current request's budget, None without one.
+    """
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class Scope(object):
+    """
+        the deadline of the code run between enter() and exit().
+    """
+
+    def __init__(self, deadline: float, budget: float):
+        self.deadline = deadline
+        self.budget = budget
+        self._token = None
+        self._timeout = None
+
+    def enter(self) -> None:
+        left = self.deadline - time.monotonic()
+        # pymongo.timeout(0) would mean no timeout at all
+        if left <= 0:
+            raise DeadlineExceeded()
+        self._token = _deadline.set(self.deadline)
+        self._timeout = pymongo.timeout(left)
+        self._timeout.__enter__()
+
+    def exit(self) -> None:
+        if self._timeout is not None:
+            self._timeout.__exit__(None, None, None)
+            self._timeout = None
+        if self._token is not None:
+            _deadline.reset(self._token)
+            self._token = None
+
+    def __enter__(self):
+        self.enter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.exit()
+
+
+def start(req, budget: float, waited=0.0) -> None:
+    """
+        the budget of req, less what it waited in the proxy queue.
+        raises DeadlineExceeded if nothing is left.
+    """
+    scope = Scope(time.monotonic() + budget - waited, budget)
+    scope.enter()
+    req.context.deadline = scope
+
+
+def restart(req) -> None:
+    """
+        a fresh budget for req, e.g. after the wait of a long-poll or after
+        an upload, which are not work of the server.
+    """
+    scope = getattr(req.context, "deadline", None)
+    if scope is not None:
+        scope.exit()
+        scope.deadline = time.monotonic() + scope.budget
+        scope.enter()
+
+
+@contextlib.contextmanager
+def paused(req):
+    """
+        run a block paced by the client, e.g. the write of an upload to
+        GridFS, out of the budget of req; the budget starts over after it.
+    """
+    scope = getattr(req.context, "deadline", None)
+    if scope is None:
+        yield
+        return
+    scope.exit()
+    try:
+        yield
+    finally:
+        scope.deadline = time.monotonic() + scope.budget
+        scope.enter()
+
+
+def finish(req):
+    """
+        leave the scope of req. returns its deadline, None without one.
+    """
+    scope = getattr(req.context, "deadline", None)
+    if scope is None:
+        return None
+    scope.exit()
+    return scope.deadline
+
+
+def exempt(req) -> None:
+    """
+        the streamed body of req is not bound by its deadline.
+    """
+    req.context.no_deadline = True
+
+
+def is_exempt(req) -> bool:
+    return getattr(req.context, "no_deadline", False)
+
+
+def within(deadline: float, chunks):
+    """
+        the chunks of a streamed body, each pulled within deadline.
+    """
+    chunks = iter(chunks)
+    try:
+        while True:
+            with Scope(deadline, 0):
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+            yield chunk
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+async def within_async(deadline: float, chunks):
+    try:
+        while True:
+            with Scope(deadline, 0):
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield chunk
+    finally:
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+
+
+def bound_redis(client):
+    """
+        bound every command of client (a command, a script or a pipeline)
+        by the budget of the current request. returns client.
+    """
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def check():
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded()
+        return left
+
+    if inspect.iscoroutinefunction(execute_command):
+
+        async def bound(execute, *args, **options):
+            left = check()
+            if left is None:
+                return await execute(*args, **options)
+            try:
+                return await asyncio.wait_for(execute(*args, **options), left)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded() from None
+
+        async def bound_command(*args, **options):
+            return await bound(execute_command, *args, **options)
+
+        def bound_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def bound_execute(*args, **kwargs):
+                return await bound(execute, *args, **kwargs)
+
+            pipe.execute = bound_execute
+            return pipe
+
+    else:
+
+        def bound_command(*args, **options):
+            check()
+            return execute_command(*args, **options)
+
+        def bound_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def bound_execute(*args, **kwargs):
+                check()
+                return execute(*args, **kwargs)
+
+            pipe.execute = bound_execute
+            return pipe
+
+    client.execute_command = bound_command
+    client.pipeline = bound_pipeline
+    return client
+
+
+def handle_timeout(req, resp, ex, params):
+    """
+        error handler of TIMEOUTS: a 504.
+    """
+    stats.exceed()
+    raise falcon.HTTPGatewayTimeout(description="The request ran out of time.")
+
+
+async def handle_timeout_async(req, resp, ex, params):
+    handle_timeout(req, resp, ex, params)
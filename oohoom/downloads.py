@@ -0,0 +1,122 @@
+"""
+    conditional and partial GET of uploaded files.
+    files are content addressed (see storage.py), so their sha-256 digest is
+    a strong validator.
+"""
+import io
+from datetime import datetime
+
+import falcon
+
+
+def _if_range_matches(req, tag: str, last_modified: datetime) -> bool:
+    value = req.get_header("If-Range")
+    if value is None:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        # only a strong comparison may validate a range
+        return value == '"{}"'.format(tag)
+    try:
+        validator = req.get_header_as_datetime("If-Range")
+    except falcon.HTTPInvalidHeader:
+        return False
+    # an exact match; a date is a weak validator otherwise
+    return validator == last_modified
+
+
+def _not_modified(req, tag: str, last_modified: datetime) -> bool:
+    if_none_match = req.if_none_match
+    if if_none_match:
+        return any(other == "*" or other == tag for other in if_none_match)
+    if_modified_since = req.if_modified_since
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def prepare(req, resp, tag: str, size: int, last_modified: datetime):
+    """
+        set the validators and the status of a file download.
+        returns the (start, length) to send, or None for a 304.
+    """
+    # http dates have a resolution of a second
+    last_modified = last_modified.replace(microsecond=0)
+    resp.etag = tag
+    resp.last_modified = last_modified
+    resp.accept_ranges = "bytes"
+
+    if _not_modified(req, tag, last_modified):
+        resp.status = falcon.HTTP_NOT_MODIFIED
+        # a 304 has no content to describe
+        if resp.content_type is not None:
+            del resp.content_type
+        return None
+
+    try:
+        range_ = req.range
+    except falcon.HTTPInvalidHeader:
+        # multiple ranges, or not a range; rfc 7233 says to ignore it
+        range_ = None
+    if (
+        range_ is None
+        or req.range_unit != "bytes"
+        or not _if_range_matches(req, tag, last_modified)
+    ):
+        resp.content_length = size
+        return 0, size
+
+    first, last = range_
+    if first < 0:
+        # the last -first bytes
+        first = max(size + first, 0)
+        last = size - 1
+    elif last < 0 or last >= size:
+        last = size - 1
+    if first >= size:
+        raise falcon.HTTPRangeNotSatisfiable(size)
+    if first > last:
+        # not a valid range; ignore it
+        resp.content_length = size
+        return 0, size
+
+    resp.status = falcon.HTTP_PARTIAL_CONTENT
+    resp.content_range = (first, last, size)
+    resp.content_length = last - first + 1
+    return first, last - first + 1
+
+
+class Range(object):
+    """
+        an open file (a file, a GridOut) read from start, no more than
+        length bytes.
+    """
+
+    def __init__(self, file_, start: int, length: int):
+        self._file = file_
+        if start:
+            self._file.seek(start)
+        self._remaining = length
+
+    def read(self, size=-1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class FileRange(Range):
+    """
+        a Range of the file at path.
+        fileno() is kept so a server's wsgi.file_wrapper can sendfile() it;
+        sendfile starts at the current offset and sends Content-Length bytes.
+    """
+
+    def __init__(self, path: str, start: int, length: int):
+        super().__init__(io.open(path, "rb"), start, length)
+
+    def fileno(self) -> int:
+        return self._file.fileno()
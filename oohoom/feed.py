@@ -0,0 +1,40 @@
+"""
+    the project feed of an employee: open projects ranked by how many of the
+    employee's skills they ask for.
+
+    candidates come from the multikey (state, skills) index, the skill ->
+    project inverted index, so only projects sharing a skill are read.
+    $sort followed by $limit keeps just the top skip + limit of them.
+"""
+from pymongo import DESCENDING
+
+
+def pipeline(skills: list, skip: int, limit: int, projection=None) -> list:
+    """
+        projection (of fields.projection) is applied to the page only.
+    """
+    if not skills:
+        # nothing to rank by; the newest open projects
+        stages = [
+            {"$match": {"state": "new"}},
+            {"$sort": {"_id": DESCENDING}},
+            {"$skip": skip},
+            {"$limit": limit},
+        ]
+    else:
+        stages = [
+            {"$match": {"state": "new", "skills": {"$in": skills}}},
+            {
+                "$addFields": {
+                    "score": {"$size": {"$setIntersection": ["$skills", skills]}}
+                }
+            },
+            {"$sort": {"score": DESCENDING, "_id": DESCENDING}},
+            {"$skip": skip},
+            {"$limit": limit},
+        ]
+        if projection:
+            projection = dict(projection, score=1)
+    if projection:
+        stages.append({"$project": projection})
+    return stages
@@ -0,0 +1,32 @@
+"""
+    sparse fieldsets of the list routes: ?fields=title,state
+
+    the names are checked against the route's allowlist and become the
+    mongodb projection, so the other fields are never sent by mongodb,
+    decoded or encoded. _id is always sent.
+"""
+
+
+def _names(value) -> list:
+    # "a,b" or a repeated param; sorted, so equal sets share a cache key
+    if isinstance(value, str):
+        value = value.split(",")
+    return sorted({name.strip() for name in value})
+
+
+def param(allowed: list, default: list) -> dict:
+    """
+        the schema of a fields param.
+        default is the compact fieldset of a list page.
+    """
+    return {
+        "type": "list",
+        "coerce": _names,
+        "allowed": allowed,
+        "minlength": 1,
+        "default": default,
+    }
+
+
+def projection(names: list) -> dict:
+    return {name: 1 for name in names}
@@ -1,23 +1,155 @@
+import threading
+
 import falcon
 from bson.objectid import ObjectId
 from cerberus import TypeDefinition, Validator
 
-from .jwt_user_id import token_to_user
+from .jwt_user_id import token_claims
+
+
+# params that page a listing, never part of the filter
+PAGING_KEYS = ("skip", "limit", "cursor")
+# nor is a search or a fieldset
+NON_FILTER_KEYS = PAGING_KEYS + ("q", "fields")
+
+
+class OohoomValidator(Validator):
+    types_mapping = Validator.types_mapping.copy()
+    types_mapping["objectid"] = TypeDefinition("objectid", (ObjectId,), ())
+
+
+class RouteSchema(object):
+    """
+        a route's schema, compiled once.
+        validators are not thread-safe, so every thread gets its own copy.
+    """
+
+    def __init__(
+        self, schema: dict, require_all=True, purge_unknown=True, produce_filter=False
+    ):
+        self.schema = schema
+        self.require_all = require_all
+        self.purge_unknown = purge_unknown
+        # keys that may end up in the filter, in schema order
+        self.filter_keys = (
+            tuple(key for key in schema if key not in NON_FILTER_KEYS)
+            if produce_filter
+            else None
+        )
+        self._local = threading.local()
+        # validate the schema now, not on the first request
+        self._compiled = self._new_validator().schema
+
+    def _new_validator(self):
+        return OohoomValidator(
+            getattr(self, "_compiled", self.schema),
+            require_all=self.require_all,
+            purge_unknown=self.purge_unknown,
+        )
+
+    @property
+    def validator(self) -> Validator:
+        try:
+            return self._local.validator
+        except AttributeError:
+            self._local.validator = self._new_validator()
+            return self._local.validator
+
+    def filter(self, d: dict) -> dict:
+        return {
+            key: d[key]
+            for key in self.filter_keys
+            if key in d and d[key] != "all"
+        }
+
+
+class SchemaRegistry(object):
+    """
+        keeps one RouteSchema per (schema, options).
+        schemas are the module level dicts of schemas.py, so they live as long
+        as the process and their id is a stable key.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, schema: dict, require_all=True, purge_unknown=True, produce_filter=False
+    ) -> RouteSchema:
+        key = (id(schema), require_all, purge_unknown, produce_filter)
+        route_schema = self._routes.get(key)
+        if route_schema is None:
+            with self._lock:
+                route_schema = self._routes.get(key)
+                if route_schema is None:
+                    route_schema = RouteSchema(
+                        schema, require_all, purge_unknown, produce_filter
+                    )
+                    self._routes[key] = route_schema
+        return route_schema
+
+    def __len__(self):
+        return len(self._routes)
+
+
+registry = SchemaRegistry()
 
 
 def auth(req, resp, resource, params, optional=False):
     """
         the route needs authentication.
-        it produces user_id.
+        it produces user_id and the token claims.
     """
-    user_id = token_to_user(req.auth)
-    if user_id == "":
+    claims = token_claims(req.auth)
+    if not claims:
         if optional:
             req.context.authenticated = False
             return
         raise falcon.errors.HTTPUnauthorized()
     req.context.authenticated = True
-    req.context.user_id = ObjectId(user_id)
+    req.context.user_id = ObjectId(claims["user_id"])
+    req.context.claims = claims
+
+
+def claimed_user(req, role=None):
+    """
+        {_id, name} of the authenticated user from the token claims.
+        False if the user hasn't the role,
+        None if the token has no name and role claims (ask the db).
+    """
+    claims = req.context.claims
+    if "name" not in claims or "role" not in claims:
+        return None
+    if role is not None and claims["role"] != role:
+        return False
+    return {"_id": req.context.user_id, "name": claims["name"]}
+
+
+def _method_document(req):
+    if req.method not in ["POST", "PUT", "PATCH", "GET"]:
+        raise falcon.errors.HTTPMethodNotAllowed(
+            ["POST", "PUT", "PATCH", "GET"],
+            description="parameter validation is not implemented for this method",
+        )
+    if req.method == "GET":
+        return req.params
+
+
+def _validate(req, d, schema, require_all, purge_unknown, produce_filter):
+    if d is None:
+        raise falcon.errors.HTTPUnsupportedMediaType(description="json is required")
+
+    route_schema = registry.get(schema, require_all, purge_unknown, produce_filter)
+    V = route_schema.validator
+
+    # validate() normalizes too; V.document is the normalized document
+    if not V.validate(d):
+        raise falcon.errors.HTTPBadRequest(description=V.errors)
+    d = V.document
+    req.context.params = d
+    if produce_filter:
+        req.context.filter = route_schema.filter(d)
 
 
 def validate_req(
@@ -30,33 +162,27 @@ def validate_req(
     purge_unknown=True,
     produce_filter=False,
 ):
-    if req.method in ["POST", "PUT", "PATCH"]:
-        if req.media is None:
-            raise falcon.errors.HTTPUnsupportedMediaType(description="json is required")
+    d = _method_document(req)
+    if req.method != "GET":
         d = req.media
-    elif req.method == "GET":
-        d = req.params
-    else:
-        raise falcon.errors.HTTPMethodNotAllowed(
-            ["POST", "PUT", "PATCH", "GET"],
-            description="parameter validation is not implemented for this method",
-        )
+    _validate(req, d, schema, require_all, purge_unknown, produce_filter)
 
-    objectid_type = TypeDefinition("objectid", (ObjectId,), ())
-    Validator.types_mapping["objectid"] = objectid_type
-    V = Validator(schema, require_all=require_all, purge_unknown=purge_unknown)
 
-    d = V.normalized(d)
-    req.context.params = d
-    if not V.validate(d):
-        raise falcon.errors.HTTPBadRequest(description=V.errors)
-    if produce_filter:
-        keys = d.keys()
-        filter_keys = []
-        for key in keys:
-            if d[key] != "all" and key not in ["skip", "limit"]:
-                filter_keys.append(key)
-        filter_ = {}
-        for filter_key in filter_keys:
-            filter_[filter_key] = d[filter_key]
-        req.context.filter = filter_
+async def auth_async(req, resp, resource, params, optional=False):
+    auth(req, resp, resource, params, optional=optional)
+
+
+async def validate_req_async(
+    req,
+    resp,
+    resource,
+    params,
+    schema: dict,
+    require_all=True,
+    purge_unknown=True,
+    produce_filter=False,
+):
+    d = _method_document(req)
+    if req.method != "GET":
+        d = await req.get_media()
+    _validate(req, d, schema, require_all, purge_unknown, produce_filter)
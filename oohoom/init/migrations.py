@@ -0,0 +1,275 @@
+"""
+    versioned, idempotent index migrations.
+    unlike init, they never drop anything, so they can run on a live database.
+
+    python -m oohoom.init.migrations [--testing] [--check]
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from .. import connections, ranking, search, storage, unread, uploads
+
+
+def _unique_indexes(db):
+    db.users.create_index("mobile", unique=True)
+    db.users.create_index("name", unique=True)
+    db.projects.create_index("title", unique=True)
+
+
+def _hot_query_indexes(db):
+    # ProjectResource.on_get filtered by state, newest first
+    db.projects.create_index([("state", ASCENDING), ("_id", DESCENDING)])
+    # membership checks of files and messages
+    db.projects.create_index("employer._id")
+    db.projects.create_index("employee._id", sparse=True)
+    # MessageResource.on_get, newest first with _id as the tie breaker
+    db.messages.create_index(
+        [
+            ("project_id", ASCENDING),
+            ("creation_datetime", DESCENDING),
+            ("_id", DESCENDING),
+        ]
+    )
+    # FileResource.on_get
+    db.files.create_index([("project_id", ASCENDING), ("kind", ASCENDING)])
+    # UserResource.on_get filtered by role (and state)
+    db.users.create_index(
+        [("role", ASCENDING), ("state", ASCENDING), ("_id", ASCENDING)]
+    )
+
+
+def _skills_index(db):
+    # the skill -> project inverted index of ProjectResource.on_get_feed.
+    # multikey, so mongodb keeps it up to date on insert and on $set of skills.
+    db.projects.create_index([("state", ASCENDING), ("skills", ASCENDING)])
+
+
+def _rank_index(db):
+    # UserResource.on_get, best ranked first with _id as the tie breaker
+    db.users.create_index(
+        [
+            ("role", ASCENDING),
+            ("state", ASCENDING),
+            ("rank", DESCENDING),
+            ("_id", DESCENDING),
+        ]
+    )
+    # users registered before the rank
+    ranking.recompute(db, fix=True)
+
+
+def _unread_index(db):
+    # marking messages seen; only the unseen ones are indexed
+    db.messages.create_index(
+        [
+            ("project_id", ASCENDING),
+            ("creation_datetime", DESCENDING),
+            ("_id", DESCENDING),
+        ],
+        partialFilterExpression={"seen": False},
+        name="unseen",
+    )
+    # messages sent before the counters
+    unread.recompute(db)
+
+
+def _search_index(db):
+    # ProjectResource.on_get?q=
+    search.create_index(db)
+
+
+def _content_addressed_files(db):
+    # files uploaded as uploads/files/<_id>
+    storage.import_legacy(db, storage.from_config(db))
+
+
+def _files_size(db):
+    # the bytes of the files of a project, checked against its quota
+    uploads.recompute(db)
+
+
+# (version, description, apply). append only; never renumber.
+MIGRATIONS = [
+    (1, "unique indexes of users and projects", _unique_indexes),
+    (2, "indexes of the hot queries", _hot_query_indexes),
+    (3, "skills index of the project feed", _skills_index),
+    (4, "materialized rank of users", _rank_index),
+    (5, "unread message counters", _unread_index),
+    (6, "text index of the project search", _search_index),
+    (7, "content addressed storage of files", _content_addressed_files),
+    (8, "files size of projects", _files_size),
+]
+
+
+def applied_versions(db) -> set:
+    return {doc["_id"] for doc in db.migrations.find({}, projection={"_id": 1})}
+
+
+def migrate(db, verbose=False) -> list:
+    """
+        apply pending migrations in order.
+        returns the applied versions.
+    """
+    done = applied_versions(db)
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version in done:
+            continue
+        if verbose:
+            print("applying {}: {}".format(version, description))
+        apply(db)
+        db.migrations.update_one(
+            {"_id": version},
+            {
+                "$set": {
+                    "description": description,
+                    "applied_datetime": datetime.utcnow(),
+                }
+            },
+            upsert=True,
+        )
+        applied.append(version)
+    return applied
+
+
+def query_shapes():
+    """
+        (name, collection, filter, sort) of every query the routes run.
+        values are placeholders; only the shape matters to the planner.
+    """
+    _id = ObjectId()
+    member = {"$or": [{"employer._id": _id}, {"employee._id": _id}]}
+    messages_sort = [("creation_datetime", DESCENDING), ("_id", DESCENDING)]
+    return [
+        ("users.list", "users", ranking.ranked_filter({}), ranking.SORT),
+        (
+            "users.list.role",
+            "users",
+            ranking.ranked_filter({"role": "employee"}),
+            ranking.SORT,
+        ),
+        (
+            "users.list.role_state",
+            "users",
+            {"role": "employee", "state": "idle"},
+            ranking.SORT,
+        ),
+        ("users.name", "users", {"name": "a_name"}, None),
+        ("users.mobile", "users", {"mobile": "00989000000000"}, None),
+        ("users.me", "users", {"_id": _id}, None),
+        ("projects.list", "projects", {}, [("_id", DESCENDING)]),
+        ("projects.list.state", "projects", {"state": "new"}, [("_id", DESCENDING)]),
+        (
+            "projects.feed",
+            "projects",
+            {"state": "new", "skills": {"$in": ["a skill", "another skill"]}},
+            None,
+        ),
+        (
+            "projects.search",
+            "projects",
+            {"$text": {"$search": "a skill"}, "state": "new"},
+            [("score", search.SCORE), ("_id", DESCENDING)],
+        ),
+        ("projects.title", "projects", {"title": "a title"}, None),
+        ("projects._id", "projects", {"_id": _id}, None),
+        ("projects.member", "projects", dict(member, _id=_id), None),
+        ("projects.of_member", "projects", member, None),
+        ("projects.employer", "projects", {"employer._id": _id}, None),
+        ("projects.employee", "projects", {"employee._id": _id}, None),
+        ("messages.list", "messages", {"project_id": _id}, messages_sort),
+        (
+            "messages.list.cursor",
+            "messages",
+            {
+                "project_id": _id,
+                "$or": [
+                    {"creation_datetime": {"$lt": datetime.utcnow()}},
+                    {"creation_datetime": datetime.utcnow(), "_id": {"$lt": _id}},
+                ],
+            },
+            messages_sort,
+        ),
+        (
+            "messages.page",
+            "messages",
+            {
+                "project_id": _id,
+                "$or": [
+                    {"creation_datetime": {"$gt": datetime.utcnow()}},
+                    {"creation_datetime": datetime.utcnow(), "_id": {"$gte": _id}},
+                ],
+            },
+            [("creation_datetime", ASCENDING), ("_id", ASCENDING)],
+        ),
+        (
+            "messages.unseen",
+            "messages",
+            unread.unseen_filter(
+                _id, _id, {"creation_datetime": datetime.utcnow(), "_id": _id}
+            ),
+            None,
+        ),
+        ("files.list", "files", {"project_id": _id, "kind": "input"}, None),
+        ("files._id", "files", {"_id": _id}, None),
+        ("blobs._id", "blobs", {"_id": "0" * 64}, None),
+    ]
+
+
+def _stages(plan):
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _stages(value)
+
+
+def check(db) -> list:
+    """
+        explain() every query shape.
+        returns (name, stages) of the ones whose winning plan has a COLLSCAN.
+    """
+    failures = []
+    for name, collection, filter_, sort in query_shapes():
+        cursor = db[collection].find(filter_)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = list(_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+        if "COLLSCAN" in stages:
+            failures.append((name, stages))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--testing", action="store_true", help="use test_oohoom")
+    parser.add_argument(
+        "--check", action="store_true", help="fail if a route query does a COLLSCAN"
+    )
+    args = parser.parse_args()
+    client = connections.mongo.get()
+    db = client.test_oohoom if args.testing else client.oohoom
+
+    if args.check:
+        failures = check(db)
+        for name, stages in failures:
+            print("COLLSCAN {}: {}".format(name, " <- ".join(stages)))
+        if failures:
+            return 1
+        print("ok")
+        return 0
+
+    applied = migrate(db, verbose=True)
+    print("applied: {}".format(applied) if applied else "up to date")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,10 @@
-from pymongo import MongoClient
+from .. import connections
+from . import migrations
 
 
 def init(is_testing=False):
     if is_testing:
-        client = MongoClient()
+        client = connections.mongo.get()
         client.drop_database("test_oohoom")
         db = client.test_oohoom
     else:
@@ -12,7 +13,7 @@ def init(is_testing=False):
         if is_confirmed != "yes":
             print("bye")
             return False
-        client = MongoClient()
+        client = connections.mongo.get()
         client.drop_database("oohoom")
         print("deleted")
         db = client.oohoom
@@ -41,9 +42,6 @@ def init(is_testing=False):
         },
     )
 
-    db.users.create_index("mobile", unique=True)
-    db.users.create_index("name", unique=True)
-
     db.create_collection(
         "projects",
         validator={
@@ -87,13 +85,13 @@ def init(is_testing=False):
                         "enum": ["new", "assigned", "done", "closed"],
                     },
                     "creation_datetime": {"bsonType": "date"},
+                    # bytes of its files, see uploads.py
+                    "files_size": {"bsonType": ["int", "long"], "minimum": 0},
                 },
             }
         },
     )
 
-    db.projects.create_index("title", unique=True)
-
     db.create_collection(
         "messages",
         validator={
@@ -123,15 +121,27 @@ def init(is_testing=False):
         validator={
             "$jsonSchema": {
                 "bsonType": "object",
-                "required": ["project_id", "kind", "creation_datetime", "title"],
+                "required": [
+                    "project_id",
+                    "kind",
+                    "creation_datetime",
+                    "title",
+                    "digest",
+                    "size",
+                ],
                 "properties": {
                     "project_id": {"bsonType": "objectId"},
                     "kind": {"bsonType": "string", "enum": ["input", "output"]},
                     "creation_datetime": {"bsonType": "date"},
                     "title": {"bsonType": "string", "minLength": 1, "maxLength": 88},
+                    # sha-256 of the content, see storage.py
+                    "digest": {"bsonType": "string", "pattern": "^[0-9a-f]{64}$"},
+                    "size": {"bsonType": ["int", "long"], "minimum": 0},
                 },
             }
         },
     )
+    # indexes
+    migrations.migrate(db)
     print("created")
     return True
@@ -1,18 +1,77 @@
+import threading
+import time
+from collections import OrderedDict
+
 import jwt
+from .constants import TOKEN_CACHE_MAXSIZE, TOKEN_CACHE_TTL, TOKEN_TTL
 from .local_config import SECRET
 
+# verified token -> (claims, expires), least recently used first
+_verified = OrderedDict()
+_verified_lock = threading.Lock()
 
-def user_to_token(user_id: str) -> str:
-    return jwt.encode({"user_id": user_id}, key=SECRET, algorithm="HS256").decode(
-        "utf8"
-    )
 
+def user_to_token(user_id: str, name: str = None, role: str = None) -> str:
+    """
+        name and role are carried as claims,
+        so handlers can build {_id, name} without a users query.
+    """
+    claims = {"user_id": user_id, "exp": int(time.time()) + TOKEN_TTL}
+    if name is not None and role is not None:
+        claims["name"] = name
+        claims["role"] = role
+    token = jwt.encode(claims, key=SECRET, algorithm="HS256")
+    # pyjwt < 2 returns bytes
+    if isinstance(token, bytes):
+        token = token.decode("utf8")
+    return token
 
-def token_to_user(token: str) -> str:
+
+def _cached_claims(token: str, now: float):
+    with _verified_lock:
+        entry = _verified.get(token)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del _verified[token]
+            return None
+        _verified.move_to_end(token)
+        return entry[0]
+
+
+def _cache_claims(token: str, claims: dict, now: float) -> None:
+    # tokens issued before the exp claim are re-verified every TOKEN_CACHE_TTL
+    expires = min(claims.get("exp", now + TOKEN_CACHE_TTL), now + TOKEN_CACHE_TTL)
+    with _verified_lock:
+        _verified[token] = (claims, expires)
+        _verified.move_to_end(token)
+        while len(_verified) > TOKEN_CACHE_MAXSIZE:
+            _verified.popitem(last=False)
+
+
+def token_claims(token: str) -> dict:
+    """
+        claims of a valid token, {} otherwise.
+        verified tokens are cached until they expire.
+    """
+    if not token:
+        return {}
+    now = time.time()
+    claims = _cached_claims(token, now)
+    if claims is not None:
+        return claims
     try:
-        decoded = jwt.decode(token, SECRET, algorithms="HS256")
-        user_id = decoded["user_id"]
-    except (KeyError, jwt.exceptions.PyJWTError):
+        claims = jwt.decode(token, SECRET, algorithms="HS256")
+    except jwt.exceptions.PyJWTError:
+        return {}
+    if "user_id" not in claims:
+        return {}
+    _cache_claims(token, claims, now)
+    return claims
+
+
+def token_to_user(token: str) -> str:
+    claims = token_claims(token)
+    if not claims:
         return ""
-    else:
-        return str(user_id)
+    return str(claims["user_id"])
@@ -0,0 +1,127 @@
+"""
+    json encoding of responses.
+
+    bson.json_util.dumps walks every document in python before json.dumps sees
+    it. dumps here hands the documents to the C encoder as they are; only
+    ObjectId, datetime and other bson types reach default(). the output is the
+    same extended json json_util.dumps produces.
+"""
+import calendar
+import inspect
+import json
+from datetime import datetime
+
+import falcon
+from bson import ObjectId, json_util
+from bson.json_util import DatetimeRepresentation
+
+_datetime_representation = json_util.DEFAULT_JSON_OPTIONS.datetime_representation
+
+
+def _millis(obj: datetime) -> int:
+    return calendar.timegm(obj.timetuple()) * 1000 + obj.microsecond // 1000
+
+
+def _datetime(obj: datetime):
+    # pymongo decodes naive utc datetimes, the only ones with a fast path
+    if obj.tzinfo is not None:
+        return json_util.default(obj)
+    if _datetime_representation == DatetimeRepresentation.LEGACY:
+        return {"$date": _millis(obj)}
+    if _datetime_representation == DatetimeRepresentation.ISO8601 and obj.year >= 1970:
+        millis = obj.microsecond // 1000
+        return {
+            "$date": "{:04d}-{:02d}-{:02d}T{:02d}:{:02d}:{:02d}{}Z".format(
+                obj.year,
+                obj.month,
+                obj.day,
+                obj.hour,
+                obj.minute,
+                obj.second,
+                ".{:03d}".format(millis) if millis else "",
+            )
+        }
+    return json_util.default(obj)
+
+
+def default(obj):
+    if type(obj) is ObjectId:
+        return {"$oid": str(obj)}
+    if type(obj) is datetime:
+        return _datetime(obj)
+    return json_util.default(obj)
+
+
+_encoder = json.JSONEncoder(default=default)
+
+
+def dumps(obj) -> str:
+    return _encoder.encode(obj)
+
+
+# bytes of encoded documents gathered before a chunk is sent
+STREAM_CHUNK_SIZE = 16 * 1024
+
+
+def _array_chunks(docs, chunk_size: int):
+    chunk = ["["]
+    size = 1
+    separator = ""
+    try:
+        for doc in docs:
+            # ascii only (ensure_ascii), so len() is the byte count
+            encoded = _encoder.encode(doc)
+            chunk.append(separator)
+            chunk.append(encoded)
+            separator = ","
+            size += len(encoded) + 1
+            if size >= chunk_size:
+                yield "".join(chunk).encode("ascii")
+                chunk = []
+                size = 0
+    finally:
+        if hasattr(docs, "close"):
+            docs.close()
+    chunk.append("]")
+    yield "".join(chunk).encode("ascii")
+
+
+async def _array_chunks_async(docs, chunk_size: int):
+    chunk = ["["]
+    size = 1
+    separator = ""
+    try:
+        async for doc in docs:
+            encoded = _encoder.encode(doc)
+            chunk.append(separator)
+            chunk.append(encoded)
+            separator = ","
+            size += len(encoded) + 1
+            if size >= chunk_size:
+                yield "".join(chunk).encode("ascii")
+                chunk = []
+                size = 0
+    finally:
+        if hasattr(docs, "close"):
+            closed = docs.close()
+            if inspect.isawaitable(closed):
+                await closed
+    chunk.append("]")
+    yield "".join(chunk).encode("ascii")
+
+
+def stream_array(resp, docs, chunk_size=STREAM_CHUNK_SIZE) -> None:
+    """
+        send docs (e.g. a pymongo cursor) as a json array, chunk by chunk,
+        instead of materializing them for resp.media.
+    """
+    resp.content_type = falcon.MEDIA_JSON
+    resp.stream = _array_chunks(docs, chunk_size)
+
+
+def stream_array_async(resp, docs, chunk_size=STREAM_CHUNK_SIZE) -> None:
+    """
+        the same as stream_array, for motor cursors.
+    """
+    resp.content_type = falcon.MEDIA_JSON
+    resp.stream = _array_chunks_async(docs, chunk_size)
@@ -0,0 +1,178 @@
+"""
+    cache of a user's role in a project, shared by the file and message routes.
+
+    the employer of a project never changes and an employee is only ever
+    assigned, so a positive answer never goes stale. both tiers, the process
+    memory and the optional redis one shared by the workers, keep only those.
+
+    a negative answer is not cached: a request that read "not a member"
+    before an assign could write it after invalidate() ran, and deny the new
+    employee until it expired. it costs an indexed query to ask again.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+from bson import ObjectId
+
+from . import connections
+from .config import MEMBERSHIP_REDIS_DB
+from .constants import MEMBERSHIP_MAXSIZE, MEMBERSHIP_TTL
+
+EMPLOYER = "employer"
+EMPLOYEE = "employee"
+NOT_MEMBER = ""
+
+
+class MembershipCache(object):
+    def __init__(self, ttl=MEMBERSHIP_TTL, maxsize=MEMBERSHIP_MAXSIZE, redis=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.redis = redis
+        # (project_id, user_id) -> (role, expires), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _redis_key(project_id) -> str:
+        return "membership:{}".format(project_id)
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return entry[0]
+                del self._entries[key]
+        return None
+
+    def _get_shared(self, key):
+        role = self.redis.hget(self._redis_key(key[0]), str(key[1]))
+        if role is None:
+            return None
+        role = role.decode("utf8")
+        self._set_local(key, role, time.monotonic())
+        return role
+
+    def _counted(self, role):
+        if role is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return role
+
+    def get(self, project_id: ObjectId, user_id: ObjectId):
+        """
+            the cached role, or None on a miss.
+        """
+        key = (project_id, user_id)
+        role = self._get_local(key)
+        if role is None and self.redis is not None:
+            role = self._get_shared(key)
+        return self._counted(role)
+
+    async def get_async(self, project_id: ObjectId, user_id: ObjectId):
+        """
+            the same as get; the redis tier is read in an executor thread.
+        """
+        key = (project_id, user_id)
+        role = self._get_local(key)
+        if role is None and self.redis is not None:
+            role = await asyncio.get_running_loop().run_in_executor(
+                None, self._get_shared, key
+            )
+        return self._counted(role)
+
+    def _set_local(self, key, role: str, now: float) -> None:
+        with self._lock:
+            self._entries[key] = (role, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def set(self, project_id: ObjectId, user_id: ObjectId, role: str):
+        if role == NOT_MEMBER:
+            return
+        self._set_local((project_id, user_id), role, time.monotonic())
+        if self.redis is not None:
+            key = self._redis_key(project_id)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(key, str(user_id), role)
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+
+    def invalidate(self, project_id: ObjectId) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == project_id]:
+                del self._entries[key]
+        if self.redis is not None:
+            self.redis.delete(self._redis_key(project_id))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def from_config():
+    if MEMBERSHIP_REDIS_DB is not None:
+        return MembershipCache(redis=connections.redis_client(MEMBERSHIP_REDIS_DB))
+    return MembershipCache()
+
+
+# replaced by create_app, see from_config
+cache = MembershipCache()
+
+
+async def _run(method, *args):
+    # blocking redis calls go to an executor thread
+    if cache.redis is not None:
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+    return method(*args)
+
+
+def _query(project_id: ObjectId, user_id: ObjectId):
+    return (
+        {
+            "_id": project_id,
+            "$or": [{"employer._id": user_id}, {"employee._id": user_id}],
+        },
+        {"employer._id": 1, "employee._id": 1},
+    )
+
+
+def _role(project, user_id: ObjectId) -> str:
+    if project is None:
+        return NOT_MEMBER
+    if project["employer"]["_id"] == user_id:
+        return EMPLOYER
+    return EMPLOYEE
+
+
+def role(db, project_id: ObjectId, user_id: ObjectId) -> str:
+    """
+        'employer', 'employee' or '' when the user is not a member of the project.
+    """
+    role_ = cache.get(project_id, user_id)
+    if role_ is None:
+        role_ = _role(db.projects.find_one(*_query(project_id, user_id)), user_id)
+        cache.set(project_id, user_id, role_)
+    return role_
+
+
+async def role_async(db, project_id: ObjectId, user_id: ObjectId) -> str:
+    """
+        the same as role, for motor.
+    """
+    role_ = await cache.get_async(project_id, user_id)
+    if role_ is None:
+        project = await db.projects.find_one(*_query(project_id, user_id))
+        role_ = _role(project, user_id)
+        await _run(cache.set, project_id, user_id, role_)
+    return role_
+
+
+async def invalidate_async(project_id: ObjectId) -> None:
+    await _run(cache.invalidate, project_id)
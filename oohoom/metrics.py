@@ -0,0 +1,389 @@
+"""
+    per route latency and status, mongodb and redis time, in the prometheus
+    text format at /v1/metrics.
+
+    the measure middleware opens a RequestStats in a context variable; the
+    CommandTimer listener and instrumented redis clients add the time and
+    round-trips of their commands to it (and to the process totals). requests
+    slower than SLOW_REQUEST are logged with the shapes of their queries.
+    the time a request waits on the client's behalf is left out, see waiting.
+
+    the numbers are per process: each worker answers for itself.
+    a streamed body is sent after the response is measured.
+    /v1/metrics is for the scraper only, see METRICS_TOKEN.
+"""
+import contextlib
+import contextvars
+import hmac
+import inspect
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import falcon
+from pymongo import monitoring
+
+from .config import METRICS_TOKEN, SLOW_REQUEST
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+slow_log = logging.getLogger("oohoom.slow")
+
+
+class RequestStats(object):
+    __slots__ = ("mongo_time", "mongo_calls", "redis_time", "redis_calls", "commands")
+
+    def __init__(self):
+        self.mongo_time = 0.0
+        self.mongo_calls = 0
+        self.redis_time = 0.0
+        self.redis_calls = 0
+        # (command, collection, filter or pipeline) of the mongodb commands
+        self.commands = []
+
+
+_current = contextvars.ContextVar("oohoom_request_stats", default=None)
+
+
+class Histogram(object):
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (route, method) -> Histogram
+        self.latency = defaultdict(Histogram)
+        # (route, method, status) -> count
+        self.statuses = defaultdict(int)
+        # (command, collection) -> [count, seconds]
+        self.mongo = defaultdict(lambda: [0, 0.0])
+        # command -> [count, seconds]
+        self.redis = defaultdict(lambda: [0, 0.0])
+        # name -> (help, type, function returning a number)
+        self.gauges = {}
+
+    def request(self, route: str, method: str, status: str, seconds: float) -> None:
+        with self._lock:
+            self.latency[(route, method)].observe(seconds)
+            self.statuses[(route, method, status)] += 1
+
+    def mongo_command(self, command: str, collection: str, seconds: float) -> None:
+        with self._lock:
+            total = self.mongo[(command, collection)]
+            total[0] += 1
+            total[1] += seconds
+
+    def redis_command(self, command: str, seconds: float) -> None:
+        with self._lock:
+            total = self.redis[command]
+            total[0] += 1
+            total[1] += seconds
+
+    def gauge(self, name: str, help_: str, function, type_="gauge") -> None:
+        """
+            a number read from function at every scrape.
+            type_ "counter" for the ones that only grow.
+        """
+        self.gauges[name] = (help_, type_, function)
+
+    def exposition(self) -> str:
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP oohoom_request_duration_seconds latency of the routes",
+                "# TYPE oohoom_request_duration_seconds histogram",
+            ]
+            for (route, method), histogram in sorted(self.latency.items()):
+                labels = 'route="{}",method="{}"'.format(_escape(route), method)
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        "oohoom_request_duration_seconds_bucket"
+                        '{{{},le="{}"}} {}'.format(labels, bound, cumulative)
+                    )
+                lines += [
+                    'oohoom_request_duration_seconds_bucket{{{},le="+Inf"}} {}'.format(
+                        labels, histogram.count
+                    ),
+                    "oohoom_request_duration_seconds_sum{{{}}} {}".format(
+                        labels, histogram.sum
+                    ),
+                    "oohoom_request_duration_seconds_count{{{}}} {}".format(
+                        labels, histogram.count
+                    ),
+                ]
+            lines += [
+                "# HELP oohoom_requests_total responses by status",
+                "# TYPE oohoom_requests_total counter",
+            ]
+            for (route, method, status), count in sorted(self.statuses.items()):
+                lines.append(
+                    "oohoom_requests_total"
+                    '{{route="{}",method="{}",status="{}"}} {}'.format(
+                        _escape(route), method, status, count
+                    )
+                )
+            # a family's samples follow its own HELP and TYPE lines
+            for name, help_, index in (
+                ("oohoom_mongo_commands_total", "mongodb commands", 0),
+                ("oohoom_mongo_seconds_total", "time of the mongodb commands", 1),
+            ):
+                lines += [
+                    "# HELP {} {}".format(name, help_),
+                    "# TYPE {} counter".format(name),
+                ]
+                for (command, collection), total in sorted(self.mongo.items()):
+                    lines.append(
+                        '{}{{command="{}",collection="{}"}} {}'.format(
+                            name, command, _escape(collection), total[index]
+                        )
+                    )
+            for name, help_, index in (
+                ("oohoom_redis_commands_total", "redis round-trips", 0),
+                ("oohoom_redis_seconds_total", "time of the redis round-trips", 1),
+            ):
+                lines += [
+                    "# HELP {} {}".format(name, help_),
+                    "# TYPE {} counter".format(name),
+                ]
+                for command, total in sorted(self.redis.items()):
+                    lines.append(
+                        '{}{{command="{}"}} {}'.format(
+                            name, _escape(command), total[index]
+                        )
+                    )
+        for name, (help_, type_, function) in sorted(self.gauges.items()):
+            lines += [
+                "# HELP {} {}".format(name, help_),
+                "# TYPE {} {}".format(name, type_),
+                "{} {}".format(name, function()),
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+
+def shape(value):
+    """
+        value with every literal replaced by 1; operators and keys are kept.
+    """
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            item = shape(item)
+            if item not in shapes:
+                shapes.append(item)
+        return shapes
+    return 1
+
+
+class CommandTimer(monitoring.CommandListener):
+    """
+        pass it to MongoClient(event_listeners=[...]).
+        with motor, commands run on executor threads, so only the process
+        totals get them.
+    """
+
+    def __init__(self, registry=registry):
+        self.registry = registry
+        # request_id -> collection
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        self._collections[event.request_id] = collection
+        stats = _current.get()
+        if stats is not None:
+            command = event.command
+            stats.commands.append(
+                (
+                    event.command_name,
+                    collection,
+                    command.get("filter", command.get("q", command.get("pipeline"))),
+                )
+            )
+
+    def _done(self, event):
+        seconds = event.duration_micros / 1e6
+        collection = self._collections.pop(event.request_id, "")
+        self.registry.mongo_command(event.command_name, collection, seconds)
+        stats = _current.get()
+        if stats is not None:
+            stats.mongo_time += seconds
+            stats.mongo_calls += 1
+
+    def succeeded(self, event):
+        self._done(event)
+
+    def failed(self, event):
+        self._done(event)
+
+
+def _redis_done(command: str, seconds: float) -> None:
+    registry.redis_command(command, seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.redis_time += seconds
+        stats.redis_calls += 1
+
+
+def instrument_redis(client):
+    """
+        time every round-trip of client (a command, a script or a pipeline).
+        returns client.
+    """
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    if inspect.iscoroutinefunction(execute_command):
+
+        async def timed_command(*args, **options):
+            start = time.perf_counter()
+            try:
+                return await execute_command(*args, **options)
+            finally:
+                _redis_done(str(args[0]), time.perf_counter() - start)
+
+        def timed_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def timed_execute(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await execute(*args, **kwargs)
+                finally:
+                    _redis_done("PIPELINE", time.perf_counter() - start)
+
+            pipe.execute = timed_execute
+            return pipe
+
+    else:
+
+        def timed_command(*args, **options):
+            start = time.perf_counter()
+            try:
+                return execute_command(*args, **options)
+            finally:
+                _redis_done(str(args[0]), time.perf_counter() - start)
+
+        def timed_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            def timed_execute(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return execute(*args, **kwargs)
+                finally:
+                    _redis_done("PIPELINE", time.perf_counter() - start)
+
+            pipe.execute = timed_execute
+            return pipe
+
+    client.execute_command = timed_command
+    client.pipeline = timed_pipeline
+    return client
+
+
+@contextlib.contextmanager
+def waiting(req):
+    """
+        time req waits for something else than the server, e.g. a long-poll
+        for a message; it is left out of the latency and the slow log.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        req.context.waited = (
+            getattr(req.context, "waited", 0.0) + time.perf_counter() - start
+        )
+
+
+class measure(object):
+    """
+        the middleware recording the latency and status of every route.
+    """
+
+    def __init__(self, registry=registry, slow=SLOW_REQUEST):
+        self.registry = registry
+        self.slow = slow
+
+    def process_request(self, req, resp):
+        req.context.stats = RequestStats()
+        req.context.stats_token = _current.set(req.context.stats)
+        req.context.start = time.perf_counter()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        start = getattr(req.context, "start", None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start - getattr(req.context, "waited", 0.0)
+        route = req.uri_template or "unmatched"
+        self.registry.request(route, req.method, str(resp.status)[:3], seconds)
+        stats = req.context.stats
+        if self.slow is not None and seconds > self.slow:
+            slow_log.warning(
+                "%s %s %.3fs mongo %.3fs/%d redis %.3fs/%d %s",
+                req.method,
+                route,
+                seconds,
+                stats.mongo_time,
+                stats.mongo_calls,
+                stats.redis_time,
+                stats.redis_calls,
+                [
+                    (command, collection, shape(query))
+                    for command, collection, query in stats.commands
+                ],
+            )
+        try:
+            _current.reset(req.context.stats_token)
+        except ValueError:
+            # set in another context (e.g. another asyncio task)
+            _current.set(None)
+
+    async def process_request_async(self, req, resp):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        self.process_response(req, resp, resource, req_succeeded)
+
+
+def authorize(req, token=METRICS_TOKEN) -> None:
+    """
+        raises unless req carries the metrics token.
+        without a token configured, the metrics are not served at all.
+    """
+    if token is None:
+        raise falcon.HTTPNotFound()
+    if not hmac.compare_digest(
+        (req.auth or "").encode("utf8"), "Bearer {}".format(token).encode("utf8")
+    ):
+        raise falcon.HTTPUnauthorized(challenges=["Bearer"])
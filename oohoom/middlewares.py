@@ -1,6 +1,35 @@
+import threading
+import time
+
+import falcon
+
+from . import compression, cursors, deadlines, metrics, ratelimit
+from .config import MAX_IN_FLIGHT, MAX_QUEUE_WAIT, REQUEST_DEADLINE, TRUST_FORWARDED
+from .constants import COMPRESS_MIN_SIZE, RATE_LIMITS
+from .utils import normalized_mobile
+
+# response headers that browsers may read
+EXPOSE_HEADERS = ", ".join([cursors.HEADER])
+
+
+def queue_wait(req):
+    """
+        seconds the request waited in the proxy queue, None if unknown.
+        X-Request-Start: t=1594800000.123
+    """
+    value = req.get_header("X-Request-Start")
+    if not value:
+        return None
+    try:
+        return time.time() - float(value.split("=")[-1])
+    except ValueError:
+        return None
+
+
 class cors(object):
     def process_response(self, req, resp, resource, req_succeeded):
         resp.set_header("Access-Control-Allow-Origin", "*")
+        resp.set_header("Access-Control-Expose-Headers", EXPOSE_HEADERS)
 
         if (
             req_succeeded
@@ -24,3 +53,299 @@ class cors(object):
                     ("Access-Control-Max-Age", "86400"),  # 24 hours
                 )
             )
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        self.process_response(req, resp, resource, req_succeeded)
+
+
+def client_ip(req, hops=TRUST_FORWARDED) -> str:
+    """
+        the address the outermost of hops trusted proxies saw the request
+        from. each proxy appends to X-Forwarded-For, so the entries left of
+        those are the client's own to choose.
+    """
+    hops = int(hops)
+    forwarded = req.get_header("X-Forwarded-For")
+    if not hops or not forwarded:
+        return req.remote_addr
+    entries = [entry.strip() for entry in forwarded.split(",")]
+    if len(entries) < hops:
+        return req.remote_addr
+    return entries[-hops]
+
+
+class rate_limit(object):
+    """
+        token buckets per ip, mobile and route of RATE_LIMITS.
+        429 with Retry-After when one of them is empty.
+    """
+
+    def __init__(self, buckets=None, buckets_async=None, limits=RATE_LIMITS):
+        self.buckets = buckets or ratelimit.buckets
+        self.buckets_async = buckets_async or ratelimit.buckets_async
+        self.limits = limits
+
+    @staticmethod
+    def _ip(req) -> str:
+        return client_ip(req)
+
+    def _buckets(self, req, rules, media):
+        keys, limits = [], []
+        for scope, rate, burst in rules:
+            if scope == "ip":
+                value = self._ip(req)
+            elif scope == "mobile":
+                mobile = media.get("mobile") if isinstance(media, dict) else None
+                if not isinstance(mobile, str) or not mobile:
+                    # rejected by validate_req
+                    continue
+                value = normalized_mobile(mobile)
+            else:
+                value = ""
+            keys.append(ratelimit.bucket_key(scope, req.path, value))
+            limits.append((rate, burst))
+        return keys, limits
+
+    @staticmethod
+    def _uses_media(rules) -> bool:
+        return any(scope == "mobile" for scope, _, _ in rules)
+
+    def process_request(self, req, resp):
+        rules = self.limits.get((req.method, req.path))
+        if rules is None:
+            return
+        media = None
+        if self._uses_media(rules):
+            try:
+                media = req.media
+            except falcon.HTTPBadRequest:
+                pass
+        wait = self.buckets.take(*self._buckets(req, rules, media))
+        if wait:
+            raise falcon.HTTPTooManyRequests(retry_after=ratelimit.retry_after(wait))
+
+    async def process_request_async(self, req, resp):
+        rules = self.limits.get((req.method, req.path))
+        if rules is None:
+            return
+        media = None
+        if self._uses_media(rules):
+            try:
+                media = await req.get_media()
+            except falcon.HTTPBadRequest:
+                pass
+        wait = await self.buckets_async.take(*self._buckets(req, rules, media))
+        if wait:
+            raise falcon.HTTPTooManyRequests(retry_after=ratelimit.retry_after(wait))
+
+
+class shed_load(object):
+    """
+        503 right away, instead of a slow answer, when the process already
+        handles max_in_flight requests or the request waited in the proxy
+        queue longer than max_queue_wait.
+        a streamed body is sent after process_response, so it is not counted.
+    """
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, max_queue_wait=MAX_QUEUE_WAIT):
+        self.max_in_flight = max_in_flight
+        self.max_queue_wait = max_queue_wait
+        self.in_flight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def _unavailable(self):
+        with self._lock:
+            self.shed += 1
+        return falcon.HTTPServiceUnavailable(retry_after=1)
+
+    def process_request(self, req, resp):
+        if self.max_queue_wait is not None:
+            waited = queue_wait(req)
+            if waited is not None and waited > self.max_queue_wait:
+                raise self._unavailable()
+        if self.max_in_flight is not None:
+            with self._lock:
+                full = self.in_flight >= self.max_in_flight
+                if not full:
+                    self.in_flight += 1
+            if full:
+                raise self._unavailable()
+            req.context.in_flight = True
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        if getattr(req.context, "in_flight", False):
+            with self._lock:
+                self.in_flight -= 1
+
+    async def process_request_async(self, req, resp):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        self.process_response(req, resp, resource, req_succeeded)
+
+
+class deadline(object):
+    """
+        the budget of a request, see deadlines.py.
+        503 when it waited in the proxy queue for all of it.
+    """
+
+    def __init__(self, budget=REQUEST_DEADLINE):
+        self.budget = budget
+
+    def _budget(self, req):
+        budget = self.budget
+        # a client may only ask for less
+        try:
+            asked = float(req.get_header(deadlines.HEADER) or 0)
+        except ValueError:
+            asked = 0
+        if asked > 0 and (budget is None or asked < budget):
+            budget = asked
+        return budget
+
+    def process_request(self, req, resp):
+        budget = self._budget(req)
+        if budget is None:
+            return
+        waited = queue_wait(req) or 0
+        try:
+            deadlines.start(req, budget, max(waited, 0))
+        except deadlines.DeadlineExceeded:
+            deadlines.stats.refuse()
+            raise falcon.HTTPServiceUnavailable(retry_after=1)
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        deadline = deadlines.finish(req)
+        # marked, as compress may have wrapped the file already
+        if deadline is not None and resp.stream is not None:
+            if not deadlines.is_exempt(req):
+                resp.stream = deadlines.within(deadline, resp.stream)
+
+    async def process_request_async(self, req, resp):
+        self.process_request(req, resp)
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        deadline = deadlines.finish(req)
+        if deadline is not None and resp.stream is not None:
+            if not deadlines.is_exempt(req):
+                resp.stream = deadlines.within_async(deadline, resp.stream)
+
+
+class compress(object):
+    """
+        gzip or brotli of the text-like 200 responses, as Accept-Encoding
+        asks. a streamed body is compressed chunk by chunk; bodies smaller
+        than min_size and the ones skipped by compression.skip are sent as
+        they are.
+    """
+
+    def __init__(self, min_size=COMPRESS_MIN_SIZE):
+        self.min_size = min_size
+
+    def _encoding(self, req, resp):
+        if req.method == "HEAD" or str(resp.status)[:3] != "200":
+            return None
+        if resp.get_header("Content-Encoding") or compression.skipped(resp):
+            return None
+        # a media body is rendered as the default media type
+        content_type = resp.content_type or (
+            resp.options.default_media_type if resp.stream is None else None
+        )
+        if not compression.compressible(content_type):
+            return None
+        # the body depends on Accept-Encoding from here on
+        resp.append_header("Vary", "Accept-Encoding")
+        length = resp.get_header("Content-Length")
+        if length is not None and int(length) < self.min_size:
+            return None
+        return compression.negotiate(req.get_header("Accept-Encoding") or "")
+
+    @staticmethod
+    def _encoded(resp, encoding: str) -> None:
+        resp.set_header("Content-Encoding", encoding)
+        resp.delete_header("Content-Length")
+        # ranges would be of the compressed bytes
+        resp.delete_header("Accept-Ranges")
+        # the bytes differ from the identity ones; If-None-Match still matches
+        etag = resp.get_header("ETag")
+        if etag and not etag.startswith("W/"):
+            resp.set_header("ETag", "W/" + etag)
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        encoding = self._encoding(req, resp)
+        if encoding is None:
+            return
+        if resp.stream is not None:
+            chunks = compression.chunks(resp.stream)
+            head, complete = compression.head(chunks, self.min_size)
+            if complete:
+                resp.stream = None
+                resp.data = b"".join(head)
+                return
+            resp.stream = compression.compress_chunks(head, chunks, encoding)
+        else:
+            body = resp.body
+            data = body.encode() if isinstance(body, str) else body or resp.data
+            if data is None or len(data) < self.min_size:
+                return
+            resp.body = None
+            resp.data = compression.compress(data, encoding)
+        self._encoded(resp, encoding)
+
+    async def process_response_async(self, req, resp, resource, req_succeeded):
+        if resp.sse is not None:
+            return
+        encoding = self._encoding(req, resp)
+        if encoding is None:
+            return
+        if resp.stream is not None:
+            chunks = compression.chunks_async(resp.stream)
+            head, complete = await compression.head_async(chunks, self.min_size)
+            if complete:
+                resp.stream = None
+                resp.data = b"".join(head)
+                return
+            resp.stream = compression.compress_chunks_async(head, chunks, encoding)
+        else:
+            data = await resp.render_body()
+            if data is None or len(data) < self.min_size:
+                return
+            resp.body = None
+            resp.data = compression.compress(data, encoding)
+        self._encoded(resp, encoding)
+
+
+def create(is_testing=False) -> list:
+    """
+        the middleware of the wsgi and asgi apps, cheapest check first.
+    """
+    if is_testing:
+        # fresh buckets for every test app
+        buckets = ratelimit.LocalBuckets()
+        limiter = rate_limit(buckets, ratelimit.AsyncLocalBuckets(buckets))
+    else:
+        limiter = rate_limit()
+    shedder = shed_load()
+    metrics.registry.gauge(
+        "oohoom_in_flight", "requests being handled", lambda: shedder.in_flight
+    )
+    metrics.registry.gauge(
+        "oohoom_shed_total", "requests shed with a 503", lambda: shedder.shed, "counter"
+    )
+    metrics.registry.gauge(
+        "oohoom_deadline_refused_total",
+        "requests refused with a 503, their budget spent in the proxy queue",
+        lambda: deadlines.stats.refused,
+        "counter",
+    )
+    metrics.registry.gauge(
+        "oohoom_deadline_exceeded_total",
+        "requests that ran out of budget, a 504",
+        lambda: deadlines.stats.exceeded,
+        "counter",
+    )
+    # process_response runs last to first, so compress sees the final body
+    # the deadline covers the redis calls of the limiter too
+    return [metrics.measure(), deadline(), shedder, limiter, cors(), compress()]
@@ -0,0 +1,361 @@
+"""
+    the queries and checks of the resources, shared by the wsgi app and the
+    asgi app (see asgi.py); the two only do the i/o.
+
+    the functions taking a db return what the driver does, so motor callers
+    await them. the others build filters and documents from the request, or
+    raise the error of a failed check.
+"""
+import contextlib
+import string
+from datetime import datetime
+from mimetypes import guess_type
+from random import SystemRandom
+
+import falcon
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import ExecutionTimeout
+
+from . import compression, cursors, deadlines, downloads, feed, fields, ranking, search
+from .utils import normalized_mobile
+
+USER_PUBLIC = {"_id": 1, "name": 1, "role": 1, "state": 1, "skills": 1}
+# the page of GET /v1/users has the rank too, as its cursor
+USER_LISTED = dict(USER_PUBLIC, rank=1)
+
+PROJECTS_SORT = [("_id", DESCENDING)]
+
+MESSAGES_NEWEST_FIRST = [("creation_datetime", DESCENDING), ("_id", DESCENDING)]
+MESSAGES_OLDEST_FIRST = [("creation_datetime", ASCENDING), ("_id", ASCENDING)]
+
+CONFLICTS = {
+    "mobile": "A user with this mobile number already exists",
+    "name": "A user with this name already exists",
+    "title": "This title already exists.",
+}
+
+
+def project_id(params: dict) -> ObjectId:
+    try:
+        return ObjectId(params["project_id"])
+    except (InvalidId, TypeError):
+        raise falcon.errors.HTTPBadRequest(title="invalid project_id")
+
+
+def project_filter(req) -> dict:
+    """
+        req.context.filter of the project_id param.
+    """
+    req.context.filter["project_id"] = project_id(req.context.params)
+    return req.context.filter
+
+
+def check_found(document, **kwargs) -> None:
+    """
+        document is a find result, or the matched_count of an update.
+    """
+    if not document:
+        raise falcon.errors.HTTPNotFound(**kwargs)
+
+
+def check_role(allowed, role: str, to: str, error=falcon.errors.HTTPForbidden):
+    """
+        allowed is the user found with the role, or whether the claims allow it.
+    """
+    if not allowed:
+        raise error(description="You must be an {} to {}.".format(role, to))
+
+
+def check_member(role: str) -> None:
+    if not role:
+        raise falcon.errors.HTTPForbidden(title="no such project found for you")
+
+
+def check_unique(field: str, found) -> None:
+    if found is not None:
+        raise falcon.errors.HTTPConflict(
+            title=field, description={field: CONFLICTS[field]}
+        )
+
+
+def check_code(valid) -> None:
+    if not valid:
+        raise falcon.errors.HTTPBadRequest(description={"code": "code is invalid"})
+
+
+# users
+
+
+def user(user_id: ObjectId, role=None) -> tuple:
+    """
+        (filter, projection) of {_id, name} of the user, if it has the role.
+    """
+    filter_ = {"_id": user_id}
+    if role is not None:
+        filter_["role"] = role
+    return filter_, {"_id": 1, "name": 1}
+
+
+def taken(field: str, value) -> tuple:
+    """
+        (filter, projection) of the document whose field is value already.
+    """
+    return {field: value}, {field: 1}
+
+
+def normalized(media: dict) -> dict:
+    media["mobile"] = normalized_mobile(media.get("mobile"))
+    return media
+
+
+def new_code() -> str:
+    return "".join(SystemRandom().choice(string.digits) for digit in range(5))
+
+
+def new_user(media: dict) -> dict:
+    return {
+        "mobile": media.get("mobile"),
+        "name": media.get("name"),
+        "role": media.get("role"),
+        "state": "idle",
+        "skills": media.get("skills"),
+        "rank": 0,
+    }
+
+
+def users_page(params: dict, filter_: dict) -> dict:
+    """
+        the filter of a page of users, best ranked first; see ranking.SORT.
+    """
+    return cursors.after_key_id(
+        ranking.ranked_filter(filter_), params.get("cursor"), "rank", DESCENDING
+    )
+
+
+# projects
+
+
+def new_project(media: dict, employer: dict, employer_id: ObjectId) -> dict:
+    return {
+        "title": media.get("title"),
+        "description": media.get("description"),
+        "employer": {"_id": employer_id, "name": employer.get("name")},
+        "employee": None,
+        "state": "new",
+        "skills": media.get("skills"),
+        "creation_datetime": datetime.utcnow(),
+    }
+
+
+def project_tags(project_id: ObjectId) -> tuple:
+    """
+        the response cache tags a change of the project invalidates.
+    """
+    return "projects", "project:{}".format(project_id)
+
+
+def projects_page(params: dict, filter_: dict) -> dict:
+    """
+        the filter of a page of projects, newest first; see PROJECTS_SORT.
+    """
+    return cursors.after_id(filter_, params.get("cursor"), DESCENDING)
+
+
+def search_projects(collection, params: dict, filter_: dict):
+    """
+        best match first, so paged by skip only; no X-Next-Cursor.
+        read the cursor inside searching().
+    """
+    return search.find(
+        collection,
+        params["q"],
+        filter_,
+        params.get("skip"),
+        params.get("limit"),
+        fields.projection(params["fields"]),
+    )
+
+
+@contextlib.contextmanager
+def searching():
+    try:
+        with search.bounded():
+            yield
+    except ExecutionTimeout:
+        raise falcon.errors.HTTPServiceUnavailable(
+            description={"q": "The search is too broad."}, retry_after=1
+        )
+
+
+def feed_pipeline(employee: dict, params: dict) -> list:
+    return feed.pipeline(
+        employee.get("skills") or [],
+        params.get("skip"),
+        params.get("limit"),
+        fields.projection(params["fields"]),
+    )
+
+
+def assign(db, project_id: ObjectId, employee: dict):
+    return db.projects.update_one(
+        {"_id": project_id, "employee": None, "state": "new"},
+        {"$set": {"employee": employee, "state": "assigned"}},
+    )
+
+
+def update(db, project_id: ObjectId, update_: dict):
+    return db.projects.update_one({"_id": project_id}, {"$set": update_})
+
+
+def done(db, project_id: ObjectId, employer_id: ObjectId):
+    """
+        the project before it was done, with its employee's _id.
+    """
+    return db.projects.find_one_and_update(
+        {"_id": project_id, "employer._id": employer_id, "state": "assigned"},
+        {"$set": {"state": "done"}},
+        projection={"employee._id": 1},
+    )
+
+
+# files
+
+
+def check_multipart(req) -> None:
+    if req.content_type.split(";")[0] != "multipart/form-data":
+        raise falcon.errors.HTTPUnsupportedMediaType(
+            title="multipart/form-data required"
+        )
+
+
+def members_only(req, kind: str) -> bool:
+    """
+        whether the files of kind are for the members of the project only.
+        raises 401 if they are and the request is anonymous.
+    """
+    if kind != "output":
+        return False
+    if not req.context.authenticated:
+        raise falcon.errors.HTTPUnauthorized()
+    return True
+
+
+def send_file(req, resp, file_: dict):
+    """
+        the headers of GET /v1/files/{_id}, see downloads.prepare.
+        returns (start, length) of the content to stream, or None.
+    """
+    if file_["kind"] == "output":
+        # not for shared caches
+        resp.cache_control = ["private"]
+    resp.downloadable_as = file_["title"]
+    content_type, encoding = guess_type(file_["title"])
+    resp.content_type = content_type or "application/octet-stream"
+    if encoding is not None:
+        # a .gz, .bz2 or .xz file; compressing it again gains nothing
+        compression.skip(resp)
+    # ETag, If-None-Match/If-Modified-Since and Range
+    range_ = downloads.prepare(
+        req, resp, file_["digest"], file_["size"], file_["creation_datetime"]
+    )
+    if range_ is not None:
+        # paced by the client
+        deadlines.exempt(req)
+    return range_
+
+
+# messages
+
+
+def new_message(params: dict, sender: dict) -> dict:
+    return {
+        "project_id": params["project_id"],
+        "body": params["body"],
+        "creation_datetime": datetime.utcnow(),
+        "sender": sender,
+        "seen": False,
+    }
+
+
+def until(params: dict) -> tuple:
+    """
+        (filter, projection) of the message PATCH /v1/messages marks seen up to.
+    """
+    return (
+        {"_id": params["until"], "project_id": params["project_id"]},
+        {"creation_datetime": 1},
+    )
+
+
+def messages_page(params: dict, filter_: dict) -> dict:
+    """
+        newest first, so the cursor walks back in history.
+    """
+    return cursors.after_key_id(
+        filter_, params.get("cursor"), "creation_datetime", DESCENDING
+    )
+
+
+def messages_from(filter_: dict, oldest: dict) -> dict:
+    """
+        the page is sent oldest first. its oldest message is found with a
+        covered index scan, then the page is streamed forward from it.
+    """
+    return cursors.key_id_from(
+        filter_,
+        "creation_datetime",
+        oldest["creation_datetime"],
+        oldest["_id"],
+        ASCENDING,
+        inclusive=True,
+    )
+
+
+def messages_to(filter_: dict, newest: dict) -> dict:
+    """
+        the last, partial page ends at the message at skip.
+    """
+    return cursors.key_id_from(
+        filter_,
+        "creation_datetime",
+        newest["creation_datetime"],
+        newest["_id"],
+        DESCENDING,
+        inclusive=True,
+    )
+
+
+def poll_since(params: dict):
+    """
+        the (creation_datetime, _id) the poll is after, None if it is from
+        the newest message.
+    """
+    since = params.get("since")
+    if since:
+        return cursors.decode(since, "creation_datetime", "_id")
+    return None
+
+
+def newest_keys(newest):
+    if newest is None:
+        return None
+    return newest["creation_datetime"], newest["_id"]
+
+
+def poll_filter(project_id_: ObjectId, since) -> dict:
+    filter_ = {"project_id": project_id_}
+    if since is None:
+        return filter_
+    return cursors.key_id_from(filter_, "creation_datetime", *since, ASCENDING)
+
+
+def set_poll_next(resp, messages: list, since) -> None:
+    """
+        X-Next-Cursor is the since of the next poll.
+    """
+    if messages:
+        cursors.set_next(resp, messages[-1], "creation_datetime", "_id")
+    elif since is not None:
+        resp.set_header(cursors.HEADER, cursors.encode(*since))
@@ -1,11 +1,160 @@
-import redis
+"""
+    verification codes of mobile numbers.
 
+    a code is checked and deleted by one server-side script, so it is one
+    round-trip and two concurrent logins cannot both pass. after
+    CODE_MAX_ATTEMPTS wrong codes the code is dropped.
+"""
+import threading
+import time
 
-r_mobile_code = redis.StrictRedis(host="localhost", port=6379, db=2)
+from . import connections
+from .config import R_CODE_BACKEND, R_CODE_REDIS_DB
+from .constants import CODE_MAX_ATTEMPTS, CODE_TTL
+
+# KEYS: code, attempts. ARGV: code, max attempts, ttl
+TAKE_SCRIPT = """
+local code = redis.call('GET', KEYS[1])
+if not code then
+    return 0
+end
+if code == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+if redis.call('INCR', KEYS[2]) >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1], KEYS[2])
+else
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+return 0
+"""
+
+
+def _attempts_key(mobile: str) -> str:
+    return "attempts:" + mobile
+
+
+class RedisCodes(object):
+    def __init__(self, client):
+        self.client = client
+        # EVALSHA, falling back to EVAL once per server
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def get(self, mobile: str):
+        return self.client.get(mobile)
+
+    def store(self, mobile: str, code: str, ttl=CODE_TTL) -> None:
+        # a new code gets all its attempts
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(mobile, code, ex=ttl)
+        pipe.delete(_attempts_key(mobile))
+        pipe.execute()
+
+    def take(self, mobile: str, code: str) -> bool:
+        return self._take(
+            keys=[mobile, _attempts_key(mobile)],
+            args=[code, CODE_MAX_ATTEMPTS, CODE_TTL],
+        ) == 1
+
+
+class AsyncRedisCodes(RedisCodes):
+    """
+        the same as RedisCodes, for a redis.asyncio client.
+    """
+
+    async def get(self, mobile: str):
+        return await self.client.get(mobile)
+
+    async def store(self, mobile: str, code: str, ttl=CODE_TTL) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(mobile, code, ex=ttl)
+        pipe.delete(_attempts_key(mobile))
+        await pipe.execute()
+
+    async def take(self, mobile: str, code: str) -> bool:
+        taken = await self._take(
+            keys=[mobile, _attempts_key(mobile)],
+            args=[code, CODE_MAX_ATTEMPTS, CODE_TTL],
+        )
+        return taken == 1
+
+
+class LocalCodes(object):
+    """
+        an in-process stand-in for RedisCodes.
+        get() returns bytes, as redis does.
+    """
+
+    def __init__(self):
+        # mobile -> [code, expires, attempts]
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, mobile: str):
+        entry = self._codes.get(mobile)
+        if entry is not None and entry[1] <= time.monotonic():
+            del self._codes[mobile]
+            return None
+        return entry
+
+    def get(self, mobile: str):
+        with self._lock:
+            entry = self._entry(mobile)
+        return None if entry is None else entry[0].encode("utf8")
+
+    def store(self, mobile: str, code: str, ttl=CODE_TTL) -> None:
+        with self._lock:
+            self._codes[mobile] = [code, time.monotonic() + ttl, 0]
+
+    def take(self, mobile: str, code: str) -> bool:
+        with self._lock:
+            entry = self._entry(mobile)
+            if entry is None:
+                return False
+            if entry[0] == code:
+                del self._codes[mobile]
+                return True
+            entry[2] += 1
+            if entry[2] >= CODE_MAX_ATTEMPTS:
+                del self._codes[mobile]
+            return False
+
+
+class AsyncLocalCodes(object):
+    """
+        a LocalCodes behind the interface of AsyncRedisCodes.
+    """
+
+    def __init__(self, codes: LocalCodes):
+        self.codes = codes
+
+    async def get(self, mobile: str):
+        return self.codes.get(mobile)
+
+    async def store(self, mobile: str, code: str, ttl=CODE_TTL) -> None:
+        self.codes.store(mobile, code, ttl)
+
+    async def take(self, mobile: str, code: str) -> bool:
+        return self.codes.take(mobile, code)
+
+
+def _backends():
+    if R_CODE_BACKEND == "local":
+        codes = LocalCodes()
+        return codes, AsyncLocalCodes(codes)
+    return (
+        RedisCodes(connections.redis_client(R_CODE_REDIS_DB)),
+        # used by the asgi app
+        AsyncRedisCodes(connections.redis_client_async(R_CODE_REDIS_DB)),
+    )
+
+
+r_mobile_code, r_mobile_code_async = _backends()
 
 
 def store(mobile: str, code: str) -> None:
-    r_mobile_code.set(mobile, code, ex=3600)
+    r_mobile_code.store(mobile, code)
 
 
 def is_valid(mobile: str, code: str) -> bool:
@@ -13,10 +162,15 @@ def is_valid(mobile: str, code: str) -> bool:
         check code validation for mobile.
         then delete it if it's valid.
     '''
-    _code = r_mobile_code.get(mobile)
-    if _code is None:
-        return False
-    if code == _code.decode("utf8"):
-        r_mobile_code.delete(mobile)
-        return True
-    return False
+    return r_mobile_code.take(mobile, code)
+
+
+async def store_async(mobile: str, code: str) -> None:
+    await r_mobile_code_async.store(mobile, code)
+
+
+async def is_valid_async(mobile: str, code: str) -> bool:
+    '''
+        the same as is_valid.
+    '''
+    return await r_mobile_code_async.take(mobile, code)
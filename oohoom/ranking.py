@@ -0,0 +1,115 @@
+"""
+    a materialized rank of users, so UserResource.on_get can page through
+    them best first off the (role, state, rank, _id) index.
+
+    an employee gains ASSIGNED_WEIGHT when assigned a project and DONE_WEIGHT
+    when it is done. ProjectResource.on_patch $inc's the rank as the project
+    state changes; recompute() rebuilds it from the projects to find drift.
+
+    python -m oohoom.ranking [--testing] [--fix]
+"""
+import argparse
+import sys
+
+from pymongo import DESCENDING, UpdateOne
+
+from . import connections
+
+ASSIGNED_WEIGHT = 1
+DONE_WEIGHT = 10
+
+ROLES = ["employer", "employee"]
+STATES = ["idle", "busy"]
+
+SORT = [("rank", DESCENDING), ("_id", DESCENDING)]
+
+
+def ranked_filter(filter_: dict) -> dict:
+    """
+        filter_ with every role and state it leaves open spelled out as an $in.
+        the planner then merges one index range per (role, state) pair
+        instead of sorting the users in memory.
+    """
+    filter_ = dict(filter_)
+    filter_.setdefault("role", {"$in": ROLES})
+    filter_.setdefault("state", {"$in": STATES})
+    return filter_
+
+
+# both return what the driver does; motor callers await them
+
+
+def assigned(db, employee_id):
+    return db.users.update_one(
+        {"_id": employee_id}, {"$inc": {"rank": ASSIGNED_WEIGHT}}
+    )
+
+
+def done(db, employee_id):
+    return db.users.update_one({"_id": employee_id}, {"$inc": {"rank": DONE_WEIGHT}})
+
+
+def expected_ranks(db) -> dict:
+    """
+        user _id -> rank, built from the projects.
+    """
+    counts = db.projects.aggregate(
+        [
+            {"$match": {"employee._id": {"$ne": None}}},
+            {
+                "$group": {
+                    "_id": "$employee._id",
+                    "assigned": {"$sum": 1},
+                    "done": {"$sum": {"$cond": [{"$eq": ["$state", "done"]}, 1, 0]}},
+                }
+            },
+        ]
+    )
+    return {
+        count["_id"]: count["assigned"] * ASSIGNED_WEIGHT
+        + count["done"] * DONE_WEIGHT
+        for count in counts
+    }
+
+
+def recompute(db, fix=False) -> list:
+    """
+        compare every stored rank with the expected one.
+        returns (_id, stored, expected) of the drifted users; fix stores the
+        expected ranks.
+    """
+    expected = expected_ranks(db)
+    drifted = []
+    for user in db.users.find({}, projection={"rank": 1}):
+        rank = expected.get(user["_id"], 0)
+        if user.get("rank") != rank:
+            drifted.append((user["_id"], user.get("rank"), rank))
+    if fix and drifted:
+        db.users.bulk_write(
+            [
+                UpdateOne({"_id": _id}, {"$set": {"rank": rank}})
+                for _id, _, rank in drifted
+            ],
+            ordered=False,
+        )
+    return drifted
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--testing", action="store_true", help="use test_oohoom")
+    parser.add_argument("--fix", action="store_true", help="store the expected ranks")
+    args = parser.parse_args()
+    client = connections.mongo.get()
+    db = client.test_oohoom if args.testing else client.oohoom
+
+    drifted = recompute(db, fix=args.fix)
+    for _id, stored, rank in drifted:
+        print("{}: {} -> {}".format(_id, stored, rank))
+    fixed = ", fixed" if args.fix and drifted else ""
+    print("{} drifted{}".format(len(drifted), fixed))
+    return 1 if drifted and not args.fix else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
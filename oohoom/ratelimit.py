@@ -0,0 +1,131 @@
+"""
+    token buckets of the rate limits.
+
+    a request may draw from several buckets (its ip, mobile and route).
+    they are checked and drawn from by one server-side script, so a check
+    is one round-trip and either every bucket pays or none does.
+"""
+import math
+import threading
+import time
+
+from . import connections
+from .config import RATE_LIMIT_BACKEND, RATE_LIMIT_REDIS_DB
+
+# KEYS: buckets. ARGV: rate, burst of every bucket.
+# returns the seconds to wait, "0" when the tokens were taken.
+TAKE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = burst
+    if bucket[1] then
+        available = math.min(
+            burst, tonumber(bucket[1]) + (now - tonumber(bucket[2])) * rate
+        )
+    end
+    if available < 1 then
+        wait = math.max(wait, (1 - available) / rate)
+    end
+    tokens[i] = available
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+    -- a full bucket needs no key
+    redis.call('EXPIRE', key, math.ceil(burst / rate))
+end
+return '0'
+"""
+
+
+def bucket_key(scope: str, path: str, value: str) -> str:
+    return "ratelimit:{}:{}:{}".format(scope, path, value)
+
+
+def _args(limits: list) -> list:
+    args = []
+    for rate, burst in limits:
+        args += [rate, burst]
+    return args
+
+
+class RedisBuckets(object):
+    def __init__(self, client):
+        self.client = client
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def take(self, keys: list, limits: list) -> float:
+        """
+            one token of every bucket; limits are their (rate, burst).
+            returns the seconds to wait, 0 when they were taken.
+        """
+        return float(self._take(keys=keys, args=_args(limits)))
+
+
+class AsyncRedisBuckets(RedisBuckets):
+    async def take(self, keys: list, limits: list) -> float:
+        return float(await self._take(keys=keys, args=_args(limits)))
+
+
+class LocalBuckets(object):
+    """
+        an in-process stand-in for RedisBuckets.
+        buckets are per process and never dropped; for tests and benchmarks.
+    """
+
+    def __init__(self):
+        # key -> (tokens, ts)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, keys: list, limits: list) -> float:
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            wait = 0
+            for key, (rate, burst) in zip(keys, limits):
+                tokens, ts = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - ts) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                available.append(tokens)
+            if wait > 0:
+                return wait
+            for key, tokens in zip(keys, available):
+                self._buckets[key] = (tokens - 1, now)
+            return 0
+
+
+class AsyncLocalBuckets(object):
+    def __init__(self, buckets: LocalBuckets):
+        self.buckets = buckets
+
+    async def take(self, keys: list, limits: list) -> float:
+        return self.buckets.take(keys, limits)
+
+
+def retry_after(wait: float) -> int:
+    return max(1, math.ceil(wait))
+
+
+def _buckets():
+    if RATE_LIMIT_BACKEND == "local":
+        buckets_ = LocalBuckets()
+        return buckets_, AsyncLocalBuckets(buckets_)
+    return (
+        RedisBuckets(connections.redis_client(RATE_LIMIT_REDIS_DB)),
+        AsyncRedisBuckets(connections.redis_client_async(RATE_LIMIT_REDIS_DB)),
+    )
+
+
+buckets, buckets_async = _buckets()
@@ -0,0 +1,167 @@
+"""
+    wake-up of the long-polls of a project's new messages.
+
+    MessageResource.on_post publishes the project_id on redis. every worker
+    runs a single pattern subscriber (a thread, or a task in asgi) that wakes
+    the requests of that process waiting on the project. a poll of an idle
+    conversation is one indexed query, then a sleep until a message arrives
+    or the poll times out.
+
+    a notification lost in between is caught by the query of the next poll.
+"""
+import asyncio
+import os
+import threading
+
+import redis
+import redis.asyncio
+
+from . import metrics
+from .config import REDIS_HOST, REDIS_PORT
+
+CHANNEL_PREFIX = "messages:"
+
+
+def _channel(project_id) -> str:
+    return CHANNEL_PREFIX + str(project_id)
+
+
+def _project_id(channel) -> str:
+    if isinstance(channel, bytes):
+        channel = channel.decode("utf8")
+    return channel[len(CHANNEL_PREFIX) :]
+
+
+class _Hub(object):
+    """
+        project_id -> the event of its next message.
+        only projects with a waiting request have one.
+    """
+
+    event_type = None
+
+    def __init__(self, redis):
+        self.redis = redis
+        self._events = {}
+        self._waiters = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, project_id):
+        """
+            the event set by the next message of the project.
+            take it before looking for messages, so none slips in between.
+        """
+        self._start()
+        key = str(project_id)
+        with self._lock:
+            event = self._events.get(key)
+            if event is None:
+                event = self._events[key] = self.event_type()
+            self._waiters[key] = self._waiters.get(key, 0) + 1
+        return event
+
+    def unsubscribe(self, project_id) -> None:
+        key = str(project_id)
+        with self._lock:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._events[key]
+
+    def notify(self, project_id) -> None:
+        key = str(project_id)
+        with self._lock:
+            event = self._events.get(key)
+            if event is None:
+                return
+            # later subscribers wait for the message after this one
+            self._events[key] = self.event_type()
+        event.set()
+
+    def _on_message(self, message) -> None:
+        self.notify(_project_id(message["channel"]))
+
+    def _start(self) -> None:
+        raise NotImplementedError
+
+
+class Hub(_Hub):
+    event_type = threading.Event
+
+    def __init__(self, redis):
+        super().__init__(redis)
+        self._thread = None
+        self._pid = None
+
+    def _start(self) -> None:
+        # started on first use, so every forked worker gets its own
+        pid = os.getpid()
+        if self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread.is_alive():
+                return
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(**{CHANNEL_PREFIX + "*": self._on_message})
+            self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            self._pid = pid
+
+    def publish(self, project_id) -> None:
+        try:
+            self.redis.publish(_channel(project_id), "")
+        except redis.exceptions.RedisError:
+            # the message is stored; pollers see it on their next request
+            pass
+
+
+class AsyncHub(_Hub):
+    """
+        the same as Hub, for the asgi app.
+        notify() runs in the listener task, so asyncio events are safe.
+    """
+
+    event_type = asyncio.Event
+
+    def __init__(self, redis):
+        super().__init__(redis)
+        self._task = None
+
+    async def _listen(self) -> None:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+        try:
+            async for message in pubsub.listen():
+                self._on_message(message)
+        finally:
+            await pubsub.aclose()
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+    async def publish(self, project_id) -> None:
+        try:
+            await self.redis.publish(_channel(project_id), "")
+        except redis.exceptions.RedisError:
+            pass
+
+
+hub = Hub(
+    metrics.instrument_redis(redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT))
+)
+hub_async = AsyncHub(
+    metrics.instrument_redis(
+        redis.asyncio.StrictRedis(host=REDIS_HOST, port=REDIS_PORT)
+    )
+)
+
+
+async def wait_async(event, timeout: float) -> bool:
+    """
+        event.wait(timeout) of a threading.Event, for an asyncio.Event.
+    """
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        return False
+    return True
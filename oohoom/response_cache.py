@@ -0,0 +1,259 @@
+"""
+    cache of the responses of public read routes, with strong etags.
+
+    an entry is keyed on the route, its params and the versions of its tags
+    (e.g. "project:<_id>", "projects"). invalidate() bumps the versions of
+    tags, so the next lookup misses and the stale entries just age out.
+    with the redis tier the versions are read from redis, one MGET per
+    lookup, so an invalidation reaches every worker before its response.
+"""
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import falcon
+
+from . import connections, cursors, media
+from .config import RESPONSE_CACHE, RESPONSE_CACHE_REDIS_DB
+from .constants import RESPONSE_CACHE_MAXSIZE, RESPONSE_CACHE_TTL
+
+# response headers kept with the body
+HEADERS = (cursors.HEADER,)
+
+
+class ResponseCache(object):
+    def __init__(
+        self, ttl=RESPONSE_CACHE_TTL, maxsize=RESPONSE_CACHE_MAXSIZE, redis=None
+    ):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.redis = redis
+        # key -> (entry, expires), least recently used first
+        self._entries = OrderedDict()
+        # tag -> version, without redis
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _tag_key(tag: str) -> str:
+        return "response_cache:tag:" + tag
+
+    def _versioned(self, key: str, tags: tuple) -> str:
+        if self.redis is not None:
+            versions = self.redis.mget([self._tag_key(tag) for tag in tags])
+            versions = [int(version or 0) for version in versions]
+        else:
+            with self._lock:
+                versions = [self._versions.get(tag, 0) for tag in tags]
+        return "{}|{}".format(key, ",".join(map(str, versions)))
+
+    def get(self, key: str, tags: tuple):
+        """
+            (versioned key, entry or None). an entry is {body, etag, headers}.
+        """
+        key = self._versioned(key, tags)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return key, entry[0]
+                del self._entries[key]
+        if self.redis is not None:
+            stored = self.redis.get("response_cache:" + key)
+            if stored is not None:
+                entry = json.loads(stored)
+                self._set_local(key, entry, now)
+                self.hits += 1
+                return key, entry
+        self.misses += 1
+        return key, None
+
+    def _set_local(self, key: str, entry: dict, now: float) -> None:
+        with self._lock:
+            self._entries[key] = (entry, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def set(self, key: str, entry: dict) -> None:
+        """
+            key is the versioned key get() returned.
+        """
+        self._set_local(key, entry, time.monotonic())
+        if self.redis is not None:
+            self.redis.set("response_cache:" + key, json.dumps(entry), ex=self.ttl)
+
+    def invalidate(self, *tags) -> None:
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+        if self.redis is not None:
+            pipe = self.redis.pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(self._tag_key(tag))
+            pipe.execute()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class NoCache(object):
+    """
+        a ResponseCache that never hits.
+    """
+
+    def get(self, key: str, tags: tuple):
+        return None, None
+
+    def set(self, key: str, entry: dict) -> None:
+        pass
+
+    def invalidate(self, *tags) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {"hits": 0, "misses": 0, "size": 0}
+
+
+def from_config():
+    if RESPONSE_CACHE == "local":
+        return ResponseCache()
+    if RESPONSE_CACHE == "redis":
+        return ResponseCache(redis=connections.redis_client(RESPONSE_CACHE_REDIS_DB))
+    return NoCache()
+
+
+# replaced by create_app, see from_config
+cache = NoCache()
+
+
+async def _run(method, *args):
+    # blocking redis calls go to an executor thread
+    if getattr(cache, "redis", None) is not None:
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+    return method(*args)
+
+
+async def invalidate_async(*tags) -> None:
+    await _run(cache.invalidate, *tags)
+
+
+def _key(req, params: dict) -> str:
+    validated = getattr(req.context, "params", None) or {}
+    return "{} {} {}".format(
+        req.uri_template,
+        sorted((key, str(value)) for key, value in params.items()),
+        sorted((key, str(value)) for key, value in validated.items()),
+    )
+
+
+def _tags(tags: tuple, params: dict) -> tuple:
+    return tuple(tag.format(**params) for tag in tags)
+
+
+def _send(req, resp, entry: dict) -> None:
+    resp.etag = entry["etag"]
+    for name, value in entry["headers"].items():
+        resp.set_header(name, value)
+    if any(tag == "*" or tag == entry["etag"] for tag in req.if_none_match or ()):
+        resp.status = falcon.HTTP_NOT_MODIFIED
+    else:
+        resp.content_type = falcon.MEDIA_JSON
+        resp.data = entry["body"].encode("ascii")
+
+
+def _entry(body: bytes, resp) -> dict:
+    headers = {}
+    for name in HEADERS:
+        value = resp.get_header(name)
+        if value is not None:
+            headers[name] = value
+    return {
+        "body": body.decode("ascii"),
+        "etag": hashlib.blake2b(body, digest_size=16).hexdigest(),
+        "headers": headers,
+    }
+
+
+def _body(resp) -> bytes:
+    # a streamed array is gathered; pages are bounded by limit
+    if resp.stream is not None:
+        body = b"".join(resp.stream)
+        resp.stream = None
+    else:
+        body = media.dumps(resp.media).encode("ascii")
+        resp.media = None
+    return body
+
+
+async def _body_async(resp) -> bytes:
+    if resp.stream is not None:
+        body = b"".join([chunk async for chunk in resp.stream])
+        resp.stream = None
+    else:
+        body = media.dumps(resp.media).encode("ascii")
+        resp.media = None
+    return body
+
+
+def cached(*tags):
+    """
+        cache the 200 responses of a responder, sent with their etag.
+        tags are formatted with the route params, e.g. "project:{_id}".
+        put it below validate_req, so the key has the normalized params.
+    """
+
+    def decorator(responder):
+        @functools.wraps(responder)
+        def wrapper(self, req, resp, **params):
+            if isinstance(cache, NoCache):
+                # nothing to gather the body for; a stream stays a stream
+                return responder(self, req, resp, **params)
+            key, entry = cache.get(_key(req, params), _tags(tags, params))
+            if entry is not None:
+                _send(req, resp, entry)
+                return
+            responder(self, req, resp, **params)
+            if str(resp.status)[:3] == "200":
+                entry = _entry(_body(resp), resp)
+                cache.set(key, entry)
+                _send(req, resp, entry)
+
+        return wrapper
+
+    return decorator
+
+
+def cached_async(*tags):
+    """
+        the same as cached, for coroutine responders.
+        the redis tier is used on an executor thread.
+    """
+
+    def decorator(responder):
+        @functools.wraps(responder)
+        async def wrapper(self, req, resp, **params):
+            if isinstance(cache, NoCache):
+                return await responder(self, req, resp, **params)
+            key, entry = await _run(cache.get, _key(req, params), _tags(tags, params))
+            if entry is not None:
+                _send(req, resp, entry)
+                return
+            await responder(self, req, resp, **params)
+            if str(resp.status)[:3] == "200":
+                entry = _entry(await _body_async(resp), resp)
+                await _run(cache.set, key, entry)
+                _send(req, resp, entry)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,157 @@
+"""
+    validate_req schemas, shared by the wsgi (app.py) and asgi (asgi.py) resources.
+"""
+from . import fields
+from .constants import LIMIT, POLL_TIMEOUT
+
+SKIP = {"type": "integer", "coerce": int, "min": 0, "default": 0}
+LIMIT_ = {"type": "integer", "coerce": int, "min": 1, "default": LIMIT}
+# opaque keyset cursor, see cursors.py
+CURSOR = {"type": "string", "required": False}
+MOBILE = {"type": "string", "minlength": 5, "maxlength": 30}
+SKILLS = {
+    "type": "list",
+    "schema": {"type": "string", "minlength": 1, "maxlength": 36},
+    "maxlength": 30,
+}
+# sparse fieldsets of the list routes, see fields.py.
+# the compact defaults leave out what a list view doesn't show.
+PROJECT_FIELDS = fields.param(
+    [
+        "title",
+        "description",
+        "employer",
+        "employee",
+        "state",
+        "skills",
+        "creation_datetime",
+    ],
+    ["creation_datetime", "employee", "employer", "skills", "state", "title"],
+)
+# project_id is the query's own
+FILE_FIELDS = fields.param(
+    ["title", "project_id", "kind", "creation_datetime", "size"],
+    ["creation_datetime", "kind", "size", "title"],
+)
+MESSAGE_FIELDS = fields.param(
+    ["project_id", "body", "sender", "seen", "creation_datetime"],
+    ["body", "creation_datetime", "seen", "sender"],
+)
+
+USERS_GET = {
+    "role": {
+        "type": "string",
+        "regex": "^(employer|employee|all)$",
+        "default": "all",
+    },
+    "state": {
+        "type": "string",
+        "regex": "^(idle|busy|all)$",
+        "default": "all",
+    },
+    "skip": SKIP,
+    "limit": LIMIT_,
+    "cursor": CURSOR,
+}
+
+USERS_POST = {
+    "code": {"type": "string"},
+    "mobile": MOBILE,
+    "name": {
+        "type": "string",
+        "maxlength": 36,
+        "minlength": 1,
+        "regex": "^(?!(me)$)[a-z0-9_]+$",
+    },
+    "role": {"type": "string", "allowed": ["employer", "employee"]},
+    "skills": SKILLS,
+}
+
+CODE_POST = {"mobile": MOBILE}
+
+TOKEN_POST = {
+    "mobile": MOBILE,
+    "code": {"type": "string"},
+}
+
+PROJECTS_POST = {
+    "title": {"type": "string", "minlength": 1, "maxlength": 88},
+    "description": {"type": "string", "minlength": 0, "maxlength": 500},
+    "skills": SKILLS,
+}
+
+PROJECTS_GET = {
+    "state": {
+        "type": "string",
+        "regex": "^(new|assigned|done|closed|all)$",
+        "default": "all",
+    },
+    # full text search, see search.py
+    "q": {"type": "string", "minlength": 1, "maxlength": 100},
+    "fields": PROJECT_FIELDS,
+    "skip": SKIP,
+    "limit": LIMIT_,
+    "cursor": CURSOR,
+}
+
+PROJECTS_FEED_GET = {
+    "fields": PROJECT_FIELDS,
+    "skip": SKIP,
+    "limit": LIMIT_,
+}
+
+PROJECTS_PATCH = {
+    "action": {
+        "type": "string",
+        "regex": "^(assign|update|done)$",
+        "required": True,
+    },
+    "_id": {"type": "objectid", "required": True},
+    "update": {
+        "type": "dict",
+        "schema": {
+            "description": {"type": "string", "minlength": 0, "maxlength": 500},
+            "skills": SKILLS,
+        },
+        "dependencies": {"action": "update"},
+    },
+}
+
+FILES_GET = {
+    "project_id": {"type": "string", "required": True},
+    "kind": {"type": "string", "regex": "^(input|output)$", "default": "input"},
+    "fields": FILE_FIELDS,
+}
+
+MESSAGES_POST = {
+    "project_id": {"type": "objectid"},
+    "body": {"type": "string", "minlength": 1, "maxlength": 500},
+}
+
+MESSAGES_PATCH = {
+    "project_id": {"type": "objectid", "required": True},
+    # the newest message seen
+    "until": {"type": "objectid", "required": True},
+}
+
+MESSAGES_GET = {
+    "project_id": {"type": "string", "required": True},
+    "fields": MESSAGE_FIELDS,
+    "skip": SKIP,
+    "limit": LIMIT_,
+    "cursor": CURSOR,
+}
+
+MESSAGES_POLL_GET = {
+    "project_id": {"type": "string", "required": True},
+    # X-Next-Cursor of the previous poll
+    "since": CURSOR,
+    "limit": LIMIT_,
+    "timeout": {
+        "type": "integer",
+        "coerce": int,
+        "min": 0,
+        "max": POLL_TIMEOUT,
+        "default": POLL_TIMEOUT,
+    },
+}
@@ -0,0 +1,52 @@
+"""
+    full text search of projects, ranked by relevance.
+
+    the "search" text index (migration 6) covers title, description and
+    skills, with state as a suffix key so a state filter is applied in the
+    index. the language is "none": titles are persian as often as english,
+    so words are matched as they are, without stemming or stop words.
+"""
+import pymongo
+from pymongo import DESCENDING
+
+from .constants import SEARCH_MAX_TIME_MS
+
+INDEX = [
+    ("title", "text"),
+    ("skills", "text"),
+    ("description", "text"),
+    ("state", 1),
+]
+WEIGHTS = {"title": 10, "skills": 5, "description": 1}
+
+SCORE = {"$meta": "textScore"}
+
+
+def create_index(db) -> None:
+    db.projects.create_index(
+        INDEX, weights=WEIGHTS, default_language="none", name="search"
+    )
+
+
+def bounded():
+    """
+        SEARCH_MAX_TIME_MS, or less if the request's deadline is nearer.
+        the cursor of find must be read inside it; a request deadline
+        would otherwise take the place of the cursor's max_time_ms.
+    """
+    return pymongo.timeout(SEARCH_MAX_TIME_MS / 1000)
+
+
+def find(collection, q: str, filter_: dict, skip: int, limit: int, projection=None):
+    """
+        the page of projects matching q, best first, with their score.
+        raises pymongo.errors.ExecutionTimeout past SEARCH_MAX_TIME_MS.
+    """
+    return collection.find(
+        dict(filter_, **{"$text": {"$search": q}}),
+        projection=dict(projection or {}, score=SCORE),
+        sort=[("score", SCORE), ("_id", DESCENDING)],
+        skip=skip,
+        limit=limit,
+        max_time_ms=SEARCH_MAX_TIME_MS,
+    )
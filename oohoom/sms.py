@@ -0,0 +1,312 @@
+"""
+    outbound queue of verification sms.
+
+    CodeResource.on_post only enqueues a job; the worker takes up to
+    SMS_BATCH jobs at a time, sends them concurrently and records the
+    status of every job. a failed send is retried after SMS_BACKOFF,
+    doubled on every attempt, up to SMS_MAX_ATTEMPTS.
+
+    a taken job stays in the worker's processing list until its status is
+    recorded, and a worker that starts puts the jobs it left there back in
+    the queue. a crash may send an sms twice, but never drops one. workers
+    running at once need names of their own.
+
+    python -m oohoom.sms [--name NAME]
+"""
+import argparse
+import heapq
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import connections
+from .config import SMS_QUEUE_BACKEND, SMS_REDIS_DB
+from .constants import SMS_BACKOFF, SMS_BATCH, SMS_MAX_ATTEMPTS, SMS_STATUS_TTL
+
+QUEUED = "queued"
+SENT = "sent"
+RETRYING = "retrying"
+FAILED = "failed"
+
+QUEUE_KEY = "sms:queue"
+RETRY_KEY = "sms:retry"
+PROCESSING_KEY = "sms:processing:{}"
+
+# KEYS: retry, queue. ARGV: now, batch
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('RPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+
+def new_job(mobile: str, code: str) -> dict:
+    return {"id": uuid.uuid4().hex, "mobile": mobile, "code": code, "attempts": 0}
+
+
+def _status_key(job_id: str) -> str:
+    return "sms:status:" + job_id
+
+
+class RedisQueue(object):
+    """
+        jobs wait in a list, retries in a sorted set scored by their due time
+        and statuses in a hash per job, expiring after SMS_STATUS_TTL.
+        taken jobs are in the processing list of the worker name.
+        a job is stored as json.dumps(job) everywhere, so the same job is the
+        same member of every list.
+    """
+
+    def __init__(self, client, name="default"):
+        self.client = client
+        self.processing_key = PROCESSING_KEY.format(name)
+        self._promote = client.register_script(PROMOTE_SCRIPT)
+
+    def enqueue(self, job: dict) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(QUEUE_KEY, json.dumps(job))
+        pipe.hset(_status_key(job["id"]), mapping={"state": QUEUED, "attempts": 0})
+        pipe.expire(_status_key(job["id"]), SMS_STATUS_TTL)
+        pipe.execute()
+
+    def pop(self, count: int, timeout: float) -> list:
+        """
+            up to count jobs, waiting up to timeout for the first one.
+        """
+        first = self.client.blmove(
+            QUEUE_KEY, self.processing_key, timeout, "LEFT", "RIGHT"
+        )
+        if first is None:
+            return []
+        jobs = [first]
+        if count > 1:
+            pipe = self.client.pipeline(transaction=False)
+            for i in range(count - 1):
+                pipe.lmove(QUEUE_KEY, self.processing_key, "LEFT", "RIGHT")
+            jobs += [job for job in pipe.execute() if job is not None]
+        return [json.loads(job) for job in jobs]
+
+    def recover(self) -> int:
+        """
+            put the jobs taken and not recorded, e.g. before a crash, back at
+            the head of the queue. returns how many.
+        """
+        recovered = 0
+        while self.client.lmove(self.processing_key, QUEUE_KEY, "RIGHT", "LEFT"):
+            recovered += 1
+        return recovered
+
+    def promote(self, now: float, count: int) -> int:
+        """
+            move the retries due by now to the queue.
+        """
+        return self._promote(keys=[RETRY_KEY, QUEUE_KEY], args=[now, count])
+
+    def record(self, results: list, taken: list) -> None:
+        """
+            results: (job, status, due) where due is the time of the retry,
+            or None. taken: the jobs as pop returned them, done with.
+        """
+        # at once, so a job is either still taken or recorded
+        pipe = self.client.pipeline(transaction=True)
+        for job, status, due in results:
+            if due is not None:
+                pipe.zadd(RETRY_KEY, {json.dumps(job): due})
+            key = _status_key(job["id"])
+            pipe.hset(key, mapping=status)
+            pipe.expire(key, SMS_STATUS_TTL)
+        for job in taken:
+            pipe.lrem(self.processing_key, 1, json.dumps(job))
+        pipe.execute()
+
+    def status(self, job_id: str) -> dict:
+        return {
+            key.decode("utf8"): value.decode("utf8")
+            for key, value in self.client.hgetall(_status_key(job_id)).items()
+        }
+
+
+class AsyncRedisQueue(RedisQueue):
+    """
+        the enqueue of RedisQueue, for a redis.asyncio client.
+    """
+
+    async def enqueue(self, job: dict) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(QUEUE_KEY, json.dumps(job))
+        pipe.hset(_status_key(job["id"]), mapping={"state": QUEUED, "attempts": 0})
+        pipe.expire(_status_key(job["id"]), SMS_STATUS_TTL)
+        await pipe.execute()
+
+
+class LocalQueue(object):
+    """
+        an in-process stand-in for RedisQueue. statuses do not expire.
+    """
+
+    def __init__(self):
+        self._jobs = deque()
+        # (due, sequence, job)
+        self._retries = []
+        self._sequence = 0
+        self._statuses = {}
+        self._ready = threading.Condition()
+
+    def enqueue(self, job: dict) -> None:
+        with self._ready:
+            self._jobs.append(dict(job))
+            self._statuses[job["id"]] = {"state": QUEUED, "attempts": "0"}
+            self._ready.notify()
+
+    def pop(self, count: int, timeout: float) -> list:
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._jobs, timeout):
+                return []
+            return [self._jobs.popleft() for i in range(min(count, len(self._jobs)))]
+
+    def promote(self, now: float, count: int) -> int:
+        promoted = 0
+        with self._ready:
+            while self._retries and self._retries[0][0] <= now and promoted < count:
+                self._jobs.append(heapq.heappop(self._retries)[2])
+                promoted += 1
+            if promoted:
+                self._ready.notify_all()
+        return promoted
+
+    def recover(self) -> int:
+        # taken jobs are gone with the process
+        return 0
+
+    def record(self, results: list, taken: list) -> None:
+        with self._ready:
+            for job, status, due in results:
+                if due is not None:
+                    self._sequence += 1
+                    heapq.heappush(self._retries, (due, self._sequence, dict(job)))
+                self._statuses[job["id"]] = {
+                    key: str(value) for key, value in status.items()
+                }
+
+    def status(self, job_id: str) -> dict:
+        with self._ready:
+            return dict(self._statuses.get(job_id, {}))
+
+
+class AsyncLocalQueue(object):
+    """
+        a LocalQueue behind the interface of AsyncRedisQueue.
+    """
+
+    def __init__(self, queue: LocalQueue):
+        self.queue = queue
+
+    async def enqueue(self, job: dict) -> None:
+        self.queue.enqueue(job)
+
+
+def kavenegar_send(job: dict):
+    # imported here, so the web workers do not need it
+    from kavenegar import KavenegarAPI
+
+    from .local_config import KAVENEGAR_APIKEY
+
+    api = KavenegarAPI(KAVENEGAR_APIKEY)
+    return api.verify_lookup(
+        {"receptor": job["mobile"], "token": job["code"], "template": "code"}
+    )
+
+
+class Worker(object):
+    """
+        send(job) delivers one sms and raises on failure.
+    """
+
+    def __init__(self, queue, send=kavenegar_send, batch=SMS_BATCH):
+        self.queue = queue
+        self.send = send
+        self.batch = batch
+        self._pool = ThreadPoolExecutor(max_workers=batch)
+
+    def _attempt(self, job: dict):
+        job = dict(job, attempts=job["attempts"] + 1)
+        try:
+            response = self.send(job)
+        except Exception as e:
+            status = {"attempts": job["attempts"], "error": str(e)}
+            if job["attempts"] >= SMS_MAX_ATTEMPTS:
+                return job, dict(status, state=FAILED), None
+            due = time.time() + SMS_BACKOFF * 2 ** (job["attempts"] - 1)
+            return job, dict(status, state=RETRYING), due
+        status = {"state": SENT, "attempts": job["attempts"]}
+        # kavenegar answers [{messageid, status, ...}]
+        if isinstance(response, list) and response and "messageid" in response[0]:
+            status["messageid"] = response[0]["messageid"]
+        return job, status, None
+
+    def run_once(self, timeout: float = 1) -> int:
+        """
+            send one batch. returns the number of jobs taken.
+        """
+        self.queue.promote(time.time(), self.batch)
+        jobs = self.queue.pop(self.batch, timeout)
+        if jobs:
+            self.queue.record(list(self._pool.map(self._attempt, jobs)), jobs)
+        return len(jobs)
+
+    def run(self) -> None:
+        recovered = self.queue.recover()
+        if recovered:
+            print("recovered {} jobs taken before a restart".format(recovered))
+        while True:
+            self.run_once()
+
+
+def _queues():
+    if SMS_QUEUE_BACKEND == "local":
+        queue_ = LocalQueue()
+        return queue_, AsyncLocalQueue(queue_)
+    return (
+        RedisQueue(connections.redis_client(SMS_REDIS_DB)),
+        AsyncRedisQueue(connections.redis_client_async(SMS_REDIS_DB)),
+    )
+
+
+queue, queue_async = _queues()
+
+
+def enqueue(mobile: str, code: str) -> str:
+    job = new_job(mobile, code)
+    queue.enqueue(job)
+    return job["id"]
+
+
+async def enqueue_async(mobile: str, code: str) -> str:
+    job = new_job(mobile, code)
+    await queue_async.enqueue(job)
+    return job["id"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--name", default="default", help="of this worker, unique among them"
+    )
+    args = parser.parse_args()
+    if SMS_QUEUE_BACKEND == "local":
+        print("the local queue is not shared with the web workers")
+        return 1
+    print("sending sms, batches of {}".format(SMS_BATCH))
+    Worker(RedisQueue(queue.client, args.name)).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
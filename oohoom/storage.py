@@ -0,0 +1,315 @@
+"""
+    content addressed storage of uploaded files.
+
+    a file is stored once, under the sha-256 of its content, however many
+    projects it is uploaded to. the digest is computed while the upload is
+    written, so the content is read once. db.blobs counts the files
+    documents that refer to it, {_id: digest, refs, size, location}, and the
+    content is deleted when the last reference is released. the blob is
+    marked deleting meanwhile, so an upload of the same content that
+    commits in between keeps it, see _CountedStorage.release.
+
+    LocalStorage fans the content out under STORAGE_PATH/ab/cd/<digest>, so
+    no directory holds more than a few hundred entries even with millions of
+    files. GridFSStorage keeps it in the "blobs" GridFS bucket.
+
+    a backend writes an upload as pending content, no more than a limit,
+    then commits it once the files document may be inserted, or discards it.
+"""
+import hashlib
+import io
+import os
+import uuid
+from datetime import datetime
+
+import gridfs
+from pymongo import ReturnDocument
+
+from . import connections, downloads
+from .config import STORAGE_BACKEND, STORAGE_PATH
+
+# bytes copied at a time from an upload
+COPY_SIZE = 64 * 1024
+
+
+class Pending(object):
+    """
+        written and hashed content, not committed yet.
+        location is where the backend wrote it.
+    """
+
+    def __init__(self, digest: str, size: int, location):
+        self.digest = digest
+        self.size = size
+        self.location = location
+
+
+class TooLarge(Exception):
+    """
+        the content is over the limit it was written with.
+    """
+
+    def __init__(self, limit: int):
+        super().__init__(limit)
+        self.limit = limit
+
+
+def _copy(stream, dest, limit=None):
+    """
+        copy stream to dest, hashing it on the way.
+        raises TooLarge as soon as more than limit bytes are read.
+        returns (digest, size).
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(COPY_SIZE)
+        if not chunk:
+            break
+        if limit is not None and size + len(chunk) > limit:
+            raise TooLarge(limit)
+        sha256.update(chunk)
+        dest.write(chunk)
+        size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+class _CountedStorage(object):
+    """
+        the reference counts of the blobs of db.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def _ref(self, pending: Pending, location=None) -> dict:
+        """
+            one more reference to the content of pending.
+            returns the blob as it was before, None if it is new.
+        """
+        return self.db.blobs.find_one_and_update(
+            {"_id": pending.digest},
+            {
+                "$inc": {"refs": 1},
+                "$setOnInsert": {
+                    "size": pending.size,
+                    "location": location,
+                    "creation_datetime": datetime.utcnow(),
+                },
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    def release(self, digest: str) -> None:
+        """
+            one reference less; the content goes with the last one.
+        """
+        blob = self.db.blobs.find_one_and_update(
+            {"_id": digest},
+            {"$inc": {"refs": -1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if blob is None or blob["refs"] > 0:
+            return
+        # one release at a time deletes the content. a commit that finds
+        # the mark puts its own content in place, see commit
+        blob = self.db.blobs.find_one_and_update(
+            {"_id": digest, "refs": {"$lte": 0}, "deleting": None},
+            {"$set": {"deleting": uuid.uuid4().hex}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if blob is None:
+            # referenced again, or being deleted already
+            return
+        self._detach(blob)
+        if self.db.blobs.delete_one(
+            {"_id": digest, "refs": {"$lte": 0}, "deleting": blob["deleting"]}
+        ).deleted_count:
+            self._delete(blob)
+            return
+        # referenced again meanwhile
+        self._reattach(blob)
+        self.db.blobs.update_one(
+            {"_id": digest, "deleting": blob["deleting"]},
+            {"$unset": {"deleting": ""}},
+        )
+
+    def _detach(self, blob: dict) -> None:
+        """
+            take the content of blob out of reach of new downloads.
+        """
+        raise NotImplementedError
+
+    def _reattach(self, blob: dict) -> None:
+        """
+            undo _detach, as the blob was referenced again.
+        """
+        raise NotImplementedError
+
+    def _delete(self, blob: dict) -> None:
+        """
+            delete the content _detach took away.
+        """
+        raise NotImplementedError
+
+
+class LocalStorage(_CountedStorage):
+    def __init__(self, db, root=STORAGE_PATH):
+        super().__init__(db)
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def write(self, stream, limit=None) -> Pending:
+        # in root, so the commit is a rename on the same file system
+        temp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(temp_dir, exist_ok=True)
+        temp_path = os.path.join(temp_dir, uuid.uuid4().hex)
+        try:
+            with io.open(temp_path, "wb") as dest:
+                digest, size = _copy(stream, dest, limit)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return Pending(digest, size, temp_path)
+
+    def discard(self, pending: Pending) -> None:
+        os.remove(pending.location)
+
+    def commit(self, pending: Pending) -> str:
+        """
+            returns the digest the files document refers to.
+        """
+        path = self.path(pending.digest)
+        blob = self._ref(pending)
+        # a release may be moving the content away, see release
+        if blob is None or "deleting" in blob or not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(pending.location, path)
+        else:
+            # stored already
+            os.remove(pending.location)
+        return pending.digest
+
+    def open(self, digest: str, start: int, length: int):
+        return downloads.FileRange(self.path(digest), start, length)
+
+    def _detached_path(self, blob: dict) -> str:
+        return os.path.join(self.root, "tmp", blob["deleting"])
+
+    def _detach(self, blob: dict) -> None:
+        try:
+            os.replace(self.path(blob["_id"]), self._detached_path(blob))
+        except FileNotFoundError:
+            pass
+
+    def _reattach(self, blob: dict) -> None:
+        # the same content, if a commit has put it back already
+        try:
+            os.replace(self._detached_path(blob), self.path(blob["_id"]))
+        except FileNotFoundError:
+            pass
+
+    def _delete(self, blob: dict) -> None:
+        try:
+            os.remove(self._detached_path(blob))
+        except FileNotFoundError:
+            pass
+
+
+class GridFSStorage(_CountedStorage):
+    """
+        the digest is known once the upload is written, so the content is
+        written under an ObjectId; the blob keeps it as its location.
+    """
+
+    def __init__(self, db, bucket_name="blobs"):
+        super().__init__(db)
+        self.bucket_name = bucket_name
+
+    def _bucket(self) -> gridfs.GridFSBucket:
+        # GridFSBucket wants the database itself, not a connections handle
+        db = self.db.get() if isinstance(self.db, connections.Database) else self.db
+        return gridfs.GridFSBucket(db, bucket_name=self.bucket_name)
+
+    def write(self, stream, limit=None) -> Pending:
+        upload = self._bucket().open_upload_stream("upload")
+        try:
+            digest, size = _copy(stream, upload, limit)
+        except BaseException:
+            upload.abort()
+            raise
+        upload.close()
+        return Pending(digest, size, upload._id)
+
+    def discard(self, pending: Pending) -> None:
+        self._bucket().delete(pending.location)
+
+    def commit(self, pending: Pending) -> str:
+        blob = self._ref(pending, pending.location)
+        if blob is None:
+            return pending.digest
+        if "deleting" in blob and self.db.blobs.update_one(
+            {"_id": pending.digest, "location": blob["location"]},
+            {"$set": {"location": pending.location}},
+        ).matched_count:
+            # a release is deleting the stored content; this one takes its place
+            return pending.digest
+        # stored already
+        self._bucket().delete(pending.location)
+        return pending.digest
+
+    def open(self, digest: str, start: int, length: int):
+        blob = self.db.blobs.find_one({"_id": digest}, projection={"location": 1})
+        if blob is None:
+            raise FileNotFoundError(digest)
+        return downloads.Range(
+            self._bucket().open_download_stream(blob["location"]), start, length
+        )
+
+    def _detach(self, blob: dict) -> None:
+        # a commit meanwhile points the blob to its own upload
+        try:
+            self._bucket().delete(blob["location"])
+        except gridfs.errors.NoFile:
+            pass
+
+    def _reattach(self, blob: dict) -> None:
+        pass
+
+    def _delete(self, blob: dict) -> None:
+        pass
+
+
+def from_config(db):
+    if STORAGE_BACKEND == "gridfs":
+        return GridFSStorage(db)
+    return LocalStorage(db)
+
+
+def import_legacy(db, backend, root=STORAGE_PATH) -> int:
+    """
+        move the files stored as root/<_id>, from before the backends, into
+        backend. returns how many were moved.
+    """
+    moved = 0
+    for file_ in db.files.find({"digest": {"$exists": False}}, projection={"_id": 1}):
+        path = os.path.join(root, str(file_["_id"]))
+        if not os.path.exists(path):
+            continue
+        with io.open(path, "rb") as stream:
+            pending = backend.write(stream)
+        backend.commit(pending)
+        db.files.update_one(
+            {"_id": file_["_id"]},
+            {"$set": {"digest": pending.digest, "size": pending.size}},
+        )
+        os.remove(path)
+        moved += 1
+    return moved
+
+
+# replaced by create_app, see from_config
+backend = from_config(connections.database("test_oohoom"))
@@ -0,0 +1,108 @@
+"""
+    unread message counters, one document per project:
+    {_id: project_id, employer: n, employee: n}.
+
+    MessageResource.on_post counts a message for the member who did not send
+    it; marking messages seen takes back what update_many modified, so the
+    counters stay exact without counting messages.
+"""
+from pymongo import DESCENDING, UpdateOne
+
+from . import cursors, membership
+
+RECIPIENT = {
+    membership.EMPLOYER: membership.EMPLOYEE,
+    membership.EMPLOYEE: membership.EMPLOYER,
+}
+
+
+# these return what the driver does; motor callers await them
+
+
+def sent(db, project_id, sender_role: str):
+    return db.unread.update_one(
+        {"_id": project_id}, {"$inc": {RECIPIENT[sender_role]: 1}}, upsert=True
+    )
+
+
+def seen(db, project_id, role: str, count: int):
+    return db.unread.update_one({"_id": project_id}, {"$inc": {role: -count}})
+
+
+def unseen_filter(project_id, user_id, message: dict) -> dict:
+    """
+        unseen messages of the other member, up to and including message.
+    """
+    return cursors.key_id_from(
+        {"project_id": project_id, "seen": False, "sender._id": {"$ne": user_id}},
+        "creation_datetime",
+        message["creation_datetime"],
+        message["_id"],
+        DESCENDING,
+        inclusive=True,
+    )
+
+
+def member_projects_filter(user_id) -> dict:
+    return {"$or": [{"employer._id": user_id}, {"employee._id": user_id}]}
+
+
+def counts(projects, counters, user_id) -> list:
+    """
+        [{project_id, unread}] of user_id, from its projects
+        ({_id, employer._id}) and their counters.
+    """
+    counters = {counter["_id"]: counter for counter in counters}
+    result = []
+    for project in projects:
+        role = (
+            membership.EMPLOYER
+            if project["employer"]["_id"] == user_id
+            else membership.EMPLOYEE
+        )
+        counter = counters.get(project["_id"], {})
+        result.append({"project_id": project["_id"], "unread": counter.get(role, 0)})
+    return result
+
+
+def recompute(db) -> None:
+    """
+        rebuild the counters from the unseen messages.
+    """
+    unseen = db.messages.aggregate(
+        [
+            {"$match": {"seen": False}},
+            {
+                "$group": {
+                    "_id": {"project_id": "$project_id", "sender": "$sender._id"},
+                    "count": {"$sum": 1},
+                }
+            },
+        ]
+    )
+    counters = {}
+    for group in unseen:
+        project_id = group["_id"]["project_id"]
+        project = db.projects.find_one({"_id": project_id}, {"employer._id": 1})
+        if project is None:
+            continue
+        sender_role = (
+            membership.EMPLOYER
+            if project["employer"]["_id"] == group["_id"]["sender"]
+            else membership.EMPLOYEE
+        )
+        counter = counters.setdefault(
+            project_id, {membership.EMPLOYER: 0, membership.EMPLOYEE: 0}
+        )
+        counter[RECIPIENT[sender_role]] += group["count"]
+    # overwritten in place, then the stale ones go: a counter is never read
+    # as zero meanwhile, and a failed run leaves the old counters
+    if counters:
+        db.unread.bulk_write(
+            [
+                UpdateOne({"_id": project_id}, {"$set": counter}, upsert=True)
+                for project_id, counter in counters.items()
+            ],
+            ordered=False,
+        )
+    db.unread.delete_many({"_id": {"$nin": list(counters)}})
@@ -0,0 +1,167 @@
+"""
+    streaming multipart/form-data uploads of files.
+
+    the parts are read in order, as they arrive. project_id and kind have to
+    come before the file, so the upload is authorized, and its limit known,
+    before a byte of the file is read. the file is then streamed to the
+    storage backend, and aborted as soon as it is over the limit; it is never
+    held in memory whole.
+
+    the files of a project may take PROJECT_FILES_MAX_SIZE bytes in all,
+    counted by projects.files_size. the limit of an upload is checked before
+    it is read, and the bytes are reserved atomically once it is, as another
+    upload to the project may have finished meanwhile.
+"""
+import contextlib
+from datetime import datetime
+
+import falcon
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from . import membership, storage
+from .constants import (
+    PROJECT_FILES_MAX_SIZE,
+    UPLOAD_MAX_PARTS,
+    UPLOAD_MAX_SIZE,
+    UPLOAD_MAX_TEXT_SIZE,
+)
+
+# the role that uploads each kind of file
+ROLES = {"input": membership.EMPLOYER, "output": membership.EMPLOYEE}
+# a body bigger than this is refused before it is read
+MAX_BODY_SIZE = UPLOAD_MAX_SIZE + UPLOAD_MAX_PARTS * 2 * UPLOAD_MAX_TEXT_SIZE
+
+
+def form_handler() -> falcon.media.MultipartFormHandler:
+    options = falcon.media.multipart.MultipartParseOptions()
+    options.max_body_part_count = UPLOAD_MAX_PARTS
+    # of the text parts; the file is streamed
+    options.max_body_part_buffer_size = UPLOAD_MAX_TEXT_SIZE
+    options.max_body_part_headers_size = UPLOAD_MAX_TEXT_SIZE
+    return falcon.media.MultipartFormHandler(options)
+
+
+def check_length(req) -> None:
+    if req.content_length is not None and req.content_length > MAX_BODY_SIZE:
+        raise falcon.HTTPPayloadTooLarge(
+            title="a file may be {} bytes at most".format(UPLOAD_MAX_SIZE)
+        )
+
+
+def _limit(project) -> int:
+    left = PROJECT_FILES_MAX_SIZE - (project or {}).get("files_size", 0)
+    if left <= 0:
+        raise falcon.HTTPPayloadTooLarge(title="the project is out of space")
+    return min(UPLOAD_MAX_SIZE, left)
+
+
+def _check_role(role: str, kind: str) -> None:
+    if role != ROLES[kind]:
+        raise falcon.errors.HTTPForbidden(title="no such project found for you")
+
+
+def limit(db, project_id: ObjectId, user_id: ObjectId, kind: str) -> int:
+    """
+        the bytes the user may upload to the project as a file of kind.
+    """
+    _check_role(membership.role(db, project_id, user_id), kind)
+    return _limit(db.projects.find_one({"_id": project_id}, {"files_size": 1}))
+
+
+async def limit_async(db, project_id: ObjectId, user_id: ObjectId, kind: str) -> int:
+    """
+        the same as limit, for motor.
+    """
+    _check_role(await membership.role_async(db, project_id, user_id), kind)
+    return _limit(await db.projects.find_one({"_id": project_id}, {"files_size": 1}))
+
+
+def receive(form, authorize, paced=contextlib.nullcontext) -> tuple:
+    """
+        read the parts of form and write the file to the storage backend.
+        authorize(project_id, kind) returns the limit of the file, see limit.
+        the write runs within paced(), see deadlines.paused.
+        blocking; the asgi app runs it with run_sync.
+        returns (file_, pending).
+    """
+    file_ = {"creation_datetime": datetime.utcnow()}
+    pending = None
+    try:
+        for part in form:
+            if part.name == "project_id":
+                try:
+                    file_["project_id"] = ObjectId(part.text)
+                except (InvalidId, TypeError):
+                    raise falcon.errors.HTTPBadRequest(title="`project_id` is invalid")
+            elif part.name == "kind":
+                file_["kind"] = part.text
+                if file_["kind"] not in ROLES:
+                    raise falcon.errors.HTTPBadRequest(
+                        title="`kind` should be `input|output`"
+                    )
+            elif part.name == "file":
+                if pending is not None:
+                    raise falcon.errors.HTTPBadRequest(title="one `file` at a time")
+                if "project_id" not in file_ or "kind" not in file_:
+                    raise falcon.errors.HTTPBadRequest(
+                        title="`project_id` and `kind` should come before `file`"
+                    )
+                if not part.filename or len(part.filename) > 88:
+                    raise falcon.errors.HTTPBadRequest(
+                        title="the file name should be 1 to 88 characters"
+                    )
+                file_["title"] = part.filename
+                limit_ = authorize(file_["project_id"], file_["kind"])
+                try:
+                    with paced():
+                        pending = storage.backend.write(part.stream, limit_)
+                except storage.TooLarge as e:
+                    raise falcon.HTTPPayloadTooLarge(
+                        title="the file may be {} bytes at most".format(e.limit)
+                    )
+        if pending is None:
+            raise falcon.errors.HTTPBadRequest(title="`file` is required")
+    except BaseException:
+        if pending is not None:
+            storage.backend.discard(pending)
+        raise
+    return file_, pending
+
+
+def reserve(db, project_id: ObjectId, size: int):
+    """
+        matches nothing when the project has no room for size bytes more.
+    """
+    return db.projects.update_one(
+        {
+            "_id": project_id,
+            # files_size is missing until the first file
+            "files_size": {"$not": {"$gt": PROJECT_FILES_MAX_SIZE - size}},
+        },
+        {"$inc": {"files_size": size}},
+    )
+
+
+def refund(db, project_id: ObjectId, size: int):
+    return db.projects.update_one({"_id": project_id}, {"$inc": {"files_size": -size}})
+
+
+def recompute(db) -> None:
+    """
+        files_size of every project, from its files.
+    """
+    sizes = db.files.aggregate(
+        [
+            {
+                "$group": {
+                    "_id": "$project_id",
+                    "size": {"$sum": {"$ifNull": ["$size", 0]}},
+                }
+            }
+        ]
+    )
+    for size in sizes:
+        db.projects.update_one(
+            {"_id": size["_id"]}, {"$set": {"files_size": size["size"]}}
+        )
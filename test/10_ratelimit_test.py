@@ -0,0 +1,82 @@
+import time
+
+import falcon
+from falcon import testing
+
+from ..oohoom import ratelimit
+from ..oohoom.middlewares import client_ip, rate_limit, shed_load
+
+
+class OkResource(object):
+    def on_post(self, req, resp):
+        resp.media = {"ok": True}
+
+
+def client(*middleware):
+    app = falcon.App(middleware=list(middleware))
+    app.add_route("/v1/code", OkResource())
+    return testing.TestClient(app)
+
+
+def test_buckets():
+    buckets = ratelimit.LocalBuckets()
+    limits = [(1 / 60, 2), (1 / 60, 1)]
+    assert buckets.take(["a", "b"], limits) == 0
+    # b is empty, so a pays nothing
+    assert buckets.take(["a", "b"], limits) > 0
+    assert buckets.take(["a"], limits[:1]) == 0
+    assert 0 < buckets.take(["a"], limits[:1]) <= 60
+
+
+def test_rate_limit():
+    buckets = ratelimit.LocalBuckets()
+    limits = {("POST", "/v1/code"): [("ip", 1 / 60, 5), ("mobile", 1 / 60, 2)]}
+    oohoom = client(rate_limit(buckets, limits=limits))
+    for i in range(2):
+        resp = oohoom.simulate_post("/v1/code", json={"mobile": "989000000000"})
+        assert resp.status_code == 200
+    # the same mobile, normalized
+    resp = oohoom.simulate_post("/v1/code", json={"mobile": "+00989000000000"[1:]})
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 1
+    resp = oohoom.simulate_post("/v1/code", json={"mobile": "989000000001"})
+    assert resp.status_code == 200
+
+
+def test_shed_load():
+    shedder = shed_load(max_in_flight=None, max_queue_wait=1)
+    oohoom = client(shedder)
+    resp = oohoom.simulate_post(
+        "/v1/code", headers={"X-Request-Start": "t={}".format(time.time() - 5)}
+    )
+    assert resp.status_code == 503
+    resp = oohoom.simulate_post(
+        "/v1/code", headers={"X-Request-Start": "t={}".format(time.time())}
+    )
+    assert resp.status_code == 200
+    assert shedder.shed == 1
+
+
+def test_in_flight():
+    shedder = shed_load(max_in_flight=1, max_queue_wait=None)
+    oohoom = client(shedder)
+    assert oohoom.simulate_post("/v1/code").status_code == 200
+    assert shedder.in_flight == 0
+    shedder.in_flight = 1
+    assert oohoom.simulate_post("/v1/code").status_code == 503
+    assert shedder.in_flight == 1
+
+
+def test_client_ip():
+    def req(forwarded=None):
+        headers = {"X-Forwarded-For": forwarded} if forwarded else {}
+        return falcon.Request(
+            testing.create_environ(headers=headers, remote_addr="10.0.0.1")
+        )
+
+    assert client_ip(req("1.2.3.4"), False) == "10.0.0.1"
+    # the proxy appended the address it saw; the rest is the client's
+    assert client_ip(req("6.6.6.6, 1.2.3.4"), True) == "1.2.3.4"
+    assert client_ip(req("6.6.6.6, 1.2.3.4, 10.0.0.2"), 2) == "1.2.3.4"
+    assert client_ip(req("1.2.3.4"), 2) == "10.0.0.1"
+    assert client_ip(req(), True) == "10.0.0.1"
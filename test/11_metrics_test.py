@@ -0,0 +1,131 @@
+import time
+
+import falcon
+import pytest
+from falcon import testing
+
+from ..oohoom import metrics
+
+
+class SlowResource(object):
+    def on_get(self, req, resp, name):
+        resp.media = {"name": name}
+
+
+class PollResource(object):
+    def on_get(self, req, resp):
+        with metrics.waiting(req):
+            time.sleep(0.2)
+        resp.media = []
+
+
+class Client(object):
+    # the two entry points instrument_redis wraps
+    def execute_command(self, *args, **options):
+        return args
+
+    def pipeline(self, transaction=True):
+        return Pipeline()
+
+
+class Pipeline(object):
+    def execute(self):
+        return []
+
+
+def test_measure():
+    registry = metrics.Registry()
+    app = falcon.App(middleware=[metrics.measure(registry, slow=None)])
+    app.add_route("/v1/users/{name}", SlowResource())
+    oohoom = testing.TestClient(app)
+    oohoom.simulate_get("/v1/users/a_name")
+    oohoom.simulate_get("/v1/users/another_name")
+    oohoom.simulate_get("/v1/nothing")
+    text = registry.exposition()
+    # by route template, not path
+    assert (
+        'oohoom_requests_total{route="/v1/users/{name}",method="GET",status="200"} 2'
+        in text
+    )
+    assert (
+        'oohoom_requests_total{route="unmatched",method="GET",status="404"} 1' in text
+    )
+    assert (
+        'oohoom_request_duration_seconds_count{route="/v1/users/{name}",method="GET"} 2'
+        in text
+    )
+    assert 'le="+Inf"} 2' in text
+
+
+def test_gauge():
+    registry = metrics.Registry()
+    registry.gauge("oohoom_answer", "the answer", lambda: 42)
+    assert "# TYPE oohoom_answer gauge\noohoom_answer 42\n" in registry.exposition()
+
+
+def test_redis():
+    client = metrics.instrument_redis(Client())
+    stats = metrics.RequestStats()
+    token = metrics._current.set(stats)
+    try:
+        assert client.execute_command("GET", "key") == ("GET", "key")
+        client.pipeline(transaction=False).execute()
+    finally:
+        metrics._current.reset(token)
+    assert stats.redis_calls == 2
+    assert metrics.registry.redis["GET"][0] >= 1
+    assert metrics.registry.redis["PIPELINE"][0] >= 1
+
+
+def test_shape():
+    query = {
+        "project_id": "5f0c",
+        "$or": [{"creation_datetime": {"$lt": 1}}, {"creation_datetime": {"$lt": 2}}],
+    }
+    assert metrics.shape(query) == {
+        "project_id": 1,
+        "$or": [{"creation_datetime": {"$lt": 1}}],
+    }
+
+
+def test_authorize():
+    def req(authorization=None):
+        headers = {"Authorization": authorization} if authorization else {}
+        return falcon.Request(testing.create_environ(headers=headers))
+
+    # not served without a token
+    with pytest.raises(falcon.HTTPNotFound):
+        metrics.authorize(req("Bearer a-token"), None)
+    for authorization in (None, "Bearer another", "a-token"):
+        with pytest.raises(falcon.HTTPUnauthorized):
+            metrics.authorize(req(authorization), "a-token")
+    metrics.authorize(req("Bearer a-token"), "a-token")
+
+
+def test_families():
+    registry = metrics.Registry()
+    registry.mongo_command("find", "users", 0.5)
+    registry.mongo_command("insert", "users", 0.25)
+    registry.redis_command("GET", 0.125)
+    family = None
+    for line in registry.exposition().splitlines():
+        if line.startswith("# TYPE "):
+            family = line.split()[2]
+        elif not line.startswith("#"):
+            # every sample in the block of its family
+            assert line.split("{")[0].split()[0].startswith(family)
+    text = registry.exposition()
+    assert (
+        "# TYPE oohoom_mongo_seconds_total counter\n"
+        'oohoom_mongo_seconds_total{command="find",collection="users"} 0.5\n'
+    ) in text
+
+
+def test_waiting(caplog):
+    registry = metrics.Registry()
+    app = falcon.App(middleware=[metrics.measure(registry, slow=0.1)])
+    app.add_route("/v1/messages/poll", PollResource())
+    testing.TestClient(app).simulate_get("/v1/messages/poll")
+    # the wait is neither slow nor in the latency
+    assert not [r for r in caplog.records if r.name == "oohoom.slow"]
+    assert registry.latency[("/v1/messages/poll", "GET")].sum < 0.1
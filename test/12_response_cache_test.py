@@ -0,0 +1,80 @@
+import inspect
+
+import falcon
+import pytest
+from falcon import testing
+
+from ..oohoom import media, response_cache
+
+
+class ProjectResource(object):
+    def __init__(self):
+        self.calls = 0
+
+    @response_cache.cached("project:{_id}")
+    def on_get__id(self, req, resp, _id):
+        self.calls += 1
+        resp.media = {"_id": _id, "calls": self.calls}
+
+    @response_cache.cached("projects")
+    def on_get(self, req, resp):
+        self.calls += 1
+        resp.set_header("X-Next-Cursor", "next")
+        media.stream_array(resp, [{"calls": self.calls}])
+
+
+@pytest.fixture
+def oohoom():
+    response_cache.cache = response_cache.ResponseCache(ttl=60, maxsize=10)
+    app = falcon.App()
+    resource = ProjectResource()
+    app.add_route("/v1/projects", resource)
+    app.add_route("/v1/projects/{_id}", resource, suffix="_id")
+    yield testing.TestClient(app)
+    response_cache.cache = response_cache.NoCache()
+
+
+def test_hit(oohoom):
+    first = oohoom.simulate_get("/v1/projects/a")
+    assert first.json == {"_id": "a", "calls": 1}
+    assert first.headers["ETag"]
+    again = oohoom.simulate_get("/v1/projects/a")
+    assert again.json == first.json
+    assert again.headers["ETag"] == first.headers["ETag"]
+    # another key
+    assert oohoom.simulate_get("/v1/projects/b").json["calls"] == 2
+
+
+def test_not_modified(oohoom):
+    etag = oohoom.simulate_get("/v1/projects/a").headers["ETag"]
+    resp = oohoom.simulate_get("/v1/projects/a", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+
+def test_invalidate(oohoom):
+    oohoom.simulate_get("/v1/projects/a")
+    oohoom.simulate_get("/v1/projects/b")
+    response_cache.cache.invalidate("project:a")
+    assert oohoom.simulate_get("/v1/projects/a").json["calls"] == 3
+    assert oohoom.simulate_get("/v1/projects/b").json["calls"] == 2
+
+
+def test_stream(oohoom):
+    first = oohoom.simulate_get("/v1/projects")
+    again = oohoom.simulate_get("/v1/projects")
+    assert first.json == again.json == [{"calls": 1}]
+    assert again.headers["X-Next-Cursor"] == "next"
+    response_cache.cache.invalidate("projects")
+    assert oohoom.simulate_get("/v1/projects").json == [{"calls": 2}]
+
+
+def test_no_cache(oohoom):
+    response_cache.cache = response_cache.NoCache()
+    resource = ProjectResource()
+    req = falcon.Request(testing.create_environ("/v1/projects"))
+    resp = falcon.Response()
+    resource.on_get(req, resp)
+    # not gathered
+    assert inspect.isgenerator(resp.stream)
+    assert "ETag" not in resp.headers
@@ -0,0 +1,94 @@
+import gzip
+import json
+
+import falcon
+import pytest
+from falcon import testing
+
+from ..oohoom import compression, media
+from ..oohoom.middlewares import compress
+
+DOCS = [{"title": "project {}".format(i), "skills": ["a", "b"]} for i in range(500)]
+
+
+class ListResource(object):
+    def on_get(self, req, resp):
+        resp.etag = "a-tag"
+        docs = DOCS[:1] if req.get_param_as_bool("small") else DOCS
+        if req.get_param_as_bool("stream"):
+            media.stream_array(resp, iter(docs))
+        else:
+            resp.media = docs
+
+
+class FileResource(object):
+    def on_get(self, req, resp):
+        resp.content_type = "application/json"
+        resp.data = media.dumps(DOCS).encode()
+        if req.get_param_as_bool("gz"):
+            compression.skip(resp)
+
+
+def client():
+    app = falcon.App(middleware=[compress()])
+    app.add_route("/list", ListResource())
+    app.add_route("/file", FileResource())
+    return testing.TestClient(app)
+
+
+def test_negotiate():
+    assert compression.negotiate("gzip, deflate") == "gzip"
+    assert compression.negotiate("deflate") is None
+    assert compression.negotiate("gzip;q=0") is None
+    assert compression.negotiate("*") == compression.ENCODINGS[0]
+    assert compression.negotiate("br, *;q=0", ("br", "gzip")) == "br"
+    assert compression.negotiate("br;q=0.5, gzip", ("br", "gzip")) == "gzip"
+    assert compression.negotiate("", ("br", "gzip")) is None
+
+
+def test_compressible():
+    assert compression.compressible("application/json")
+    assert compression.compressible("text/plain; charset=utf-8")
+    assert compression.compressible("application/vnd.api+json")
+    assert not compression.compressible("image/png")
+    assert not compression.compressible(None)
+
+
+def test_compress():
+    oohoom = client()
+    for params in ({}, {"stream": True}):
+        resp = oohoom.simulate_get(
+            "/list", params=params, headers={"Accept-Encoding": "gzip"}
+        )
+        assert resp.headers["Content-Encoding"] == "gzip"
+        assert resp.headers["Vary"] == "Accept-Encoding"
+        assert resp.headers["ETag"] == 'W/"a-tag"'
+        assert json.loads(gzip.decompress(resp.content)) == DOCS
+
+    # not accepted, too small or already compressed
+    resp = oohoom.simulate_get("/list", params={"stream": True})
+    assert "Content-Encoding" not in resp.headers
+    assert resp.headers["ETag"] == '"a-tag"'
+    assert resp.json == DOCS
+    for path, params in (
+        ("/list", {"small": True}),
+        ("/list", {"small": True, "stream": True}),
+        ("/file", {"gz": True}),
+    ):
+        resp = oohoom.simulate_get(
+            path, params=params, headers={"Accept-Encoding": "gzip"}
+        )
+        assert "Content-Encoding" not in resp.headers
+    resp = oohoom.simulate_get("/file", headers={"Accept-Encoding": "gzip"})
+    assert json.loads(gzip.decompress(resp.content)) == DOCS
+
+
+def test_brotli():
+    brotli = pytest.importorskip("brotli")
+    oohoom = client()
+    for params in ({}, {"stream": True}):
+        resp = oohoom.simulate_get(
+            "/list", params=params, headers={"Accept-Encoding": "gzip, br"}
+        )
+        assert resp.headers["Content-Encoding"] == "br"
+        assert json.loads(brotli.decompress(resp.content)) == DOCS
@@ -0,0 +1,44 @@
+import os
+
+from pymongo import MongoClient, ReadPreference
+
+from ..oohoom import connections
+
+
+def client():
+    made = []
+
+    def factory():
+        made.append(MongoClient(connect=False))
+        return made[-1]
+
+    return connections.ProcessClient(factory), made
+
+
+def test_lazy():
+    process_client, made = client()
+    db = connections.Database(process_client, "test_oohoom")
+    assert made == [] and not process_client.created
+    assert db.users.name == "users"
+    assert db["users"].database.name == "test_oohoom"
+    assert len(made) == 1 and process_client.created
+
+
+def test_after_fork():
+    process_client, made = client()
+    db = connections.Database(process_client, "test_oohoom")
+    db.get()
+    # as a forked child sees it
+    process_client._pid = db._pid = os.getpid() + 1
+    db.get()
+    assert len(made) == 2
+    assert db.client is made[1]
+
+
+def test_read_preference():
+    process_client, made = client()
+    db = connections.Database(process_client, "test_oohoom", "secondaryPreferred")
+    assert db.projects.read_preference == ReadPreference.SECONDARY_PREFERRED
+    assert connections.Database(process_client, "test_oohoom").read_preference == (
+        ReadPreference.PRIMARY
+    )
@@ -0,0 +1,146 @@
+import gzip
+import os
+import time
+
+import falcon
+import pytest
+from falcon import testing
+from pymongo import _csot as pymongo_csot
+
+from ..oohoom import deadlines, downloads
+from ..oohoom.middlewares import compress, deadline
+
+
+class BudgetResource(object):
+    def on_get(self, req, resp):
+        resp.media = {"remaining": deadlines.remaining()}
+
+    def on_get_slow(self, req, resp):
+        raise deadlines.DeadlineExceeded()
+
+    def on_get_stream(self, req, resp):
+        def chunks():
+            yield b"["
+            time.sleep(0.2)
+            yield b"]"
+
+        resp.stream = chunks()
+
+
+def client(budget):
+    app = falcon.App(middleware=[deadline(budget)])
+    app.add_error_handler(deadlines.TIMEOUTS, deadlines.handle_timeout)
+    app.add_route("/budget", BudgetResource())
+    app.add_route("/budget/slow", BudgetResource(), suffix="slow")
+    app.add_route("/budget/stream", BudgetResource(), suffix="stream")
+    return testing.TestClient(app)
+
+
+def test_budget():
+    oohoom = client(1)
+    assert 0.9 < oohoom.simulate_get("/budget").json["remaining"] <= 1
+    # a client may only ask for less
+    resp = oohoom.simulate_get("/budget", headers={deadlines.HEADER: "0.5"})
+    assert 0.4 < resp.json["remaining"] <= 0.5
+    resp = oohoom.simulate_get("/budget", headers={deadlines.HEADER: "5"})
+    assert resp.json["remaining"] <= 1
+    assert client(None).simulate_get("/budget").json["remaining"] is None
+    # outside a request
+    assert deadlines.remaining() is None
+
+
+def test_refused():
+    refused = deadlines.stats.refused
+    resp = client(1).simulate_get(
+        "/budget", headers={"X-Request-Start": "t={}".format(time.time() - 2)}
+    )
+    assert resp.status_code == 503
+    assert deadlines.stats.refused == refused + 1
+
+
+def test_exceeded():
+    exceeded = deadlines.stats.exceeded
+    resp = client(1).simulate_get("/budget/slow")
+    assert resp.status_code == 504
+    assert deadlines.stats.exceeded == exceeded + 1
+
+
+def test_stream_cut():
+    oohoom = client(0.1)
+    with pytest.raises(deadlines.DeadlineExceeded):
+        oohoom.simulate_get("/budget/stream")
+    assert client(1).simulate_get("/budget/stream").json == []
+
+
+class Redis(object):
+    def execute_command(self, *args, **options):
+        return deadlines.remaining()
+
+    def execute(self):
+        return []
+
+    def pipeline(self, *args, **kwargs):
+        return self
+
+
+def test_bound_redis():
+    redis = deadlines.bound_redis(Redis())
+    assert redis.execute_command("GET", "a") is None
+    with deadlines.Scope(time.monotonic() + 1, 1):
+        assert 0 < redis.execute_command("GET", "a") <= 1
+    scope = deadlines.Scope(time.monotonic() + 0.05, 0.05)
+    with scope:
+        time.sleep(0.1)
+        with pytest.raises(deadlines.DeadlineExceeded):
+            redis.execute_command("GET", "a")
+        with pytest.raises(deadlines.DeadlineExceeded):
+            redis.pipeline().execute()
+
+
+class DownloadResource(object):
+    def __init__(self, path):
+        self.path = path
+
+    def on_get(self, req, resp):
+        size = os.path.getsize(self.path)
+        resp.content_type = "text/plain"
+        deadlines.exempt(req)
+        resp.stream = downloads.FileRange(self.path, 0, size)
+
+
+def test_slow_download(tmp_path):
+    path = os.path.join(str(tmp_path), "a_file.txt")
+    content = b"".join(b"line %d of a text file\n" % i for i in range(200000))
+    with open(path, "wb") as f:
+        f.write(content)
+    # compress wraps the file before deadline sees it
+    app = falcon.App(middleware=[deadline(0.2), compress()])
+    app.add_route("/file", DownloadResource(path))
+    environ = testing.create_environ("/file", headers={"Accept-Encoding": "gzip"})
+    start_response = testing.StartResponseMock()
+    chunks = []
+    for chunk in app(environ, start_response):
+        # a slow client
+        if not chunks:
+            time.sleep(0.3)
+        chunks.append(chunk)
+    assert start_response.status == "200 OK"
+    assert gzip.decompress(b"".join(chunks)) == content
+
+
+class Request(object):
+    class context(object):
+        pass
+
+
+def test_paused():
+    req = Request()
+    deadlines.start(req, 0.1)
+    time.sleep(0.15)
+    with deadlines.paused(req):
+        # nor the mongodb operations of the block
+        assert deadlines.remaining() is None
+        assert pymongo_csot.remaining() is None
+    assert 0 < deadlines.remaining() <= 0.1
+    deadlines.finish(req)
+    assert deadlines.remaining() is None
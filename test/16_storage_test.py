@@ -0,0 +1,139 @@
+import hashlib
+import io
+import os
+
+from pymongo import ReturnDocument
+
+from ..oohoom import downloads, storage
+
+
+def test_fan_out(tmp_path):
+    backend = storage.LocalStorage(None, str(tmp_path))
+    digest = hashlib.sha256(b"a file").hexdigest()
+    assert backend.path(digest) == os.path.join(
+        str(tmp_path), digest[:2], digest[2:4], digest
+    )
+
+
+def test_write(tmp_path, monkeypatch):
+    # more than one read
+    monkeypatch.setattr(storage, "COPY_SIZE", 4)
+    backend = storage.LocalStorage(None, str(tmp_path))
+    content = b"the content of a file"
+    pending = backend.write(io.BytesIO(content))
+    assert pending.digest == hashlib.sha256(content).hexdigest()
+    assert pending.size == len(content)
+    with io.open(pending.location, "rb") as f:
+        assert f.read() == content
+    backend.discard(pending)
+    assert os.listdir(os.path.join(str(tmp_path), "tmp")) == []
+
+
+def test_write_failed(tmp_path):
+    class Broken(object):
+        def read(self, size):
+            raise IOError("the client went away")
+
+    backend = storage.LocalStorage(None, str(tmp_path))
+    try:
+        backend.write(Broken())
+    except IOError:
+        pass
+    assert os.listdir(os.path.join(str(tmp_path), "tmp")) == []
+
+
+def test_range(tmp_path):
+    path = os.path.join(str(tmp_path), "a_file")
+    with io.open(path, "wb") as f:
+        f.write(b"0123456789")
+    f = downloads.FileRange(path, 2, 5)
+    assert f.read(3) == b"234"
+    assert f.read() == b"56"
+    assert f.read() == b""
+    f.close()
+
+
+class Blobs(object):
+    """
+        the operations of storage on db.blobs.
+    """
+
+    def __init__(self):
+        self.docs = {}
+
+    @staticmethod
+    def _matches(doc, filter_):
+        for key, condition in filter_.items():
+            value = doc.get(key)
+            if isinstance(condition, dict):
+                if value is None or value > condition["$lte"]:
+                    return False
+            elif value != condition:
+                return False
+        return True
+
+    def find_one_and_update(self, filter_, update, upsert=False, return_document=None):
+        doc = self.docs.get(filter_["_id"])
+        if doc is None and upsert:
+            self.docs[filter_["_id"]] = dict(
+                update.get("$setOnInsert", {}), _id=filter_["_id"], refs=1
+            )
+            return None
+        if doc is None or not self._matches(doc, filter_):
+            return None
+        before = dict(doc)
+        for key, value in update.get("$inc", {}).items():
+            doc[key] += value
+        doc.update(update.get("$set", {}))
+        for key in update.get("$unset", {}):
+            doc.pop(key, None)
+        return dict(doc) if return_document == ReturnDocument.AFTER else before
+
+    def update_one(self, filter_, update):
+        class Result(object):
+            matched_count = int(self.find_one_and_update(filter_, update) is not None)
+
+        return Result()
+
+    def delete_one(self, filter_):
+        doc = self.docs.get(filter_["_id"])
+
+        class Result(object):
+            deleted_count = int(doc is not None and self._matches(doc, filter_))
+
+        if Result.deleted_count:
+            del self.docs[filter_["_id"]]
+        return Result()
+
+
+class DB(object):
+    def __init__(self):
+        self.blobs = Blobs()
+
+
+def test_release_referenced_again(tmp_path):
+    content = b"the content of a file"
+
+    class Racing(storage.LocalStorage):
+        racing = True
+
+        def _detach(self, blob):
+            super()._detach(blob)
+            if self.racing:
+                self.racing = False
+                # uploaded again while the last reference is released
+                self.commit(self.write(io.BytesIO(content)))
+
+    db = DB()
+    backend = Racing(db, str(tmp_path))
+    digest = backend.commit(backend.write(io.BytesIO(content)))
+    backend.release(digest)
+    assert db.blobs.docs[digest]["refs"] == 1
+    assert "deleting" not in db.blobs.docs[digest]
+    with io.open(backend.path(digest), "rb") as f:
+        assert f.read() == content
+    assert os.listdir(os.path.join(str(tmp_path), "tmp")) == []
+    # and deleted with the last reference
+    backend.release(digest)
+    assert digest not in db.blobs.docs
+    assert not os.path.exists(backend.path(digest))
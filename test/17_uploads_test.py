@@ -0,0 +1,139 @@
+import io
+import os
+
+import falcon
+import pytest
+from bson import ObjectId
+
+from ..oohoom import storage, uploads
+
+BOUNDARY = "5b11af82ab65407ba8cdccf37d2a9c4f"
+CONTENT_TYPE = "multipart/form-data; boundary=" + BOUNDARY
+
+
+def body(*parts) -> bytes:
+    """
+        parts are (name, value) and (name, filename, content).
+    """
+    chunks = []
+    for part in parts:
+        if len(part) == 2:
+            disposition = 'form-data; name="{}"'.format(part[0])
+            content = part[1].encode()
+        else:
+            disposition = 'form-data; name="{}"; filename="{}"'.format(*part[:2])
+            content = part[2]
+        chunks.append(
+            "--{}\r\nContent-Disposition: {}\r\n\r\n".format(
+                BOUNDARY, disposition
+            ).encode()
+            + content
+            + b"\r\n"
+        )
+    return b"".join(chunks) + "--{}--\r\n".format(BOUNDARY).encode()
+
+
+def form(*parts):
+    data = body(*parts)
+    return uploads.form_handler().deserialize(
+        io.BytesIO(data), CONTENT_TYPE, len(data)
+    )
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    backend = storage.LocalStorage(None, str(tmp_path))
+    monkeypatch.setattr(storage, "backend", backend)
+    return backend
+
+
+def temp_files(backend):
+    temp_dir = os.path.join(backend.root, "tmp")
+    return os.listdir(temp_dir) if os.path.exists(temp_dir) else []
+
+
+def test_receive(backend):
+    project_id = ObjectId()
+    authorized = []
+
+    def authorize(project_id, kind):
+        authorized.append((project_id, kind))
+        return 100
+
+    file_, pending = uploads.receive(
+        form(
+            ("project_id", str(project_id)),
+            ("kind", "input"),
+            ("file", "a_file.txt", b"the content"),
+        ),
+        authorize,
+    )
+    assert authorized == [(project_id, "input")]
+    assert file_["project_id"] == project_id and file_["title"] == "a_file.txt"
+    assert pending.size == len(b"the content")
+    backend.discard(pending)
+
+
+def test_file_first(backend):
+    def authorize(project_id, kind):
+        raise AssertionError("not before project_id and kind")
+
+    with pytest.raises(falcon.HTTPBadRequest):
+        uploads.receive(
+            form(
+                ("file", "a_file.txt", b"the content"),
+                ("project_id", str(ObjectId())),
+                ("kind", "input"),
+            ),
+            authorize,
+        )
+    assert temp_files(backend) == []
+
+
+def test_forbidden(backend):
+    def authorize(project_id, kind):
+        raise falcon.HTTPForbidden()
+
+    with pytest.raises(falcon.HTTPForbidden):
+        uploads.receive(
+            form(
+                ("project_id", str(ObjectId())),
+                ("kind", "output"),
+                ("file", "a_file.txt", b"the content"),
+            ),
+            authorize,
+        )
+    assert temp_files(backend) == []
+
+
+def test_too_large(backend, monkeypatch):
+    monkeypatch.setattr(storage, "COPY_SIZE", 4)
+    with pytest.raises(falcon.HTTPPayloadTooLarge):
+        uploads.receive(
+            form(
+                ("project_id", str(ObjectId())),
+                ("kind", "input"),
+                ("file", "a_file.txt", b"more than ten bytes"),
+            ),
+            lambda project_id, kind: 10,
+        )
+    assert temp_files(backend) == []
+
+
+def test_invalid(backend):
+    for parts in (
+        [("project_id", "x"), ("kind", "input")],
+        [("project_id", str(ObjectId())), ("kind", "other")],
+        [("project_id", str(ObjectId())), ("kind", "input")],
+    ):
+        with pytest.raises(falcon.HTTPBadRequest):
+            uploads.receive(form(*parts), lambda project_id, kind: 10)
+
+
+def test_limit():
+    assert uploads._limit(None) == min(
+        uploads.UPLOAD_MAX_SIZE, uploads.PROJECT_FILES_MAX_SIZE
+    )
+    assert uploads._limit({"files_size": uploads.PROJECT_FILES_MAX_SIZE - 1}) == 1
+    with pytest.raises(falcon.HTTPPayloadTooLarge):
+        uploads._limit({"files_size": uploads.PROJECT_FILES_MAX_SIZE})
@@ -0,0 +1,102 @@
+import os
+from datetime import datetime
+
+import falcon
+import pytest
+from falcon import testing
+
+from ..oohoom import downloads
+
+CONTENT = b"0123456789"
+TAG = "a-digest"
+LAST_MODIFIED = datetime(2020, 1, 2, 3, 4, 5, 678000)
+HTTP_DATE = "Thu, 02 Jan 2020 03:04:05 GMT"
+
+
+class DownloadResource(object):
+    def __init__(self, path):
+        self.path = path
+
+    def on_get(self, req, resp):
+        resp.content_type = "application/octet-stream"
+        range_ = downloads.prepare(req, resp, TAG, len(CONTENT), LAST_MODIFIED)
+        if range_ is not None:
+            resp.stream = downloads.FileRange(self.path, *range_)
+
+
+@pytest.fixture
+def oohoom(tmp_path):
+    path = os.path.join(str(tmp_path), "a_file")
+    with open(path, "wb") as f:
+        f.write(CONTENT)
+    app = falcon.App()
+    app.add_route("/file", DownloadResource(path))
+    return testing.TestClient(app)
+
+
+def test_full(oohoom):
+    resp = oohoom.simulate_get("/file")
+    assert resp.status_code == 200
+    assert resp.content == CONTENT
+    assert resp.headers["ETag"] == '"{}"'.format(TAG)
+    assert resp.headers["Last-Modified"] == HTTP_DATE
+    assert resp.headers["Accept-Ranges"] == "bytes"
+
+
+def test_range(oohoom):
+    resp = oohoom.simulate_get("/file", headers={"Range": "bytes=2-5"})
+    assert resp.status_code == 206
+    assert resp.content == b"2345"
+    assert resp.headers["Content-Range"] == "bytes 2-5/10"
+    resp = oohoom.simulate_get("/file", headers={"Range": "bytes=-3"})
+    assert resp.status_code == 206
+    assert resp.content == b"789"
+    resp = oohoom.simulate_get("/file", headers={"Range": "bytes=7-"})
+    assert resp.content == b"789"
+
+
+def test_range_ignored(oohoom):
+    for range_ in ("bytes=0-1,3-4", "bytes=abc", "lines=1-2", "bytes=5-2"):
+        resp = oohoom.simulate_get("/file", headers={"Range": range_})
+        assert resp.status_code == 200
+        assert resp.content == CONTENT
+
+
+def test_range_not_satisfiable(oohoom):
+    resp = oohoom.simulate_get("/file", headers={"Range": "bytes=10-20"})
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == "bytes */10"
+
+
+def test_not_modified(oohoom):
+    resp = oohoom.simulate_get("/file", headers={"If-None-Match": '"{}"'.format(TAG)})
+    assert resp.status_code == 304
+    assert resp.content == b""
+    resp = oohoom.simulate_get("/file", headers={"If-None-Match": '"another"'})
+    assert resp.status_code == 200
+    resp = oohoom.simulate_get("/file", headers={"If-Modified-Since": HTTP_DATE})
+    assert resp.status_code == 304
+    resp = oohoom.simulate_get(
+        "/file", headers={"If-Modified-Since": "Wed, 01 Jan 2020 00:00:00 GMT"}
+    )
+    assert resp.status_code == 200
+
+
+def test_if_range(oohoom):
+    for if_range in ('"{}"'.format(TAG), HTTP_DATE):
+        resp = oohoom.simulate_get(
+            "/file", headers={"Range": "bytes=2-5", "If-Range": if_range}
+        )
+        assert resp.status_code == 206
+    # changed since, weak, or only not after Last-Modified
+    for if_range in (
+        '"another"',
+        'W/"{}"'.format(TAG),
+        "Fri, 03 Jan 2020 00:00:00 GMT",
+        "not a date",
+    ):
+        resp = oohoom.simulate_get(
+            "/file", headers={"Range": "bytes=2-5", "If-Range": if_range}
+        )
+        assert resp.status_code == 200
+        assert resp.content == CONTENT
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import falcon
+import pytest
+from bson import ObjectId
+
+from ..oohoom import cursors, queries
+
+
+def test_project_id():
+    project_id = ObjectId()
+    assert queries.project_id({"project_id": str(project_id)}) == project_id
+    for value in ("x", 5):
+        with pytest.raises(falcon.HTTPBadRequest):
+            queries.project_id({"project_id": value})
+
+
+def test_checks():
+    queries.check_unique("name", None)
+    with pytest.raises(falcon.HTTPConflict):
+        queries.check_unique("name", {"name": "a_name"})
+    queries.check_found({"_id": ObjectId()})
+    with pytest.raises(falcon.HTTPNotFound):
+        queries.check_found(0, description="project not found")
+    with pytest.raises(falcon.HTTPUnauthorized):
+        queries.check_role(None, "employee", "accept project", falcon.HTTPUnauthorized)
+    with pytest.raises(falcon.HTTPForbidden):
+        queries.check_member("")
+
+
+def test_user():
+    user_id = ObjectId()
+    assert queries.user(user_id) == ({"_id": user_id}, {"_id": 1, "name": 1})
+    assert queries.user(user_id, "employee")[0] == {"_id": user_id, "role": "employee"}
+
+
+def test_poll():
+    project_id = ObjectId()
+    assert queries.poll_since({"since": ""}) is None
+    assert queries.newest_keys(None) is None
+    assert queries.poll_filter(project_id, None) == {"project_id": project_id}
+    since = datetime(2020, 1, 2, 3, 4, 5), ObjectId()
+    assert queries.poll_since({"since": cursors.encode(*since)}) == list(since)
+    assert queries.poll_filter(project_id, since) != {"project_id": project_id}
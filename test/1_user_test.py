@@ -1,8 +1,9 @@
 import pytest
 from falcon import testing
+from pymongo import MongoClient
 
 from ..oohoom import app, r_code
-from ..oohoom.init import mongodb
+from ..oohoom.init import migrations, mongodb
 
 EMPLOYEE_MOBILE = "00989389742591"
 
@@ -21,11 +22,22 @@ def test_test(oohoom):
     assert result.json == doc
 
 
+def test_test_asgi():
+    asgi_oohoom = testing.TestClient(app.create_app(is_testing=True, asgi=True))
+    result = asgi_oohoom.simulate_get("/v1/test")
+    assert result.json == {"ok": True}
+
+
 @pytest.mark.incremental
 class TestRegistration:
     def test_init_mongodb(self):
         assert mongodb.init(is_testing=True)
 
+    def test_migrations(self):
+        db = MongoClient().test_oohoom
+        assert migrations.migrate(db) == []
+        assert migrations.check(db) == []
+
     def test_post_code(self, oohoom):
         resp = oohoom.simulate_post("/v1/code", json={"mobile": EMPLOYEE_MOBILE})
         assert resp.json == {"is_user_exists": False}
@@ -1,7 +1,7 @@
 import pytest
 from falcon import testing
 
-from ..oohoom import app, r_code
+from ..oohoom import app, r_code, ranking
 
 
 EMPLOYER_MOBILE = "00989352904135"
@@ -43,6 +43,7 @@ class TestProject:
         )
         assert "token" in resp.json
         g["token"] = resp.json["token"]
+        g["employer_token"] = resp.json["token"]
         print("employer token:", g["token"])
 
     def test_post_project(self, oohoom):
@@ -62,6 +63,33 @@ class TestProject:
         resp = oohoom.simulate_get("/v1/projects")
         assert type(resp.json) == list
         assert len(resp.json) == 1
+        assert "description" not in resp.json[0]
+        resp = oohoom.simulate_get("/v1/projects", params={"fields": "description"})
+        assert set(resp.json[0]) == {"_id", "description"}
+
+    def test_get_projects_search(self, oohoom):
+        resp = oohoom.simulate_get("/v1/projects", params={"q": "testing"})
+        assert [project["_id"] for project in resp.json] == [g["project_id"]]
+        assert "score" in resp.json[0]
+        resp = oohoom.simulate_get(
+            "/v1/projects", params={"q": "testing", "state": "done"}
+        )
+        assert resp.json == []
+        resp = oohoom.simulate_get("/v1/projects", params={"q": "missing"})
+        assert resp.json == []
+
+    def test_get_projects_cursor(self, oohoom):
+        resp = oohoom.simulate_get("/v1/projects", params={"limit": 1, "cursor": ""})
+        assert len(resp.json) == 1
+        cursor = resp.headers.get("X-Next-Cursor")
+        assert cursor
+        resp = oohoom.simulate_get(
+            "/v1/projects", params={"limit": 1, "cursor": cursor}
+        )
+        assert resp.json == []
+        assert "X-Next-Cursor" not in resp.headers
+        resp = oohoom.simulate_get("/v1/projects", params={"cursor": "x"})
+        assert resp.status_code == 400
 
    # def test_get_project_title(self, oohoom):
    #     resp = oohoom.simulate_get("/v1/projects/A project")
@@ -83,6 +111,13 @@ class TestProject:
         assert "token" in resp.json
         g["token"] = resp.json["token"]
 
+    def test_get_projects_feed(self, oohoom):
+        resp = oohoom.simulate_get(
+            "/v1/projects/feed", headers={"Authorization": g["token"]},
+        )
+        assert resp.status_code == 200
+        assert isinstance(resp.json, list)
+
     def test_patch_project_assign(self, oohoom):
         resp = oohoom.simulate_patch(
             "/v1/projects",
@@ -106,3 +141,20 @@ class TestProject:
             "/v1/projects/"+g['project_id']['$oid'], headers={"Authorization": g["token"]},
         )
         assert "This is an updated project." == resp.json.get("description")
+
+    def test_patch_project_done(self, oohoom):
+        resp = oohoom.simulate_patch(
+            "/v1/projects",
+            json={"_id": g["project_id"], "action": "done"},
+            headers={"Authorization": g["token"]},
+        )
+        # only the employer
+        assert resp.status_code == 404
+        resp = oohoom.simulate_patch(
+            "/v1/projects",
+            json={"_id": g["project_id"], "action": "done"},
+            headers={"Authorization": g["employer_token"]},
+        )
+        assert resp.status_code == 200
+        resp = oohoom.simulate_get("/v1/users", params={"role": "employee"})
+        assert resp.json[0]["rank"] == ranking.ASSIGNED_WEIGHT + ranking.DONE_WEIGHT
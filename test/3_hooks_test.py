@@ -0,0 +1,172 @@
+import threading
+from datetime import datetime
+
+import falcon
+import pytest
+from bson import ObjectId
+from falcon import testing
+from pymongo import DESCENDING
+
+from ..oohoom import cursors, fields, schemas
+from ..oohoom.hooks import auth, claimed_user, registry, validate_req
+from ..oohoom.jwt_user_id import token_claims, user_to_token
+
+
+SCHEMA = {
+    "state": {"type": "string", "regex": "^(new|all)$", "default": "all"},
+    "skip": {"type": "integer", "coerce": int, "min": 0, "default": 0},
+}
+
+
+def validate(query_string):
+    req = testing.create_req(query_string=query_string)
+    validate_req(req, None, None, {}, SCHEMA, require_all=False, produce_filter=True)
+    return req.context
+
+
+def test_filter():
+    assert validate("state=all&skip=3").filter == {}
+    context = validate("state=new&skip=3&unknown=1")
+    assert context.filter == {"state": "new"}
+    assert context.params == {"state": "new", "skip": 3}
+
+
+def test_invalid():
+    with pytest.raises(falcon.errors.HTTPBadRequest):
+        validate("skip=-1")
+    with pytest.raises(falcon.errors.HTTPBadRequest):
+        validate("skip=abc")
+
+
+def test_fields():
+    def validate_fields(query_string):
+        req = testing.create_req(query_string=query_string)
+        validate_req(
+            req, None, None, {}, schemas.PROJECTS_GET,
+            require_all=False, produce_filter=True,
+        )
+        return req.context
+
+    context = validate_fields("state=new")
+    assert "description" not in context.params["fields"]
+    assert context.filter == {"state": "new"}
+    context = validate_fields("fields=title,state,title")
+    assert fields.projection(context.params["fields"]) == {"state": 1, "title": 1}
+    assert context.filter == {}
+    with pytest.raises(falcon.errors.HTTPBadRequest):
+        validate_fields("fields=title,mobile")
+    with pytest.raises(falcon.errors.HTTPBadRequest):
+        validate_fields("fields=")
+
+
+def test_compiled_once():
+    validate("")
+    count = len(registry)
+    route_schema = registry.get(SCHEMA, False, True, True)
+    validator = route_schema.validator
+    validate("state=new")
+    assert len(registry) == count
+    assert route_schema.validator is validator
+
+    validators = []
+    thread = threading.Thread(target=lambda: validators.append(route_schema.validator))
+    thread.start()
+    thread.join()
+    assert validators[0] is not validator
+    assert validators[0].schema is validator.schema
+
+
+def test_auth_claims():
+    token = user_to_token(str(ObjectId()), "a_name", "employer")
+    req = testing.create_req(headers={"Authorization": token})
+    auth(req, None, None, {})
+    assert claimed_user(req) == {"_id": req.context.user_id, "name": "a_name"}
+    assert claimed_user(req, "employer") == claimed_user(req)
+    assert claimed_user(req, "employee") is False
+    # verified once, then served from the cache
+    assert token_claims(token) is req.context.claims
+
+    # issued without claims
+    req = testing.create_req(headers={"Authorization": user_to_token("a" * 24)})
+    auth(req, None, None, {})
+    assert claimed_user(req) is None
+
+    req = testing.create_req(headers={"Authorization": token + "x"})
+    with pytest.raises(falcon.errors.HTTPUnauthorized):
+        auth(req, None, None, {})
+    auth(req, None, None, {}, optional=True)
+    assert req.context.authenticated is False
+
+
+def test_cursor():
+    _id = ObjectId()
+    now = datetime(2020, 1, 2, 3, 4, 5)
+    assert cursors.decode(cursors.encode(3, _id), "rank", "_id") == [3, _id]
+    assert cursors.decode(
+        cursors.encode(now, _id), "creation_datetime", "_id"
+    ) == [now, _id]
+    for cursor, keys in (
+        # operators instead of values
+        (cursors.encode({"$gt": 0}, _id), ("rank", "_id")),
+        (cursors.encode(3, {"$where": "sleep(1000)"}), ("rank", "_id")),
+        (cursors.encode({"$ne": None}), ("_id",)),
+        (cursors.encode(str(_id)), ("_id",)),
+        (cursors.encode(True, _id), ("rank", "_id")),
+        (cursors.encode(3, _id), ("creation_datetime", "_id")),
+        (cursors.encode(None, _id), ("creation_datetime", "_id")),
+        (cursors.encode(_id), ("rank", "_id")),
+        ("x", ("_id",)),
+    ):
+        with pytest.raises(falcon.HTTPBadRequest):
+            cursors.decode(cursor, *keys)
+
+
+def _matches(doc: dict, filter_: dict) -> bool:
+    # the operators of the cursor filters, as mongodb applies them
+    for key, condition in filter_.items():
+        if key == "$or":
+            if not any(_matches(doc, other) for other in condition):
+                return False
+        elif key == "$and":
+            if not all(_matches(doc, other) for other in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = doc.get(key)
+            for op, operand in condition.items():
+                if op == "$ne":
+                    if value == operand:
+                        return False
+                # a comparison matches no null
+                elif value is None or not {
+                    "$lt": value < operand,
+                    "$lte": value <= operand,
+                    "$gt": value > operand,
+                    "$gte": value >= operand,
+                }[op]:
+                    return False
+        elif doc.get(key) != condition:
+            return False
+    return True
+
+
+def test_cursor_unranked():
+    # rank descending; mongodb sorts a missing rank as null, last
+    users = [{"_id": ObjectId(), "rank": rank} for rank in (5, 0, 0)]
+    users += [{"_id": ObjectId()} for _ in range(3)]
+    users.sort(
+        key=lambda user: (user.get("rank", -1), user["_id"]), reverse=True
+    )
+    seen, cursor = [], None
+    while True:
+        page = [
+            user
+            for user in users
+            if _matches(user, cursors.after_key_id({}, cursor, "rank", DESCENDING))
+        ][:2]
+        if not page:
+            break
+        seen += page
+        resp = falcon.Response()
+        cursors.set_next(resp, page[-1], "rank", "_id")
+        cursor = resp.get_header(cursors.HEADER)
+    assert seen == users
@@ -0,0 +1,84 @@
+import asyncio
+
+from bson import ObjectId
+
+from ..oohoom import membership
+
+
+def test_cache():
+    cache = membership.MembershipCache(ttl=60, maxsize=2)
+    project_id, user_id = ObjectId(), ObjectId()
+    assert cache.get(project_id, user_id) is None
+    cache.set(project_id, user_id, membership.EMPLOYER)
+    assert cache.get(project_id, user_id) == membership.EMPLOYER
+    # negative answers are not cached
+    cache.set(ObjectId(), user_id, membership.NOT_MEMBER)
+    assert cache.stats()["size"] == 1
+    cache.invalidate(project_id)
+    assert cache.get(project_id, user_id) is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 0}
+
+
+def test_bounded():
+    cache = membership.MembershipCache(ttl=60, maxsize=2)
+    user_id = ObjectId()
+    project_ids = [ObjectId() for i in range(3)]
+    for project_id in project_ids:
+        cache.set(project_id, user_id, membership.EMPLOYEE)
+    assert cache.get(project_ids[0], user_id) is None
+    assert cache.get(project_ids[2], user_id) == membership.EMPLOYEE
+
+
+def test_expiry():
+    cache = membership.MembershipCache(ttl=-1)
+    project_id, user_id = ObjectId(), ObjectId()
+    cache.set(project_id, user_id, membership.EMPLOYEE)
+    assert cache.get(project_id, user_id) is None
+
+
+class Redis(object):
+    def __init__(self):
+        self.hashes = {}
+
+    def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value.encode("utf8")
+
+    def expire(self, key, ttl):
+        pass
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def execute(self):
+        return []
+
+
+def test_shared():
+    redis = Redis()
+    cache = membership.MembershipCache(ttl=60, redis=redis)
+    project_id, user_id = ObjectId(), ObjectId()
+    # read before an assign, written after the invalidate of the assign
+    cache.invalidate(project_id)
+    cache.set(project_id, user_id, membership.NOT_MEMBER)
+    assert redis.hashes == {}
+    cache.set(project_id, user_id, membership.EMPLOYEE)
+    # another worker
+    other = membership.MembershipCache(ttl=60, redis=redis)
+    assert other.get(project_id, user_id) == membership.EMPLOYEE
+
+
+def test_shared_async():
+    redis = Redis()
+    cache = membership.MembershipCache(ttl=60, redis=redis)
+    project_id, user_id = ObjectId(), ObjectId()
+    cache.set(project_id, user_id, membership.EMPLOYER)
+    other = membership.MembershipCache(ttl=60, redis=redis)
+    assert asyncio.run(other.get_async(project_id, user_id)) == membership.EMPLOYER
+    assert asyncio.run(other.get_async(ObjectId(), user_id)) is None
+    assert other.stats() == {"hits": 1, "misses": 1, "size": 1}
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from bson import ObjectId
+from bson.json_util import dumps as json_util_dumps
+
+from ..oohoom import media
+
+
+def test_dumps_extended_json():
+    doc = {
+        "_id": ObjectId(),
+        "employee": None,
+        "skills": ["a", "ب"],
+        "creation_datetime": datetime(2020, 7, 1, 12, 30, 5, 123456),
+        "nested": [{"_id": ObjectId(), "at": datetime(2020, 7, 1)}],
+        "seen": False,
+        "count": 3,
+    }
+    assert media.dumps(doc) == json_util_dumps(doc)
+    assert media.dumps([doc, doc]) == json_util_dumps([doc, doc])
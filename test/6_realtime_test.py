@@ -0,0 +1,59 @@
+import asyncio
+
+from bson import ObjectId
+
+from ..oohoom import realtime
+
+
+class LocalHub(realtime.Hub):
+    # notified directly, without the redis subscriber
+    def _start(self):
+        pass
+
+
+class LocalAsyncHub(realtime.AsyncHub):
+    def _start(self):
+        pass
+
+
+def test_notify():
+    hub = LocalHub(None)
+    project_id = ObjectId()
+    event = hub.subscribe(project_id)
+    hub.notify(ObjectId())
+    assert not event.wait(0)
+    hub.notify(project_id)
+    assert event.wait(0)
+    # a later poll waits for the next message
+    assert not hub.subscribe(project_id).is_set()
+
+
+def test_unsubscribe():
+    hub = LocalHub(None)
+    project_id = ObjectId()
+    hub.subscribe(project_id)
+    hub.subscribe(project_id)
+    hub.unsubscribe(project_id)
+    hub.unsubscribe(project_id)
+    assert hub._events == {} and hub._waiters == {}
+    # nobody waits, nothing is kept
+    hub.notify(project_id)
+    assert hub._events == {}
+
+
+def test_channel():
+    project_id = ObjectId()
+    channel = realtime._channel(project_id).encode("utf8")
+    assert realtime._project_id(channel) == str(project_id)
+
+
+def test_wait_async():
+    async def poll():
+        hub = LocalAsyncHub(None)
+        project_id = ObjectId()
+        event = hub.subscribe(project_id)
+        assert not await realtime.wait_async(event, 0.01)
+        asyncio.get_running_loop().call_soon(hub.notify, project_id)
+        return await realtime.wait_async(event, 1)
+
+    assert asyncio.run(poll())
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from ..oohoom import membership, unread
+
+
+def test_counts():
+    employer_id, employee_id = ObjectId(), ObjectId()
+    projects = [
+        {"_id": ObjectId(), "employer": {"_id": employer_id}},
+        {"_id": ObjectId(), "employer": {"_id": ObjectId()}},
+    ]
+    counters = [{"_id": projects[0]["_id"], "employer": 2, "employee": 5}]
+    assert unread.counts(projects, counters, employer_id) == [
+        {"project_id": projects[0]["_id"], "unread": 2},
+        {"project_id": projects[1]["_id"], "unread": 0},
+    ]
+    assert unread.counts(projects[:1], counters, employee_id)[0]["unread"] == 5
+
+
+def test_recipient():
+    assert unread.RECIPIENT[membership.EMPLOYER] == membership.EMPLOYEE
+    assert unread.RECIPIENT[membership.EMPLOYEE] == membership.EMPLOYER
+
+
+def test_unseen_filter():
+    project_id, user_id = ObjectId(), ObjectId()
+    message = {"_id": ObjectId(), "creation_datetime": datetime.utcnow()}
+    filter_ = unread.unseen_filter(project_id, user_id, message)
+    assert filter_["seen"] is False
+    assert filter_["sender._id"] == {"$ne": user_id}
+    # the message itself is included
+    assert {
+        "creation_datetime": message["creation_datetime"],
+        "_id": {"$lte": message["_id"]},
+    } in filter_["$or"]
@@ -0,0 +1,31 @@
+from ..oohoom import r_code
+from ..oohoom.constants import CODE_MAX_ATTEMPTS
+
+
+def test_take():
+    codes = r_code.LocalCodes()
+    codes.store("00989000000000", "12345")
+    assert codes.get("00989000000000") == b"12345"
+    assert not codes.take("00989000000000", "54321")
+    assert codes.take("00989000000000", "12345")
+    # only once
+    assert not codes.take("00989000000000", "12345")
+    assert codes.get("00989000000000") is None
+
+
+def test_attempts():
+    codes = r_code.LocalCodes()
+    codes.store("00989000000000", "12345")
+    for i in range(CODE_MAX_ATTEMPTS):
+        assert not codes.take("00989000000000", "00000")
+    assert not codes.take("00989000000000", "12345")
+    # a new code gets all its attempts
+    codes.store("00989000000000", "12345")
+    assert codes.take("00989000000000", "12345")
+
+
+def test_expiry():
+    codes = r_code.LocalCodes()
+    codes.store("00989000000000", "12345", ttl=-1)
+    assert codes.get("00989000000000") is None
+    assert not codes.take("00989000000000", "12345")
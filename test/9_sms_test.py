@@ -0,0 +1,119 @@
+import time
+
+from ..oohoom import sms
+from ..oohoom.constants import SMS_MAX_ATTEMPTS
+
+
+def test_send():
+    queue = sms.LocalQueue()
+    sent = []
+    worker = sms.Worker(queue, send=sent.append, batch=2)
+    jobs = [sms.new_job("0098900000000{}".format(i), "12345") for i in range(3)]
+    for job in jobs:
+        queue.enqueue(job)
+    assert queue.status(jobs[0]["id"])["state"] == sms.QUEUED
+    assert worker.run_once(timeout=0) == 2
+    assert worker.run_once(timeout=0) == 1
+    assert worker.run_once(timeout=0) == 0
+    assert len(sent) == 3
+    assert queue.status(jobs[2]["id"]) == {"state": sms.SENT, "attempts": "1"}
+
+
+def test_retry():
+    def fail(job):
+        raise ConnectionError("provider is down")
+
+    queue = sms.LocalQueue()
+    worker = sms.Worker(queue, send=fail)
+    job = sms.new_job("00989000000000", "12345")
+    queue.enqueue(job)
+    for attempt in range(1, SMS_MAX_ATTEMPTS + 1):
+        assert worker.run_once(timeout=0) == 1
+        status = queue.status(job["id"])
+        assert status["attempts"] == str(attempt)
+        # not due before its backoff
+        assert worker.run_once(timeout=0) == 0
+        queue.promote(time.time() + 3600, 1)
+    assert status["state"] == sms.FAILED
+    assert status["error"] == "provider is down"
+    assert worker.run_once(timeout=0) == 0
+
+
+class Redis(object):
+    """
+        the list commands of RedisQueue.
+    """
+
+    def __init__(self):
+        self.lists = {}
+
+    def register_script(self, script):
+        # nothing to retry
+        return lambda keys, args: 0
+
+    def _move(self, source, destination, src, dest):
+        items = self.lists.setdefault(source, [])
+        if not items:
+            return None
+        item = items.pop(0 if src == "LEFT" else -1)
+        target = self.lists.setdefault(destination, [])
+        target.insert(0 if dest == "LEFT" else len(target), item)
+        return item
+
+    def blmove(self, source, destination, timeout, src="LEFT", dest="RIGHT"):
+        return self._move(source, destination, src, dest)
+
+    def lmove(self, source, destination, src="LEFT", dest="RIGHT"):
+        return self._move(source, destination, src, dest)
+
+    def rpush(self, key, value):
+        self.lists.setdefault(key, []).append(value.encode("utf8"))
+
+    def lrem(self, key, count, value):
+        self.lists[key].remove(value.encode("utf8"))
+
+    def hset(self, key, mapping):
+        pass
+
+    def expire(self, key, ttl):
+        pass
+
+    def zadd(self, key, mapping):
+        pass
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+
+class Pipeline(object):
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((getattr(self.client, name), args, kwargs))
+
+        return call
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+def test_crash():
+    client = Redis()
+    queue = sms.RedisQueue(client, "a-worker")
+    jobs = [sms.new_job("0098900000000{}".format(i), "12345") for i in range(3)]
+    for job in jobs:
+        queue.enqueue(job)
+    # taken, then the worker dies before the send
+    assert queue.pop(2, 0) == jobs[:2]
+    assert len(client.lists[sms.QUEUE_KEY]) == 1
+    assert queue.recover() == 2
+    sent = []
+    worker = sms.Worker(queue, send=sent.append, batch=3)
+    assert worker.run_once(timeout=0) == 3
+    assert [job["id"] for job in sent] == [job["id"] for job in jobs]
+    # recorded, so done with
+    assert client.lists[queue.processing_key] == []
+    assert queue.recover() == 0